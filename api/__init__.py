@@ -10,8 +10,10 @@ def create_api_blueprint():
     bp = Blueprint('api', __name__, url_prefix='/api')
 
     # Register API route modules
-    from . import generate, settings
+    from . import generate, settings, compare, jobs
     generate.register_routes(bp)
     settings.register_routes(bp)
+    compare.register_routes(bp)
+    jobs.register_routes(bp)
 
     return bp
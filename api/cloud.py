@@ -0,0 +1,177 @@
+"""
+api/cloud.py
+MekanAI - Cloud Provider Dispatch
+
+Single entry point for the cloud `*Generator` classes so routes (generate,
+compare, upscale) don't each repeat the provider → client mapping.
+Generator modules are imported on first use.
+
+Usage:
+    from api.cloud import generate_cloud
+    provider = provider_model.get_by_key('gemini')
+    result = generate_cloud(provider, "imagen-4.0-fast-generate-001", prompt="modern living room")
+
+Calls are paced by the provider's shared token bucket (models.rate_limit)
+and 429/5xx answers are retried with jittered exponential backoff that
+honors Retry-After (cloud.retry in config).
+"""
+import random
+import time
+from email.utils import parsedate_to_datetime
+from config import config
+import models.rate_limit as rate_limit
+
+# Provider key → default API base URL
+DEFAULT_BASE_URLS = {
+    'gemini': 'https://generativelanguage.googleapis.com/v1beta',
+    'openai': 'https://api.openai.com/v1',
+    'stability': 'https://api.stability.ai/v2beta',
+    'grok': 'https://api.x.ai/v1',
+}
+
+# Approximate list price per image (USD) by api_model_id — used for compare
+# reports and metrics, not billing.
+COST_PER_IMAGE = {
+    'gemini-2.5-flash-image': 0.039,
+    'imagen-4.0-fast-generate-001': 0.02,
+    'imagen-4.0-generate-001': 0.04,
+    'imagen-4.0-ultra-generate-001': 0.06,
+    'dall-e-3': 0.04,
+    'dall-e-2': 0.02,
+    'stable-image-core': 0.03,
+    'stable-image-ultra': 0.08,
+    'sd3.5-large': 0.065,
+    'sd3.5-medium': 0.035,
+    'conservative-upscale': 0.40,
+    'grok-imagine-image-pro': 0.07,
+    'grok-imagine-image': 0.02,
+    'grok-2-image-1212': 0.07,
+}
+
+
+def estimate_cost(api_model_id):
+    """Estimated USD cost of one image (None if unknown)"""
+    return COST_PER_IMAGE.get(api_model_id)
+
+
+def create_cloud_generator(provider):
+    """Instantiate the generator client for a provider dict (from ai_providers)"""
+    key = provider['key']
+    base_url = provider.get('base_url') or DEFAULT_BASE_URLS.get(key, '')
+    api_key = provider['api_key']
+
+    if key == 'stability':
+        from api.stability_generator import StabilityGenerator
+        return StabilityGenerator(api_key=api_key, base_url=base_url)
+    if key == 'openai':
+        from api.openai_generator import OpenAIGenerator
+        return OpenAIGenerator(api_key=api_key, base_url=base_url)
+    if key == 'grok':
+        from api.grok_generator import GrokGenerator
+        return GrokGenerator(api_key=api_key, base_url=base_url)
+    # Gemini / Imagen (default cloud)
+    from api.gemini_generator import GeminiGenerator
+    return GeminiGenerator(api_key=api_key, base_url=base_url or DEFAULT_BASE_URLS['gemini'])
+
+
+# HTTP statuses worth retrying on the same provider
+RETRY_STATUS = {429, 502, 503, 504}
+
+
+def _parse_retry_after(value):
+    """Retry-After header → seconds (delta-seconds or HTTP date), None if absent"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def wait_for_slot(provider):
+    """Block until the provider's rate limit allows one more call.
+
+    Returns False if the wait would exceed cloud.retry.max_queue_wait.
+    Providers without rate_limit are never throttled.
+    """
+    limit = provider.get('rate_limit')
+    if not limit:
+        return True
+    deadline = time.time() + config.get('cloud.retry.max_queue_wait', 60)
+    while True:
+        wait = rate_limit.try_acquire(provider['key'], limit, provider.get('rate_burst'))
+        if not wait:
+            return True
+        if time.time() + wait > deadline:
+            return False
+        time.sleep(wait * random.uniform(1.0, 1.25))
+
+
+def generate_cloud(provider, api_model_id, prompt, negative_prompt="",
+                   width=None, height=None, seed=-1, source_image_base64=None, max_attempts=None):
+    """
+    Generate one image on a cloud provider (rate limited, with retries).
+
+    Only Stability uses negative prompt / seed / source image; the other
+    providers are text-to-image only. `max_attempts` overrides
+    cloud.retry.max_attempts — 1 when the caller fails over to another
+    provider itself (api/cloud_policy.py).
+
+    Returns:
+        dict with 'image_base64', 'elapsed' (+ 'seed') on success
+        dict with 'error' on failure (+ 'status_code' for HTTP errors)
+    """
+    key = provider['key']
+    attempts = max_attempts or config.get('cloud.retry.max_attempts', 4)
+    base_delay = config.get('cloud.retry.base_delay', 1.0)
+    max_delay = config.get('cloud.retry.max_delay', 30)
+
+    for attempt in range(attempts):
+        if not wait_for_slot(provider):
+            return {'error': f'{key} hız limiti doldu, biraz sonra tekrar deneyin', 'status_code': 429}
+
+        result = _generate_once(provider, api_model_id, prompt, negative_prompt,
+                                width, height, seed, source_image_base64)
+        status = result.get('status_code')
+        if 'error' not in result or status not in RETRY_STATUS:
+            return result
+
+        retry_after = _parse_retry_after(result.get('retry_after'))
+        if retry_after is not None and provider.get('rate_limit'):
+            rate_limit.block(key, retry_after)      # every worker backs off, not just this call
+        if attempt == attempts - 1 or (retry_after is not None and retry_after > max_delay):
+            return result       # let the caller fail over instead of stalling
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, base_delay)
+        else:
+            # Full jitter: spreads retries of concurrent workers apart
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+        print(f"[!] {key} HTTP {status}, retry {attempt + 1}/{attempts - 1} in {delay:.1f}s")
+        time.sleep(delay)
+    return result
+
+
+def _generate_once(provider, api_model_id, prompt, negative_prompt,
+                   width, height, seed, source_image_base64):
+    """Single generator call, no pacing or retries"""
+    gen = create_cloud_generator(provider)
+    if provider['key'] == 'stability':
+        return gen.generate(
+            prompt=prompt,
+            model_id=api_model_id,
+            negative_prompt=negative_prompt,
+            width=width,
+            height=height,
+            seed=seed,
+            source_image_base64=source_image_base64,
+        )
+    return gen.generate(
+        prompt=prompt,
+        model_id=api_model_id,
+        width=width,
+        height=height,
+    )
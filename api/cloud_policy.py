@@ -0,0 +1,204 @@
+"""
+api/cloud_policy.py
+MekanAI - Hedged Requests & Failover for Cloud Generation
+
+Wraps api.cloud.generate_cloud with a tail-latency policy:
+
+    1. Send the request to the primary model.
+    2. If it hasn't answered by its p95 latency (or `cloud.hedge_after`
+       while there is too little history), send the same request to the
+       next fallback from `cloud.fallbacks` — first success wins.
+    3. If a call fails with 429 / 5xx / a network error, fail over to the
+       next fallback immediately instead of returning the error. Calls that
+       still have a fallback after them make a single attempt; only the last
+       candidate retries on its own provider (cloud.retry).
+
+Losing calls can't be aborted mid-flight (requests is blocking); they are
+left to finish in the pool and their results are discarded. Every call —
+winner, failed primary, late hedge — is recorded in api/metrics.py under its
+own provider / model.
+
+Usage:
+    from api.cloud_policy import resolve_candidates, hedged_generate
+    candidates = resolve_candidates(model_info, provider)
+    result = hedged_generate(candidates, prompt="...", width=1024, height=1024)
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import config
+import models.ai_model as ai_model_model
+import models.ai_provider as provider_model
+from api.cloud import generate_cloud
+from api import metrics
+
+FAILOVER_STATUS = {429, 500, 502, 503, 504}
+
+
+# ============================================
+# LATENCY HISTORY
+# ============================================
+class LatencyTracker:
+    """Rolling window of successful call latencies per provider/model"""
+
+    def __init__(self, window=200):
+        self._samples = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self._window)).append(seconds)
+
+    def percentile(self, key, pct=95):
+        """Latency percentile in seconds (None if no samples)"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def count(self, key):
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+
+latency_tracker = LatencyTracker()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.get('cloud.max_workers', 32),
+                                           thread_name_prefix='cloud')
+        return _executor
+
+
+def _reset_after_fork():
+    global _executor
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ============================================
+# POLICY
+# ============================================
+def _key(candidate):
+    return f"{candidate['provider']['key']}/{candidate['api_model_id']}"
+
+
+def hedge_deadline(candidate):
+    """Seconds to wait on a call before hedging to the next candidate"""
+    key = _key(candidate)
+    default = config.get('cloud.hedge_after', 45)
+    if latency_tracker.count(key) < config.get('cloud.hedge_min_samples', 20):
+        return default
+    p95 = latency_tracker.percentile(key, 95)
+    return max(config.get('cloud.hedge_min', 5), p95)
+
+
+def should_failover(result):
+    """Retryable on another provider: rate limit, server error or network failure"""
+    status = result.get('status_code')
+    return status is None or status in FAILOVER_STATUS
+
+
+def resolve_candidates(model_info, provider, needs_source_image=False):
+    """Primary model + configured fallbacks that are usable right now.
+
+    Fallbacks come from cloud.fallbacks[<model key>]. A fallback is skipped if
+    its provider has no API key, or if the request has a source image and the
+    fallback can't use one (only Stability supports img2img here).
+    """
+    candidates = [{'model': model_info['key'], 'provider': provider,
+                   'api_model_id': model_info['api_model_id']}]
+    for key in config.get(f"cloud.fallbacks.{model_info['key']}", []) or []:
+        fallback = ai_model_model.get_by_key(key)
+        if not fallback or not fallback.get('api_model_id') or not fallback.get('provider'):
+            continue
+        fb_provider = provider_model.get_by_key(fallback['provider']['key'])
+        if not fb_provider or not fb_provider.get('api_key') or not fb_provider.get('enabled'):
+            continue
+        if needs_source_image and fb_provider['key'] != 'stability':
+            continue
+        candidates.append({'model': key, 'provider': fb_provider,
+                           'api_model_id': fallback['api_model_id']})
+    return candidates
+
+
+def _call(candidate, params, kind, max_attempts=None):
+    start = time.time()
+    result = generate_cloud(candidate['provider'], candidate['api_model_id'], max_attempts=max_attempts, **params)
+    if 'error' not in result:
+        latency_tracker.record(_key(candidate), time.time() - start)
+    metrics.record_result(candidate['provider']['key'], candidate['model'], kind, result)
+    return result
+
+
+def hedged_generate(candidates, kind='generate', **params):
+    """
+    Run generate_cloud over candidates with hedging + failover.
+
+    Each call's latency / error goes to the metrics of its own candidate
+    (`kind` is the metric label), so callers must not record the result again.
+
+    Returns the first successful result, annotated with 'served_by' (model key),
+    'served_by_provider' and 'attempts'; otherwise the last error.
+    """
+    executor = _get_executor()
+    pending = {}
+    next_index = 0
+    last_error = {'error': 'Cloud sağlayıcı bulunamadı'}
+
+    def launch():
+        nonlocal next_index
+        candidate = candidates[next_index]
+        next_index += 1
+        # A fallback is left → fail over on 429/5xx instead of retrying this provider
+        max_attempts = 1 if next_index < len(candidates) else None
+        pending[executor.submit(_call, candidate, params, kind, max_attempts)] = candidate
+        return candidate
+
+    current = launch()
+    while pending:
+        has_more = next_index < len(candidates)
+        timeout = hedge_deadline(current) if has_more else None
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        if not done:
+            # Slow primary → hedge with the next candidate, keep both running
+            print(f"[i] Hedging {_key(current)} after {timeout:.1f}s → {candidates[next_index]['model']}")
+            current = launch()
+            continue
+
+        for future in done:
+            candidate = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'error': f'Beklenmeyen hata: {str(e)}'}
+
+            if 'error' not in result:
+                for loser in pending:
+                    loser.cancel()
+                result['served_by'] = candidate['model']
+                result['served_by_provider'] = candidate['provider']['key']
+                result['attempts'] = next_index
+                return result
+
+            last_error = result
+            if should_failover(result) and next_index < len(candidates) and not pending:
+                print(f"[!] Failover {_key(candidate)}: {result['error']} → {candidates[next_index]['model']}")
+                current = launch()
+
+    return last_error
@@ -0,0 +1,134 @@
+"""
+api/coalesce.py
+MekanAI - Request Coalescing (single-flight)
+
+Double-clicks and several open tabs often send the same /api/generate-image
+payload. With a fixed seed the output is the same image, so only the first
+request renders:
+
+    leader    - first request for a parameter hash; renders, stores the
+                image in the blob store and publishes its content hash, seed
+                and saved-image reference to `flights` (models/flight.py)
+    follower  - identical request while the leader is queued / running (or
+                finished less than `coalesce.grace` s ago); waits and rebuilds
+                the leader's response from the blob without touching the backend
+
+A waiting follower is a job on the pseudo-backend `coalesce` (api/jobs.py),
+so DELETE /api/jobs/<job_id> cancels it (409) like any queued request.
+
+The hash covers every generation parameter except job_id, priority and
+project_id (a follower saves into its own project). Random-seed requests
+(seed < 0) are never coalesced — each click is meant to be a new variation.
+If the leader fails or is cancelled its flight is dropped and a waiting
+follower renders itself.
+
+Usage:
+    shared = coalesce.join(coalesce.flight_key(data, provider_key), job_id, project_id, priority)
+    if shared is None:
+        result = render(...)            # leader (or not coalescable)
+        coalesce.publish(response, content_hash)
+    ...
+    coalesce.release()                  # always, e.g. in a finally block
+"""
+import hashlib
+import json
+import threading
+import time
+from config import config
+import models.flight as flight_model
+import models.image_store as image_store
+from api import jobs
+from api import metrics
+
+KEY_IGNORED = ('job_id', 'priority', 'project_id')
+POLL_INTERVAL = 0.25
+
+# Response fields a follower takes over from the leader (the image comes from the blob)
+SHARED_FIELDS = ('seed', 'elapsed', 'served_by', 'saved_image', 'project_id')
+
+_current = threading.local()
+
+
+def flight_key(data, provider_key):
+    """Canonical parameter hash of a generate request (None if not coalescable)"""
+    if not config.get('coalesce.enabled', True):
+        return None
+    try:
+        if int(data.get('seed', -1)) < 0:
+            return None
+    except (TypeError, ValueError):
+        return None
+    canonical = {k: v for k, v in data.items() if k not in KEY_IGNORED}
+    canonical['provider_key'] = provider_key or 'local'
+    blob = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def join(key, job_id, project_id=None, priority=None):
+    """Lead or follow the flight for `key`.
+
+    Returns None when this request should render (it is the leader, or there
+    is no key), else the leader's response rebuilt from the blob store.
+    Raises jobs.JobCancelled if the request is cancelled while following.
+    """
+    if not key:
+        return None
+    grace = config.get('coalesce.grace', 10)
+    # No request outlives the worker timeout, so an older running flight is orphaned
+    stale_after = config.get('server.worker_timeout', 360)
+    deadline = time.time() + stale_after
+    while time.time() < deadline:
+        leader = flight_model.claim(key, job_id, grace, stale_after)
+        if leader is None:
+            _current.flight = (key, job_id)
+            metrics.cache('coalesce', False)
+            return None
+        with jobs.follow(job_id, project_id, priority) as job:
+            state = _wait(key, job, deadline)
+        if state == 'done':
+            result = flight_model.get_result(key)
+            image_base64 = image_store.get_base64(result['content_hash']) if result else None
+            if image_base64:
+                print(f"[*] Request {job_id} coalesced with job {leader}")
+                metrics.cache('coalesce', True)
+                return dict(result, image_base64=image_base64, coalesced_with=leader)
+        # Leader failed / was cancelled (or its blob is gone) → try to take over
+    return None
+
+
+def _wait(key, job, deadline):
+    """Poll the flight until it leaves 'running'; returns its state"""
+    state = None
+    while time.time() < deadline:
+        state, _ = flight_model.get_state(key)
+        if state != 'running':
+            break
+        if job.wait(POLL_INTERVAL):
+            raise jobs.JobCancelled(job.id)
+    return state
+
+
+def publish(response, content_hash=None):
+    """Leader: hand the finished image to waiting followers.
+
+    `content_hash` is the blob already stored for the project save; without
+    one the image is stored now so followers can read it from disk.
+    """
+    flight = getattr(_current, 'flight', None)
+    if not flight:
+        return
+    _current.flight = None
+    content_hash = content_hash or image_store.put_base64(response['image_base64'])
+    flight_model.publish(*flight, content_hash, {k: response.get(k) for k in SHARED_FIELDS})
+
+
+def release():
+    """End of request: an unpublished flight (error, cancel) is dropped"""
+    flight = getattr(_current, 'flight', None)
+    if not flight:
+        return
+    _current.flight = None
+    try:
+        flight_model.fail(*flight)
+    except Exception as e:
+        print(f"[!] Flight release failed: {e}")
@@ -11,6 +11,8 @@ Supports:
     - controlnet: ControlNet-guided generation (depth, canny, lineart, etc.)
     - upscale: Image upscaling with ESRGAN models
 
+Workflows come from JSON templates (api/comfyui_workflows.py, data/workflows/).
+
 Usage:
     from api.comfyui_generator import ComfyUIGenerator
 
@@ -27,6 +29,13 @@ import random
 from uuid import uuid4
 from pathlib import Path
 import models.ai_provider as provider_model
+import models.image_store as image_store
+from api import comfyui_workflows
+from api import jobs
+from api import metrics
+from api import timing
+
+CANCELLED = {"error": "İş iptal edildi", "cancelled": True}
 
 
 class ComfyUIGenerator:
@@ -79,6 +88,15 @@ class ComfyUIGenerator:
             'preprocessor': 'OneFormer-ADE20K-SemSegPreprocessor',
             'model_pattern': 'seg',
         },
+        'scribble': {
+            'preprocessor': 'ScribblePreprocessor',
+            'model_pattern': 'scribble',
+        },
+        # App-server only (api/preprocess.py) — no ComfyUI node
+        'floorplan_walls': {
+            'preprocessor': None,
+            'model_pattern': 'lineart',
+        },
     }
 
     def __init__(self):
@@ -97,7 +115,7 @@ class ComfyUIGenerator:
     def generate(self, prompt, negative_prompt="", width=512, height=512,
                  steps=20, cfg_scale=7.0, seed=-1, sampler="euler",
                  scheduler="normal", model="", source_image_path=None,
-                 denoising_strength=0.75):
+                 denoising_strength=0.75, workflow_name=None):
         """
         Generate image via ComfyUI workflow.
 
@@ -109,6 +127,8 @@ class ComfyUIGenerator:
             model: Checkpoint name or search pattern
             source_image_path: Path to source image for img2img
             denoising_strength: Denoise level for img2img (0-1)
+            workflow_name: Workflow template to use instead of the configured
+                           txt2img / img2img one (e.g. turbo_txt2img)
 
         Returns:
             dict with 'image_base64', 'seed', 'elapsed' on success
@@ -133,15 +153,17 @@ class ComfyUIGenerator:
                 if not uploaded:
                     return {"error": "Kaynak görsel ComfyUI'ye yüklenemedi"}
 
-                workflow = self._build_img2img_workflow(
+                workflow = self._build_workflow(
+                    'img2img', workflow_name,
                     prompt=prompt, negative_prompt=negative_prompt,
                     checkpoint=checkpoint, width=width, height=height,
                     steps=steps, cfg_scale=cfg_scale, seed=seed,
                     sampler=comfy_sampler, scheduler=comfy_scheduler,
-                    image_name=uploaded, denoise=denoising_strength,
+                    image=uploaded, denoise=denoising_strength,
                 )
             else:
-                workflow = self._build_txt2img_workflow(
+                workflow = self._build_workflow(
+                    'txt2img', workflow_name,
                     prompt=prompt, negative_prompt=negative_prompt,
                     checkpoint=checkpoint, width=width, height=height,
                     steps=steps, cfg_scale=cfg_scale, seed=seed,
@@ -151,120 +173,42 @@ class ComfyUIGenerator:
             # Queue workflow
             prompt_id = self._queue_prompt(workflow)
             if not prompt_id:
-                return {"error": "ComfyUI'ye workflow gönderilemedi"}
+                return self._not_queued("ComfyUI'ye workflow gönderilemedi")
 
             # Wait for result
             return self._wait_for_result(prompt_id, seed)
 
         except ConnectionError as e:
-            return {"error": str(e)}
+            return {"error": str(e), "unreachable": True}
+        except comfyui_workflows.InvalidWorkflow:
+            raise       # client error (400), see api/generate.py
         except Exception as e:
             return {"error": f"ComfyUI hatası: {str(e)}"}
 
     # ── Workflow Builders ────────────────────────────
 
-    def _build_txt2img_workflow(self, prompt, negative_prompt, checkpoint,
-                                 width, height, steps, cfg_scale, seed,
-                                 sampler, scheduler):
-        """Build standard txt2img workflow (CheckpointLoader → KSampler → VAEDecode → Save)"""
-        return {
-            "4": {
-                "class_type": "CheckpointLoaderSimple",
-                "inputs": {"ckpt_name": checkpoint}
-            },
-            "5": {
-                "class_type": "EmptyLatentImage",
-                "inputs": {"width": width, "height": height, "batch_size": 1}
-            },
-            "6": {
-                "class_type": "CLIPTextEncode",
-                "inputs": {"text": prompt, "clip": ["4", 1]}
-            },
-            "7": {
-                "class_type": "CLIPTextEncode",
-                "inputs": {"text": negative_prompt or "", "clip": ["4", 1]}
-            },
-            "3": {
-                "class_type": "KSampler",
-                "inputs": {
-                    "seed": seed,
-                    "steps": steps,
-                    "cfg": cfg_scale,
-                    "sampler_name": sampler,
-                    "scheduler": scheduler,
-                    "denoise": 1.0,
-                    "model": ["4", 0],
-                    "positive": ["6", 0],
-                    "negative": ["7", 0],
-                    "latent_image": ["5", 0]
-                }
-            },
-            "8": {
-                "class_type": "VAEDecode",
-                "inputs": {"samples": ["3", 0], "vae": ["4", 2]}
-            },
-            "9": {
-                "class_type": "SaveImage",
-                "inputs": {"filename_prefix": "MekanAI", "images": ["8", 0]}
-            }
-        }
+    def _build_workflow(self, kind, workflow_name=None, **params):
+        """Instantiate the compiled template for a job kind (see api/comfyui_workflows.py).
 
-    def _build_img2img_workflow(self, prompt, negative_prompt, checkpoint,
-                                 width, height, steps, cfg_scale, seed,
-                                 sampler, scheduler, image_name, denoise):
-        """Build img2img workflow (LoadImage → VAEEncode → KSampler with denoise)"""
-        return {
-            "4": {
-                "class_type": "CheckpointLoaderSimple",
-                "inputs": {"ckpt_name": checkpoint}
-            },
-            "10": {
-                "class_type": "LoadImage",
-                "inputs": {"image": image_name}
-            },
-            "11": {
-                "class_type": "VAEEncode",
-                "inputs": {"pixels": ["10", 0], "vae": ["4", 2]}
-            },
-            "6": {
-                "class_type": "CLIPTextEncode",
-                "inputs": {"text": prompt, "clip": ["4", 1]}
-            },
-            "7": {
-                "class_type": "CLIPTextEncode",
-                "inputs": {"text": negative_prompt or "", "clip": ["4", 1]}
-            },
-            "3": {
-                "class_type": "KSampler",
-                "inputs": {
-                    "seed": seed,
-                    "steps": steps,
-                    "cfg": cfg_scale,
-                    "sampler_name": sampler,
-                    "scheduler": scheduler,
-                    "denoise": denoise,
-                    "model": ["4", 0],
-                    "positive": ["6", 0],
-                    "negative": ["7", 0],
-                    "latent_image": ["11", 0]
-                }
-            },
-            "8": {
-                "class_type": "VAEDecode",
-                "inputs": {"samples": ["3", 0], "vae": ["4", 2]}
-            },
-            "9": {
-                "class_type": "SaveImage",
-                "inputs": {"filename_prefix": "MekanAI", "images": ["8", 0]}
-            }
-        }
+        Args:
+            kind: txt2img | img2img | controlnet | controlnet_preprocess | upscale
+            workflow_name: Template name overriding comfyui.workflows.<kind>
+            **params: Template parameters ({{name}} placeholders)
+        """
+        template = comfyui_workflows.for_kind(kind, workflow_name)
+        problems = template.validate(self.get_object_info())
+        if problems:
+            raise ValueError(f"Workflow '{template.name}' bu ComfyUI sunucusunda çalışmaz: "
+                             + '; '.join(problems[:3]))
+        return template.instantiate(**params)
 
     # ── ControlNet Generation ────────────────────────
 
     def generate_controlnet(self, prompt, negative_prompt="", width=512, height=512,
                             steps=20, cfg_scale=7.0, seed=-1, sampler="euler",
                             scheduler="normal", model="", source_image_path=None,
-                            controlnet_module="depth_midas", controlnet_weight=1.0):
+                            controlnet_module="depth_midas", controlnet_weight=1.0,
+                            preprocessed=False, workflow_name=None):
         """
         Generate image with ControlNet guidance via ComfyUI.
 
@@ -274,6 +218,9 @@ class ComfyUIGenerator:
             source_image_path: Path to source image (e.g., floor plan)
             controlnet_module: SD WebUI-style preprocessor name (depth_midas, canny, etc.)
             controlnet_weight: ControlNet strength (0-2)
+            preprocessed: source_image_path is already a control map
+                          (api/preprocess.py) — skip the preprocessor node
+            workflow_name: Workflow template to use instead of the configured one
         """
         comfy_sampler = self._map_sampler(sampler)
         comfy_scheduler = self._map_scheduler(scheduler)
@@ -298,7 +245,7 @@ class ComfyUIGenerator:
 
         # Check if preprocessor node is available
         preprocessor = cn_info['preprocessor']
-        has_preprocessor = self._check_node_exists(preprocessor)
+        has_preprocessor = bool(preprocessor) and not preprocessed and self._check_node_exists(preprocessor)
 
         try:
             # Upload source image
@@ -309,133 +256,31 @@ class ComfyUIGenerator:
             if not uploaded:
                 return {"error": "Kaynak görsel ComfyUI'ye yüklenemedi"}
 
-            workflow = self._build_controlnet_workflow(
+            # LoadImage → [Preprocessor →] ControlNetApplyAdvanced → KSampler
+            workflow = self._build_workflow(
+                'controlnet_preprocess' if has_preprocessor else 'controlnet', workflow_name,
                 prompt=prompt, negative_prompt=negative_prompt,
                 checkpoint=checkpoint, width=width, height=height,
                 steps=steps, cfg_scale=cfg_scale, seed=seed,
                 sampler=comfy_sampler, scheduler=comfy_scheduler,
-                image_name=uploaded, cn_model=cn_model,
+                image=uploaded, cn_model=cn_model,
                 preprocessor=preprocessor if has_preprocessor else None,
                 cn_weight=controlnet_weight,
             )
 
             prompt_id = self._queue_prompt(workflow)
             if not prompt_id:
-                return {"error": "ComfyUI'ye ControlNet workflow gönderilemedi"}
+                return self._not_queued("ComfyUI'ye ControlNet workflow gönderilemedi")
 
             return self._wait_for_result(prompt_id, seed)
 
         except ConnectionError as e:
-            return {"error": str(e)}
+            return {"error": str(e), "unreachable": True}
+        except comfyui_workflows.InvalidWorkflow:
+            raise       # client error (400), see api/generate.py
         except Exception as e:
             return {"error": f"ComfyUI ControlNet hatası: {str(e)}"}
 
-    def _build_controlnet_workflow(self, prompt, negative_prompt, checkpoint,
-                                    width, height, steps, cfg_scale, seed,
-                                    sampler, scheduler, image_name, cn_model,
-                                    preprocessor, cn_weight):
-        """Build ControlNet workflow.
-
-        If preprocessor is available:
-            LoadImage → Preprocessor → ControlNetApply → KSampler
-        If no preprocessor (raw image used directly):
-            LoadImage → ControlNetApply → KSampler
-        """
-        workflow = {
-            # Checkpoint
-            "4": {
-                "class_type": "CheckpointLoaderSimple",
-                "inputs": {"ckpt_name": checkpoint}
-            },
-            # Source image
-            "10": {
-                "class_type": "LoadImage",
-                "inputs": {"image": image_name}
-            },
-            # ControlNet model
-            "12": {
-                "class_type": "ControlNetLoader",
-                "inputs": {"control_net_name": cn_model}
-            },
-            # Positive prompt
-            "6": {
-                "class_type": "CLIPTextEncode",
-                "inputs": {"text": prompt, "clip": ["4", 1]}
-            },
-            # Negative prompt
-            "7": {
-                "class_type": "CLIPTextEncode",
-                "inputs": {"text": negative_prompt or "", "clip": ["4", 1]}
-            },
-            # Empty latent (txt2img with CN guidance)
-            "5": {
-                "class_type": "EmptyLatentImage",
-                "inputs": {"width": width, "height": height, "batch_size": 1}
-            },
-            # KSampler
-            "3": {
-                "class_type": "KSampler",
-                "inputs": {
-                    "seed": seed,
-                    "steps": steps,
-                    "cfg": cfg_scale,
-                    "sampler_name": sampler,
-                    "scheduler": scheduler,
-                    "denoise": 1.0,
-                    "model": ["4", 0],
-                    "positive": ["13", 0],  # ControlNet-applied positive
-                    "negative": ["14", 1],  # ControlNet-applied negative
-                    "latent_image": ["5", 0]
-                }
-            },
-            # VAEDecode + Save
-            "8": {
-                "class_type": "VAEDecode",
-                "inputs": {"samples": ["3", 0], "vae": ["4", 2]}
-            },
-            "9": {
-                "class_type": "SaveImage",
-                "inputs": {"filename_prefix": "MekanAI_cn", "images": ["8", 0]}
-            }
-        }
-
-        # Determine which image feeds into ControlNet (preprocessed or raw)
-        if preprocessor:
-            workflow["11"] = {
-                "class_type": preprocessor,
-                "inputs": {"image": ["10", 0]}
-            }
-            cn_image_ref = ["11", 0]
-        else:
-            cn_image_ref = ["10", 0]
-
-        # ControlNetApplyAdvanced → applies CN to both positive and negative conditioning
-        workflow["13"] = {
-            "class_type": "ControlNetApplyAdvanced",
-            "inputs": {
-                "positive": ["6", 0],
-                "negative": ["7", 0],
-                "control_net": ["12", 0],
-                "image": cn_image_ref,
-                "strength": cn_weight,
-                "start_percent": 0.0,
-                "end_percent": 1.0,
-            }
-        }
-        # Alias node 14 → output of 13 (negative is output index 1)
-        workflow["14"] = workflow["13"]  # same node, negative output referenced via index
-
-        # Actually, ControlNetApplyAdvanced outputs [positive, negative]
-        # KSampler positive = ["13", 0], negative = ["13", 1]
-        workflow["3"]["inputs"]["positive"] = ["13", 0]
-        workflow["3"]["inputs"]["negative"] = ["13", 1]
-
-        # Remove the dummy node 14
-        if "14" in workflow and workflow["14"] is workflow["13"]:
-            del workflow["14"]
-
-        return workflow
-
     def _resolve_controlnet_model(self, pattern, checkpoint=""):
         """Find matching ControlNet model on ComfyUI by pattern + checkpoint arch.
 
@@ -488,6 +333,8 @@ class ComfyUIGenerator:
             'canny': 'Canny Edge',
             'lineart': 'Lineart',
             'seg_ofade20k': 'Segmentation',
+            'scribble': 'Scribble',
+            'floorplan_walls': 'Duvarlar (Kat Planı)',
         }
 
         result = []
@@ -503,6 +350,9 @@ class ComfyUIGenerator:
 
     def _check_node_exists(self, node_class):
         """Check if a ComfyUI node class is available"""
+        object_info = self.get_object_info()
+        if object_info:
+            return node_class in object_info
         try:
             url = self._get_base_url()
             r = requests.get(f"{url}/object_info/{node_class}", timeout=5)
@@ -510,6 +360,22 @@ class ComfyUIGenerator:
         except Exception:
             return False
 
+    def get_object_info(self):
+        """All node definitions from ComfyUI (cached for comfyui.object_info_ttl)"""
+        try:
+            url = self._get_base_url()
+        except ConnectionError:
+            return {}
+
+        def fetch():
+            try:
+                r = requests.get(f"{url}/object_info", timeout=30)
+                r.raise_for_status()
+                return r.json()
+            except Exception:
+                return {}
+        return comfyui_workflows.object_info(url, fetch)
+
     def get_controlnet_models(self):
         """Get available ControlNet models from ComfyUI"""
         try:
@@ -525,7 +391,8 @@ class ComfyUIGenerator:
 
     # ── Upscale / Enhance ─────────────────────────────
 
-    def upscale(self, image_base64, upscale_model="", scale=2):
+    def upscale(self, image_base64=None, upscale_model="", scale=2,
+                image_path=None, to_store=False):
         """
         Upscale image via ComfyUI UpscaleModelLoader + ImageUpscaleWithModel.
 
@@ -534,9 +401,12 @@ class ComfyUIGenerator:
             upscale_model: Upscale model name (e.g. RealESRGAN_x4plus.pth)
             scale: Target scale factor (1-8). After model upscale, image is
                    resized to original_size * scale.
+            image_path: Source image file (instead of image_base64)
+            to_store: Stream the output into the blob store and return
+                      'content_hash' instead of 'image_base64'
 
         Returns:
-            dict with 'image_base64', 'elapsed' on success
+            dict with 'image_base64' (or 'content_hash'), 'elapsed' on success
             dict with 'error' on failure
         """
         # Resolve upscale model
@@ -546,72 +416,46 @@ class ComfyUIGenerator:
                 return {"error": "ComfyUI'de upscale modeli bulunamadı"}
             upscale_model = models[0]
 
-        # Get original image dimensions for scale calculation
-        from io import BytesIO
-        from PIL import Image
-        img_bytes = base64.b64decode(image_base64)
-        img = Image.open(BytesIO(img_bytes))
-        orig_w, orig_h = img.size
-        target_w = orig_w * scale
-        target_h = orig_h * scale
-
-        # Upload source image
-        import tempfile
-        tmp = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-        tmp.write(img_bytes)
-        tmp.close()
-
-        uploaded = self._upload_image(tmp.name)
-        if not uploaded:
-            return {"error": "Kaynak görsel ComfyUI'ye yüklenemedi"}
+        # Source file (write base64 input to a temp file once, removed when done)
+        tmp_path = None
+        if not image_path:
+            import tempfile
+            tmp = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
+            tmp.write(base64.b64decode(image_base64))
+            tmp.close()
+            image_path = tmp_path = tmp.name
 
         try:
-            workflow = self._build_upscale_workflow(uploaded, upscale_model, target_w, target_h)
+            # Original dimensions for scale calculation (header only, no decode)
+            from PIL import Image
+            with Image.open(image_path) as img:
+                orig_w, orig_h = img.size
+            target_w = orig_w * scale
+            target_h = orig_h * scale
+
+            uploaded = self._upload_image(image_path)
+            if not uploaded:
+                return {"error": "Kaynak görsel ComfyUI'ye yüklenemedi"}
+
+            workflow = self._build_workflow('upscale', image=uploaded, upscale_model=upscale_model,
+                                            width=target_w, height=target_h)
 
             prompt_id = self._queue_prompt(workflow)
             if not prompt_id:
-                return {"error": "ComfyUI'ye upscale workflow gönderilemedi"}
+                return self._not_queued("ComfyUI'ye upscale workflow gönderilemedi")
 
-            return self._wait_for_result(prompt_id, seed=0)
+            return self._wait_for_result(prompt_id, seed=0, to_store=to_store)
 
         except ConnectionError as e:
-            return {"error": str(e)}
+            return {"error": str(e), "unreachable": True}
         except Exception as e:
             return {"error": f"ComfyUI upscale hatası: {str(e)}"}
-
-    def _build_upscale_workflow(self, image_name, upscale_model, target_w, target_h):
-        """Build upscale workflow (LoadImage → UpscaleModel → ImageScale → Save)"""
-        return {
-            "1": {
-                "class_type": "LoadImage",
-                "inputs": {"image": image_name}
-            },
-            "2": {
-                "class_type": "UpscaleModelLoader",
-                "inputs": {"model_name": upscale_model}
-            },
-            "3": {
-                "class_type": "ImageUpscaleWithModel",
-                "inputs": {
-                    "upscale_model": ["2", 0],
-                    "image": ["1", 0]
-                }
-            },
-            "5": {
-                "class_type": "ImageScale",
-                "inputs": {
-                    "image": ["3", 0],
-                    "upscale_method": "lanczos",
-                    "width": target_w,
-                    "height": target_h,
-                    "crop": "disabled"
-                }
-            },
-            "4": {
-                "class_type": "SaveImage",
-                "inputs": {"filename_prefix": "MekanAI_upscale", "images": ["5", 0]}
-            }
-        }
+        finally:
+            if tmp_path:
+                try:
+                    Path(tmp_path).unlink(missing_ok=True)
+                except OSError:
+                    pass
 
     def get_upscale_models(self):
         """Get available upscale models from ComfyUI"""
@@ -628,12 +472,22 @@ class ComfyUIGenerator:
 
     # ── ComfyUI API ──────────────────────────────────
 
+    @staticmethod
+    def _not_queued(message):
+        """Result for a workflow _queue_prompt did not queue: cancelled job or error"""
+        job = jobs.current()
+        return dict(CANCELLED) if job and job.cancelled else {"error": message}
+
     def _queue_prompt(self, workflow):
-        """Queue a workflow on ComfyUI, returns prompt_id"""
+        """Queue a workflow on ComfyUI, returns prompt_id (None if the job was cancelled)"""
         try:
             url = self._get_base_url()
             payload = {"prompt": workflow, "client_id": self.client_id}
+            job = jobs.current()
+            if job and job.cancelled:
+                return None
             r = requests.post(f"{url}/prompt", json=payload, timeout=30)
+            metrics.record_transfer('comfyui', r)
 
             if r.status_code != 200:
                 try:
@@ -651,7 +505,10 @@ class ComfyUIGenerator:
                     print(f"[!] ComfyUI queue error: HTTP {r.status_code}")
                 return None
 
-            return r.json().get('prompt_id')
+            prompt_id = r.json().get('prompt_id')
+            if job and prompt_id:
+                job.set_handle(prompt_id)
+            return prompt_id
 
         except requests.exceptions.ConnectionError:
             raise ConnectionError("ComfyUI bağlantı hatası — sunucu çalışıyor mu?")
@@ -659,21 +516,26 @@ class ComfyUIGenerator:
             print(f"[!] ComfyUI queue error: {e}")
             return None
 
-    def _wait_for_result(self, prompt_id, seed):
+    def _wait_for_result(self, prompt_id, seed, to_store=False):
         """Poll ComfyUI history until generation completes"""
         url = self._get_base_url()
         start = time.time()
+        job = jobs.current()
+        pause = job.wait if job else time.sleep
 
         while time.time() - start < self.timeout:
+            if job and job.cancelled:
+                self.cancel(prompt_id)
+                return dict(CANCELLED)
             try:
                 r = requests.get(f"{url}/history/{prompt_id}", timeout=10)
                 if r.status_code != 200:
-                    time.sleep(1)
+                    pause(1)
                     continue
 
                 data = r.json()
                 if prompt_id not in data:
-                    time.sleep(1)
+                    pause(1)
                     continue
 
                 history = data[prompt_id]
@@ -692,8 +554,9 @@ class ComfyUIGenerator:
 
                 # Still processing
                 if not status.get('completed'):
-                    time.sleep(1)
+                    pause(1)
                     continue
+                self._record_execution(status, time.time() - start)
 
                 # Get output images from SaveImage node
                 outputs = history.get('outputs', {})
@@ -701,6 +564,19 @@ class ComfyUIGenerator:
                     images = output.get('images', [])
                     if images:
                         img_info = images[0]
+                        if to_store:
+                            content_hash = self._download_to_store(
+                                img_info['filename'],
+                                img_info.get('subfolder', ''),
+                                img_info.get('type', 'output')
+                            )
+                            if content_hash:
+                                return {
+                                    "content_hash": content_hash,
+                                    "seed": seed,
+                                    "elapsed": round(time.time() - start, 1),
+                                }
+                            continue
                         img_data = self._download_image(
                             img_info['filename'],
                             img_info.get('subfolder', ''),
@@ -717,22 +593,66 @@ class ComfyUIGenerator:
                 return {"error": "ComfyUI çıktı görseli bulunamadı"}
 
             except requests.exceptions.RequestException:
-                time.sleep(2)
+                pause(2)
 
         return {"error": "ComfyUI zaman aşımı — üretim çok uzun sürdü"}
 
+    @staticmethod
+    def _record_execution(status, waited):
+        """Split the wait into queue time and execution time (history timestamps, ms)"""
+        stamps = {}
+        for msg in status.get('messages', []):
+            if isinstance(msg, list) and len(msg) > 1 and isinstance(msg[1], dict):
+                stamps[msg[0]] = msg[1].get('timestamp')
+        if stamps.get('execution_start') and stamps.get('execution_success'):
+            sampling = min(waited, max(0.0, (stamps['execution_success'] - stamps['execution_start']) / 1000))
+            timing.add('sampling', sampling)
+            timing.add('backend_queue', waited - sampling)
+        else:
+            timing.add('sampling', waited)
+
+    def cancel(self, prompt_id):
+        """Remove a prompt from ComfyUI's queue, or interrupt it if it is executing"""
+        try:
+            url = self._get_base_url()
+            requests.post(f"{url}/queue", json={"delete": [prompt_id]}, timeout=5)
+            r = requests.get(f"{url}/queue", timeout=5)
+            running = [item[1] for item in r.json().get('queue_running', []) if len(item) > 1]
+            if prompt_id in running:
+                # prompt_id targets this prompt on newer ComfyUI; older ones interrupt the current one
+                requests.post(f"{url}/interrupt", json={"prompt_id": prompt_id}, timeout=5)
+            return True
+        except Exception:
+            return False
+
     def _download_image(self, filename, subfolder, type_):
         """Download generated image from ComfyUI output"""
         try:
             url = self._get_base_url()
             params = {"filename": filename, "subfolder": subfolder, "type": type_}
-            r = requests.get(f"{url}/view", params=params, timeout=30)
+            with timing.stage('download'):
+                r = requests.get(f"{url}/view", params=params, timeout=30)
+            metrics.record_transfer('comfyui', r)
             if r.status_code == 200:
                 return r.content
         except Exception:
             pass
         return None
 
+    def _download_to_store(self, filename, subfolder, type_):
+        """Stream an output image from ComfyUI into the blob store (returns hash)"""
+        try:
+            url = self._get_base_url()
+            params = {"filename": filename, "subfolder": subfolder, "type": type_}
+            with timing.stage('download'), \
+                    requests.get(f"{url}/view", params=params, timeout=30, stream=True) as r:
+                metrics.record_transfer('comfyui', r, streamed=True)
+                if r.status_code == 200:
+                    return image_store.put_response(r)
+        except Exception:
+            pass
+        return None
+
     def _upload_image(self, image_path):
         """Upload source image to ComfyUI input folder"""
         try:
@@ -740,10 +660,11 @@ class ComfyUIGenerator:
             path = Path(image_path)
             if not path.exists():
                 return None
-            with open(path, 'rb') as f:
+            with timing.stage('upload'), open(path, 'rb') as f:
                 files = {"image": (path.name, f, "image/png")}
                 data = {"overwrite": "true"}
                 r = requests.post(f"{url}/upload/image", files=files, data=data, timeout=30)
+            metrics.record_transfer('comfyui', r)
             if r.status_code == 200:
                 return r.json().get('name')
         except Exception:
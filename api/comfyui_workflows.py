@@ -0,0 +1,271 @@
+"""
+api/comfyui_workflows.py
+MekanAI - ComfyUI Workflow Template Registry
+
+Workflows are JSON templates in `comfyui.workflows_dir` (API format, as
+exported by ComfyUI's "Save (API Format)"). Any input value — or a node's
+class_type — written as "{{name}}" is a parameter:
+
+    {
+      "name": "turbo_txt2img",
+      "kind": "txt2img",
+      "description": "...",
+      "params": {"negative_prompt": ""},         # defaults
+      "workflow": { "3": {"class_type": "KSampler", "inputs": {"seed": "{{seed}}", ...}}, ... }
+    }
+
+A bare API-format export (no wrapper) is accepted too; its name is the file
+stem. Each template is compiled once into a binding plan (static inputs +
+parameter slots), validated against the server's cached /object_info, and
+instantiated per job with shallow copies only. `comfyui.workflows` maps job
+kinds (txt2img, img2img, controlnet, controlnet_preprocess, upscale) to
+template names, so e.g. an LCM/Turbo workflow can replace txt2img without
+code changes. A request may also pick a template by name (`workflow`), but
+only one whose "kind" matches the job (400 otherwise).
+
+Usage:
+    from api import comfyui_workflows
+    template = comfyui_workflows.get('txt2img')
+    workflow = template.instantiate(prompt="...", checkpoint="...", seed=1, ...)
+"""
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from config import config
+from api import metrics
+
+_PLACEHOLDER = re.compile(r'^\{\{\s*(\w+)\s*\}\}$')
+
+# Job kind → default template name (overridable via comfyui.workflows)
+DEFAULT_WORKFLOWS = {
+    'txt2img': 'txt2img',
+    'img2img': 'img2img',
+    'controlnet': 'controlnet',
+    'controlnet_preprocess': 'controlnet_preprocess',
+    'upscale': 'upscale',
+}
+
+
+def _param_name(value):
+    if isinstance(value, str):
+        match = _PLACEHOLDER.match(value)
+        if match:
+            return match.group(1)
+    return None
+
+
+# ============================================
+# TEMPLATE
+# ============================================
+class WorkflowTemplate:
+    """A compiled workflow: static node inputs + parameter binding plan"""
+
+    def __init__(self, name, workflow, kind=None, description="", defaults=None, path=None):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.defaults = defaults or {}
+        self.path = path
+        self._compile(workflow)
+
+    def _compile(self, workflow):
+        self.nodes = []         # (node_id, class_type or None, class_param, static_inputs, [(input, param)])
+        self.params = set()
+        for node_id, node in workflow.items():
+            if not isinstance(node, dict) or 'class_type' not in node:
+                raise ValueError(f"Workflow {self.name}: node {node_id} geçersiz")
+            class_param = _param_name(node['class_type'])
+            static, slots = {}, []
+            for input_name, value in node.get('inputs', {}).items():
+                param = _param_name(value)
+                if param:
+                    slots.append((input_name, param))
+                    self.params.add(param)
+                else:
+                    static[input_name] = value
+            if class_param:
+                self.params.add(class_param)
+            self.nodes.append((str(node_id), None if class_param else node['class_type'],
+                               class_param, static, slots))
+        self.required = self.params - set(self.defaults)
+        self._validated_against = None
+        self._problems = []
+
+    def instantiate(self, **params):
+        """Bind parameters → ComfyUI API workflow dict (static values are shared, not copied).
+
+        None means "not given" (e.g. JSON null): the template default applies.
+        """
+        values = {**self.defaults, **{k: v for k, v in params.items() if v is not None}}
+        missing = self.required - set(values)
+        if missing:
+            raise ValueError(f"Workflow {self.name}: eksik parametre(ler): {', '.join(sorted(missing))}")
+        workflow = {}
+        for node_id, class_type, class_param, static, slots in self.nodes:
+            inputs = dict(static)
+            for input_name, param in slots:
+                inputs[input_name] = values[param]
+            workflow[node_id] = {
+                "class_type": values[class_param] if class_param else class_type,
+                "inputs": inputs,
+            }
+        return workflow
+
+    def validate(self, object_info):
+        """Problems against the server's /object_info (cached per object_info snapshot)"""
+        if not object_info:
+            return []
+        if self._validated_against is object_info:
+            return self._problems
+        problems = []
+        for node_id, class_type, _, static, slots in self.nodes:
+            if class_type is None:
+                continue        # class bound per job
+            info = object_info.get(class_type)
+            if info is None:
+                problems.append(f"node {node_id}: {class_type} ComfyUI'de yok")
+                continue
+            given = set(static) | {input_name for input_name, _ in slots}
+            for input_name in info.get('input', {}).get('required', {}):
+                if input_name not in given:
+                    problems.append(f"node {node_id} ({class_type}): '{input_name}' girdisi eksik")
+        self._validated_against = object_info
+        self._problems = problems
+        return problems
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'description': self.description,
+            'params': sorted(self.params),
+            'required': sorted(self.required),
+            'nodes': len(self.nodes),
+        }
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            doc = json.load(f)
+        if 'workflow' in doc:
+            return cls(doc.get('name') or path.stem, doc['workflow'], kind=doc.get('kind'),
+                       description=doc.get('description', ''), defaults=doc.get('params'), path=path)
+        return cls(path.stem, doc, path=path)
+
+
+# ============================================
+# REGISTRY
+# ============================================
+_templates = {}             # name → (mtime, WorkflowTemplate)
+_object_info = {}           # base_url → (fetched_at, dict)
+_lock = threading.Lock()
+
+
+def _workflows_dir():
+    return Path(config.get('comfyui.workflows_dir', 'data/workflows'))
+
+
+def _scan():
+    """Compile new / changed template files (mtime-checked)"""
+    found = {}
+    for path in sorted(_workflows_dir().glob('*.json')):
+        mtime = path.stat().st_mtime
+        cached = next((entry for entry in _templates.values() if entry[1].path == path), None)
+        if cached and cached[0] == mtime:
+            found[cached[1].name] = cached
+            continue
+        try:
+            template = WorkflowTemplate.load(path)
+            found[template.name] = (mtime, template)
+        except Exception as e:
+            print(f"[!] Workflow template {path.name} skipped: {e}")
+    _templates.clear()
+    _templates.update(found)
+
+
+def _stale(entry):
+    try:
+        return entry[1].path.stat().st_mtime != entry[0]
+    except OSError:
+        return True
+
+
+def get(name):
+    """Compiled template by name (ValueError if unknown)"""
+    with _lock:
+        entry = _templates.get(name)
+        if entry is None or _stale(entry):
+            _scan()
+            entry = _templates.get(name)
+    if entry is None:
+        raise ValueError(f"Workflow şablonu bulunamadı: {name}")
+    return entry[1]
+
+
+# Job kind → the "kind" a template declares for it (ControlNet templates are
+# "controlnet" with or without their own preprocessor node)
+TEMPLATE_KINDS = {
+    'controlnet_preprocess': 'controlnet',
+}
+
+
+class InvalidWorkflow(ValueError):
+    """A client-chosen template is unknown or does not fit the requested job kind"""
+
+
+def choose(name, kind):
+    """Client-chosen template for a job kind (InvalidWorkflow if unknown or of another kind).
+
+    Templates without a "kind" (bare exports) can only be mapped in
+    comfyui.workflows, never picked per request.
+    """
+    try:
+        template = get(name)
+    except ValueError as e:
+        raise InvalidWorkflow(str(e)) from None
+    expected = TEMPLATE_KINDS.get(kind, kind)
+    if template.kind != expected:
+        raise InvalidWorkflow(f"Workflow şablonu '{name}' ({template.kind or 'türü belirtilmemiş'}) "
+                              f"bu istek için uygun değil, gereken: {expected}")
+    return template
+
+
+def for_kind(kind, override=None):
+    """Template for a job kind: explicit override > comfyui.workflows > default.
+
+    The override comes from the client and must declare this kind — e.g. a
+    txt2img template on the img2img path would silently drop the source image.
+    """
+    if override:
+        return choose(override, kind)
+    return get(config.get(f'comfyui.workflows.{kind}') or DEFAULT_WORKFLOWS[kind])
+
+
+def list_templates():
+    with _lock:
+        _scan()
+        return [entry[1].to_dict() for entry in _templates.values()]
+
+
+def object_info(base_url, fetch):
+    """Cached /object_info for a server; fetch() is called at most once per TTL"""
+    ttl = config.get('comfyui.object_info_ttl', 300)
+    with _lock:
+        cached = _object_info.get(base_url)
+        if cached and time.time() - cached[0] < ttl:
+            metrics.cache('object_info', True)
+            return cached[1]
+    metrics.cache('object_info', False)
+    data = fetch()
+    if data:
+        with _lock:
+            _object_info[base_url] = (time.time(), data)
+    return data
+
+
+def invalidate_object_info():
+    with _lock:
+        _object_info.clear()
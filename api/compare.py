@@ -0,0 +1,148 @@
+"""
+MekanAI Provider Compare API
+Same prompt → several cloud models in parallel, results streamed as they finish.
+
+POST /api/compare
+    {"prompt": "...", "models": ["gemini_flash_image", "dalle3", "stability_core"],
+     "style_id": 1, "width": 1024, "height": 768, "project_id": 3}
+
+Response: application/x-ndjson, one line per model in completion order, then
+a summary line. Wall time ≈ slowest provider instead of the sum.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import request, jsonify, Response, stream_with_context
+import models.ai_model as ai_model_model
+import models.ai_provider as provider_model
+import models.image as image_model
+import models.image_store as image_store
+from api.cloud import generate_cloud, estimate_cost
+from api.generate import merge_prompt_snippets
+
+MAX_COMPARE_MODELS = 8
+
+
+def _resolve_jobs(model_keys):
+    """Map model keys to runnable cloud jobs; returns (jobs, errors)"""
+    jobs, errors = [], []
+    providers = {}
+    for key in dict.fromkeys(model_keys):
+        model_info = ai_model_model.get_by_key(key)
+        if not model_info or not model_info.get('api_model_id') or not model_info.get('provider'):
+            errors.append({'model': key, 'status': 'error', 'message': 'Cloud modeli bulunamadı'})
+            continue
+        pkey = model_info['provider']['key']
+        if pkey in ('local', 'comfyui'):
+            errors.append({'model': key, 'status': 'error', 'message': 'Sadece cloud modelleri karşılaştırılabilir'})
+            continue
+        if pkey not in providers:
+            providers[pkey] = provider_model.get_by_key(pkey)
+        provider = providers[pkey]
+        if not provider or not provider.get('api_key'):
+            errors.append({'model': key, 'provider': pkey, 'status': 'error',
+                           'message': f'{pkey} API key ayarlanmamış'})
+            continue
+        jobs.append({'model': key, 'provider': provider, 'api_model_id': model_info['api_model_id']})
+    return jobs, errors
+
+
+def _run_job(job, params):
+    """Worker thread: call the provider and measure wall latency"""
+    start = time.time()
+    result = generate_cloud(job['provider'], job['api_model_id'], **params)
+    result['latency'] = round(time.time() - start, 2)
+    return result
+
+
+def register_routes(bp):
+    """Register provider compare route"""
+
+    @bp.route('/compare', methods=['POST'])
+    def compare_providers():
+        data = request.json or {}
+        prompt = data.get('prompt', '').strip()
+        model_keys = data.get('models') or []
+        if not prompt:
+            return jsonify({'status': 'error', 'message': 'Prompt gerekli'}), 400
+        if not model_keys or len(model_keys) > MAX_COMPARE_MODELS:
+            return jsonify({'status': 'error',
+                            'message': f'1-{MAX_COMPARE_MODELS} model seçilmeli'}), 400
+
+        prompt, negative_prompt, style_name = merge_prompt_snippets(
+            prompt, data.get('negative_prompt', ''),
+            data.get('style_id'), data.get('perspective_id'), data.get('lighting_id'))
+        params = {
+            'prompt': prompt,
+            'negative_prompt': negative_prompt,
+            'width': data.get('width', 1024),
+            'height': data.get('height', 1024),
+            'seed': data.get('seed', -1),
+        }
+        project_id = data.get('project_id')
+        jobs, errors = _resolve_jobs(model_keys)
+
+        def stream():
+            started = time.time()
+            for err in errors:
+                yield json.dumps(err, ensure_ascii=False) + '\n'
+
+            sum_latency = 0.0
+            total_cost = 0.0
+            executor = ThreadPoolExecutor(max_workers=max(len(jobs), 1))
+            try:
+                futures = {executor.submit(_run_job, job, params): job for job in jobs}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    pkey = job['provider']['key']
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'error': f'Beklenmeyen hata: {str(e)}', 'latency': None}
+
+                    line = {
+                        'model': job['model'],
+                        'provider': pkey,
+                        'api_model_id': job['api_model_id'],
+                        'latency': result.get('latency'),
+                    }
+                    sum_latency += result.get('latency') or 0
+                    if 'error' in result:
+                        line.update(status='error', message=result['error'])
+                    else:
+                        cost = estimate_cost(job['api_model_id'])
+                        total_cost += cost or 0
+                        line.update(status='success', image_base64=result['image_base64'],
+                                    seed=result.get('seed'), cost_usd=cost)
+                        if project_id:
+                            content_hash = image_store.put_base64(result['image_base64'])
+                            line['saved_image'] = image_model.add_to_project(
+                                project_id, content_hash, f"compare_{job['model']}", '.png',
+                                settings={
+                                    'prompt': prompt,
+                                    'negative_prompt': negative_prompt,
+                                    'model': job['model'],
+                                    'provider': pkey,
+                                    'width': params['width'],
+                                    'height': params['height'],
+                                    'style_name': style_name,
+                                    'source': 'compare',
+                                    'latency': line['latency'],
+                                    'cost_usd': cost,
+                                },
+                            )
+                    print(f"[i] compare {pkey}/{job['api_model_id']}: {line['status']} "
+                          f"in {line['latency']}s")
+                    yield json.dumps(line, ensure_ascii=False) + '\n'
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+            yield json.dumps({
+                'status': 'done',
+                'count': len(jobs),
+                'wall_time': round(time.time() - started, 2),
+                'sum_latency': round(sum_latency, 2),
+                'total_cost_usd': round(total_cost, 4),
+            }) + '\n'
+
+        return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
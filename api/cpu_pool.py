@@ -0,0 +1,60 @@
+"""
+api/cpu_pool.py
+MekanAI - Shared CPU Process Pool
+
+One process pool per server worker for CPU-bound image work (CPU upscaler,
+ControlNet preprocessors), sized by `cpu.workers`.
+
+Workers never build the Flask app. They are forked from a forkserver that only
+imports the task modules (spawned on Windows), and multiprocessing's re-import
+of the main module in each worker is a no-op: app.py and wsgi.py skip
+create_app() when imported as `__mp_main__`.
+
+Usage:
+    from api.cpu_pool import get_pool
+    future = get_pool().submit(fn, *args)
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from config import config
+
+# Modules whose functions are submitted to the pool; imported once by the forkserver
+TASK_MODULES = ['api.cpu_upscaler', 'api.preprocess']
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_count():
+    return config.get('cpu.workers') or min(4, os.cpu_count() or 1)
+
+
+def _context():
+    """forkserver (fresh single-threaded parent with the task modules loaded), else spawn.
+
+    Plain fork is unsafe: forking a threaded server process can deadlock the children.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(TASK_MODULES)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=worker_count(), mp_context=_context())
+        return _pool
+
+
+def _reset_after_fork():
+    global _pool
+    _pool = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
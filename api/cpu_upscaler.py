@@ -0,0 +1,108 @@
+"""
+api/cpu_upscaler.py
+MekanAI - Built-in CPU Upscaler
+
+GPU-free upscale for quick previews and as a fallback when SD WebUI /
+ComfyUI are unreachable: Lanczos resampling + unsharp-mask detail
+enhancement (OpenCV, Pillow fallback).
+
+Large images are cut into horizontal strips with a few source rows of
+margin and processed in a process pool; margins are cropped after the
+resize, so the result is identical to a full-frame pass.
+
+Usage:
+    from api.cpu_upscaler import CPUUpscaler
+    result = CPUUpscaler().upscale(image_base64="...", scale=2)
+"""
+import base64
+import io
+import time
+import numpy as np
+from PIL import Image
+from api.cpu_pool import get_pool, worker_count
+
+STRIP_MARGIN = 8            # source rows; covers Lanczos4 + blur support
+INLINE_MAX_PIXELS = 1024 * 1024
+
+
+def _process_strip(pixels, pad_top, pad_bottom, scale, sharpen):
+    """Worker: upscale + sharpen one strip, then drop its margins"""
+    height, width = pixels.shape[:2]
+    try:
+        import cv2
+        out = cv2.resize(pixels, (width * scale, height * scale), interpolation=cv2.INTER_LANCZOS4)
+        if sharpen > 0:
+            blur = cv2.GaussianBlur(out, (0, 0), sigmaX=0.8 * scale)
+            out = cv2.addWeighted(out, 1 + sharpen, blur, -sharpen, 0)
+    except ImportError:
+        from PIL import ImageFilter
+        image = Image.fromarray(pixels).resize((width * scale, height * scale), Image.LANCZOS)
+        if sharpen > 0:
+            image = image.filter(ImageFilter.UnsharpMask(radius=0.8 * scale, percent=int(sharpen * 100), threshold=0))
+        out = np.asarray(image)
+    return out[pad_top * scale:out.shape[0] - pad_bottom * scale]
+
+
+class CPUUpscaler:
+    """Lanczos + unsharp-mask upscaler running in a local process pool"""
+
+    def upscale(self, image_base64=None, scale=2, image_path=None,
+                sharpen=0.5, to_store=False):
+        """
+        Upscale an image on the CPU.
+
+        Args:
+            image_base64: Base64-encoded source image
+            scale: Integer scale factor (1-8)
+            image_path: Source image file (instead of image_base64)
+            sharpen: Unsharp-mask amount (0 = plain Lanczos)
+            to_store: Encode the result into the blob store and return
+                      'content_hash' instead of 'image_base64'
+
+        Returns:
+            dict with 'image_base64' (or 'content_hash'), 'elapsed' on success
+            dict with 'error' on failure
+        """
+        try:
+            start = time.time()
+            scale = max(1, min(int(scale), 8))
+            source = Image.open(image_path or io.BytesIO(base64.b64decode(image_base64)))
+            mode = 'RGBA' if source.mode in ('RGBA', 'LA', 'P') else 'RGB'
+            pixels = np.asarray(source.convert(mode))
+
+            image = Image.fromarray(self._upscale_array(pixels, scale, float(sharpen)), mode)
+            result = {"width": image.width, "height": image.height}
+            if to_store:
+                import models.image_store as image_store
+                result["content_hash"] = image_store.put_image(image)
+            else:
+                buf = io.BytesIO()
+                image.save(buf, format='PNG')
+                result["image_base64"] = base64.b64encode(buf.getvalue()).decode('utf-8')
+            result["elapsed"] = round(time.time() - start, 1)
+            return result
+        except Exception as e:
+            return {"error": f"CPU upscale hatası: {str(e)}"}
+
+    def _upscale_array(self, pixels, scale, sharpen):
+        height, width = pixels.shape[:2]
+        if height * width <= INLINE_MAX_PIXELS:
+            return _process_strip(pixels, 0, 0, scale, sharpen)
+
+        # Strip height: split the rows evenly over the pool, at least 64 rows each
+        strip = max(64, -(-height // (worker_count() * 2)))
+        futures = []
+        for top in range(0, height, strip):
+            bottom = min(top + strip, height)
+            pad_top = min(STRIP_MARGIN, top)
+            pad_bottom = min(STRIP_MARGIN, height - bottom)
+            chunk = pixels[top - pad_top:bottom + pad_bottom]
+            futures.append(get_pool().submit(_process_strip, chunk, pad_top, pad_bottom, scale, sharpen))
+
+        out = np.empty((height * scale, width * scale) + pixels.shape[2:], dtype=np.uint8)
+        row = 0
+        for future in futures:
+            part = future.result()
+            out[row:row + part.shape[0]] = part
+            row += part.shape[0]
+        return out
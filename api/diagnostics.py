@@ -0,0 +1,36 @@
+"""
+api/diagnostics.py
+MekanAI - Request Diagnostics Output
+
+Findings about individual requests — slow SQL, statement floods, N+1
+repeats (api/sql_log.py), stored profiles (api/profiling.py) — are printed
+through here instead of bare print, so `system.log_level` can turn them off:
+
+    debug / info    warnings and notes
+    warning         warnings only
+    error / off     nothing
+
+Usage:
+    from api import diagnostics
+    diagnostics.warn(f"Slow SQL {ms:.1f} ms at {site}")     # [!] ...
+    diagnostics.note(f"Profiled {path} → {profile_id}")     # [i] ...
+"""
+from config import config
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'off': 100}
+
+
+def enabled(level):
+    """True if messages of `level` are printed under system.log_level"""
+    threshold = LEVELS.get(str(config.get('system.log_level', 'info')).lower(), LEVELS['info'])
+    return LEVELS[level] >= threshold
+
+
+def warn(message):
+    if enabled('warning'):
+        print(f"[!] {message}")
+
+
+def note(message):
+    if enabled('info'):
+        print(f"[i] {message}")
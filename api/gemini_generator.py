@@ -17,6 +17,7 @@ Usage:
 import requests
 import base64
 import time
+from api import metrics
 
 
 class GeminiGenerator:
@@ -75,6 +76,7 @@ class GeminiGenerator:
                 headers={"x-goog-api-key": self.api_key},
                 timeout=self.timeout
             )
+            metrics.record_transfer('gemini', r)
             r.raise_for_status()
             elapsed = round(time.time() - start, 1)
 
@@ -96,7 +98,8 @@ class GeminiGenerator:
             return {"error": "Gemini yanıtında görsel bulunamadı"}
 
         except requests.exceptions.HTTPError as e:
-            return {"error": self._parse_error(e)}
+            return {"error": self._parse_error(e), "status_code": e.response.status_code,
+                    "retry_after": e.response.headers.get("Retry-After")}
         except requests.exceptions.ConnectionError:
             return {"error": "Gemini API bağlantı hatası"}
         except requests.exceptions.Timeout:
@@ -124,6 +127,7 @@ class GeminiGenerator:
                 headers={"x-goog-api-key": self.api_key},
                 timeout=self.timeout
             )
+            metrics.record_transfer('gemini', r)
             r.raise_for_status()
             elapsed = round(time.time() - start, 1)
 
@@ -142,7 +146,8 @@ class GeminiGenerator:
             }
 
         except requests.exceptions.HTTPError as e:
-            return {"error": self._parse_error(e)}
+            return {"error": self._parse_error(e), "status_code": e.response.status_code,
+                    "retry_after": e.response.headers.get("Retry-After")}
         except requests.exceptions.ConnectionError:
             return {"error": "Imagen API bağlantı hatası"}
         except requests.exceptions.Timeout:
@@ -3,27 +3,180 @@ MekanAI Image Generation API
 SD WebUI Forge + ControlNet + Cloud API (Gemini/Stability/OpenAI) integration
 """
 from flask import request, jsonify, current_app
-from api.sd_generator import AIGenerator
-from api.gemini_generator import GeminiGenerator
-from api.stability_generator import StabilityGenerator
-from api.openai_generator import OpenAIGenerator
-from api.grok_generator import GrokGenerator
-from api.comfyui_generator import ComfyUIGenerator
 import models.image as image_model
+import models.image_store as image_store
 import models.project as project_model
 import models.ai_model as ai_model_model
 import models.ai_provider as provider_model
 import models.style as style_model
 import models.perspective as perspective_model
 import models.lighting as lighting_model
+import os
 import time
+import base64
+from uuid import uuid4
+from api.cloud import create_cloud_generator, wait_for_slot
+from api.cloud_policy import resolve_candidates, hedged_generate
+from api import health
+from api import jobs
+from api import coalesce
+from api import comfyui_workflows
+from api import metrics
+from api import timing
+from config import config as app_config
+
+# Generator modules (and their HTTP/Pillow deps) are imported on first use
+# so app startup doesn't pay for providers that are never called.
+_generator = None
+
+
+def get_generator():
+    """Shared SD WebUI client, created on first request"""
+    global _generator
+    if _generator is None:
+        from api.sd_generator import AIGenerator
+        _generator = AIGenerator()
+    return _generator
+
+
+def _reset_generator():
+    """Forked workers build their own client on first request"""
+    global _generator
+    _generator = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_generator)
+
+
+def merge_prompt_snippets(prompt, negative_prompt, style_id=None, perspective_id=None, lighting_id=None):
+    """Append style / perspective / lighting snippets to the prompts.
+
+    Returns:
+        (prompt, negative_prompt, style_name)
+    """
+    style_name = None
+    lookups = [
+        (style_model, style_id),
+        (perspective_model, perspective_id),
+        (lighting_model, lighting_id),
+    ]
+    for model, item_id in lookups:
+        if not item_id:
+            continue
+        item = model.get_by_id(item_id)
+        if not item:
+            continue
+        if model is style_model:
+            style_name = item['name']
+        if item.get('prompt_snippet'):
+            prompt = f"{prompt}, {item['prompt_snippet']}"
+        if item.get('negative_snippet'):
+            negative_prompt = f"{negative_prompt}, {item['negative_snippet']}" if negative_prompt else item['negative_snippet']
+    return prompt, negative_prompt, style_name
+
+
+def source_image_path(image_id):
+    """Resolve an images row to its file path (None if missing)"""
+    source = image_model.get_by_id(image_id)
+    if not source:
+        return None
+    folder = project_model.get_project_path(source['project_id'])
+    if not folder:
+        return None
+    src = folder / source['filename']
+    return src if src.exists() else None
+
+
+def image_size(image_base64, source_path):
+    """(width, height) of an upload or stored image, from its header only"""
+    from PIL import Image
+    from io import BytesIO
+    with Image.open(source_path if source_path else BytesIO(base64.b64decode(image_base64))) as image:
+        return image.size
+
+
+def load_source(data, source_image_id):
+    """Source image for img2img / ControlNet: uploaded base64 (temp file) or a project image.
+
+    Returns:
+        file path (str) or None
+    """
+    source_image_base64 = data.get('source_image_base64')
+    if source_image_base64:
+        import tempfile
+        tmp = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
+        tmp.write(base64.b64decode(source_image_base64))
+        tmp.close()
+        return tmp.name
+    if source_image_id:
+        src = source_image_path(source_image_id)
+        if src:
+            return str(src)
+    return None
+
+
+def control_image(source_path, controlnet_module):
+    """Precompute the ControlNet map on the app server when possible.
+
+    Returns:
+        (path, controlnet_module, preprocessed) — unchanged input if the
+        module is left to the backend or local preprocessing failed
+    """
+    from api import preprocess
+    if not source_path or not preprocess.is_local(controlnet_module):
+        return source_path, controlnet_module, False
+    try:
+        with timing.stage('preprocess'):
+            path = preprocess.run(controlnet_module, source_path)
+        return path, preprocess.CONTROL_TASK[controlnet_module], True
+    except Exception as e:
+        print(f"[!] Local preprocess {controlnet_module} failed, backend will preprocess: {e}")
+        return source_path, controlnet_module, False
+
+
+PREVIEW_BACKENDS = ('local', 'comfyui')
+
+
+def preview_request(data, model_info):
+    """Turn a generate request into a fast draft (SD WebUI / ComfyUI only).
+
+    Draft = the `preview.model` checkpoint (or the requested one, if it is
+    itself distilled) at its own few-step defaults, else the requested
+    checkpoint with steps capped at `preview.steps`; size scaled by
+    `preview.scale`. Seed, prompt and ControlNet inputs stay the same.
+
+    Returns:
+        (draft request, True) or (data, False) if the backend has no preview
+    """
+    provider_key = data.get('provider_key') or ((model_info or {}).get('provider') or {}).get('key') or 'local'
+    if provider_key not in PREVIEW_BACKENDS:
+        return data, False
+
+    draft = dict(data, priority='interactive')
+    preview_key = app_config.get('preview.model', '')
+    preview_model = ai_model_model.get_by_key(preview_key) if preview_key else None
+    if (preview_model and 'preview' in preview_model['capabilities']
+            and ((preview_model.get('provider') or {}).get('key') or 'local') == provider_key):
+        draft.update(model=preview_model['key'],
+                     steps=preview_model['default_steps'] or draft.get('steps', 30),
+                     cfg_scale=preview_model['default_cfg_scale'] or draft.get('cfg_scale', 7.0),
+                     sampler=preview_model['default_sampler'] or draft.get('sampler', 'DPM++ 2M Karras'))
+    elif model_info and 'preview' in model_info['capabilities'] and model_info.get('default_steps'):
+        draft['steps'] = min(int(data.get('steps', 30)), model_info['default_steps'])
+    else:
+        draft['steps'] = min(int(data.get('steps', 30)), app_config.get('preview.steps', 10))
+
+    scale = app_config.get('preview.scale', 1.0)
+    if scale < 1:
+        for dim, default in (('width', 768), ('height', 512)):
+            draft[dim] = max(256, int(int(data.get(dim, default)) * scale) // 64 * 64)
+    return draft, True
 
 
 def register_routes(bp):
     """Register image generation API routes"""
 
-    generator = AIGenerator()
-
     @bp.route('/generate-image', methods=['POST'])
     def generate_image():
         """
@@ -32,11 +185,31 @@ def register_routes(bp):
         If no source image → plain txt2img
         """
         try:
-            return _do_generate()
+            with timing.record():
+                return _do_generate()
+        except jobs.JobCancelled as e:
+            metrics.error('generate', 'cancelled')
+            return jobs.cancelled_response(str(e))
+        except jobs.QueueTimeout as e:
+            metrics.error('generate', 'queue_timeout')
+            return jobs.queue_timeout_response(str(e))
+        except jobs.QueueFull as e:
+            metrics.error('generate', 'queue_full')
+            return jobs.queue_full_response(str(e))
+        except jobs.DuplicateJob as e:
+            metrics.error('generate', 'duplicate_job')
+            return jobs.duplicate_job_response(str(e))
+        except comfyui_workflows.InvalidWorkflow as e:
+            metrics.error('generate', 'invalid_workflow')
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         except Exception as e:
             import traceback
             traceback.print_exc()
+            metrics.error('generate', type(e).__name__)
             return jsonify({'status': 'error', 'message': f'Sunucu hatası: {str(e)}'}), 500
+        finally:
+            coalesce.release()
+            health.release()
 
     def _do_generate():
         data = request.json
@@ -44,6 +217,16 @@ def register_routes(bp):
         if not prompt:
             return jsonify({'status': 'error', 'message': 'Prompt gerekli'}), 400
 
+        # Preview: fast draft now, full render only if the user accepts it
+        full_request = None
+        if data.get('preview'):
+            full_request = {k: v for k, v in data.items() if k not in ('preview', 'job_id')}
+            with timing.stage('db_lookup'):
+                requested = ai_model_model.get_by_key(data['model']) if data.get('model') else None
+                data, is_preview = preview_request(data, requested)
+            if not is_preview:
+                full_request = None
+
         negative_prompt = data.get('negative_prompt', '')
         model = data.get('model', '')
         sampler = data.get('sampler', 'DPM++ 2M Karras')
@@ -59,66 +242,41 @@ def register_routes(bp):
         source_image_id = data.get('source_image_id')
         controlnet_module = data.get('controlnet_module', 'depth_midas')
         controlnet_weight = data.get('controlnet_weight', 1.0)
+        job_id = str(data.get('job_id') or uuid4().hex)[:64]
 
-        # Merge style snippets into prompt
-        style_name = None
-        if style_id:
-            style = style_model.get_by_id(style_id)
-            if style:
-                style_name = style['name']
-                if style.get('prompt_snippet'):
-                    prompt = f"{prompt}, {style['prompt_snippet']}"
-                if style.get('negative_snippet'):
-                    negative_prompt = f"{negative_prompt}, {style['negative_snippet']}" if negative_prompt else style['negative_snippet']
-
-        # Merge perspective snippets into prompt
-        if perspective_id:
-            perspective = perspective_model.get_by_id(perspective_id)
-            if perspective:
-                if perspective.get('prompt_snippet'):
-                    prompt = f"{prompt}, {perspective['prompt_snippet']}"
-                if perspective.get('negative_snippet'):
-                    negative_prompt = f"{negative_prompt}, {perspective['negative_snippet']}" if negative_prompt else perspective['negative_snippet']
-
-        # Merge lighting snippets into prompt
-        if lighting_id:
-            lighting = lighting_model.get_by_id(lighting_id)
-            if lighting:
-                if lighting.get('prompt_snippet'):
-                    prompt = f"{prompt}, {lighting['prompt_snippet']}"
-                if lighting.get('negative_snippet'):
-                    negative_prompt = f"{negative_prompt}, {lighting['negative_snippet']}" if negative_prompt else lighting['negative_snippet']
+        with timing.stage('prompt'):
+            prompt, negative_prompt, style_name = merge_prompt_snippets(
+                prompt, negative_prompt, style_id, perspective_id, lighting_id)
 
         source_path = None
 
         # Detect provider: explicit provider_key > model-based detection
-        model_info = ai_model_model.get_by_key(model) if model else None
+        with timing.stage('db_lookup'):
+            model_info = ai_model_model.get_by_key(model) if model else None
         provider_key = data.get('provider_key') or None
         if not provider_key and model_info and model_info.get('provider'):
             provider_key = model_info['provider'].get('key')
 
+        # Identical fixed-seed request already in flight → share its result
+        with timing.stage('coalesce'):
+            shared = coalesce.join(coalesce.flight_key(data, provider_key), job_id, project_id,
+                                   data.get('priority'))
+
+        cloud = False
+        if shared is not None:
+            result = shared
+
         # ── ComfyUI (local, workflow-based) ──
-        if provider_key == 'comfyui':
+        elif provider_key == 'comfyui':
+            if not health.allow('comfyui'):
+                return jsonify({'status': 'error', 'message': health.unavailable_message('comfyui')}), 503
+            from api.comfyui_generator import ComfyUIGenerator
             comfyui_gen = ComfyUIGenerator()
             checkpoint_hint = model_info.get('api_model_id', model) if model_info else model
 
             # Source image for img2img / ControlNet
-            source_path = None
-            source_image_base64 = data.get('source_image_base64')
-            if source_image_base64:
-                import tempfile, base64
-                tmp = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-                tmp.write(base64.b64decode(source_image_base64))
-                tmp.close()
-                source_path = tmp.name
-            elif source_image_id:
-                source = image_model.get_by_id(source_image_id)
-                if source:
-                    folder = project_model.get_project_path(source['project_id'])
-                    if folder:
-                        src = folder / source['filename']
-                        if src.exists():
-                            source_path = str(src)
+            with timing.stage('source'):
+                source_path = load_source(data, source_image_id)
 
             # Parse sampler and scheduler
             sampler_name = sampler
@@ -129,135 +287,99 @@ def register_routes(bp):
                     scheduler = sched
                     break
 
+            # A client-chosen workflow must match the operation (400 before taking a slot)
+            if data.get('workflow'):
+                comfyui_workflows.choose(data['workflow'], 'controlnet' if controlnet_module and source_path
+                                         else 'img2img' if source_path else 'txt2img')
+
             # ControlNet mode: when controlnet_module is specified and source image exists
             if controlnet_module and source_path:
-                result = comfyui_gen.generate_controlnet(
-                    prompt=prompt,
-                    negative_prompt=negative_prompt,
-                    width=width,
-                    height=height,
-                    steps=steps,
-                    cfg_scale=cfg_scale,
-                    seed=seed,
-                    sampler=sampler_name,
-                    scheduler=scheduler,
-                    model=checkpoint_hint,
-                    source_image_path=source_path,
-                    controlnet_module=controlnet_module,
-                    controlnet_weight=controlnet_weight,
-                )
+                control_path, cn_module, preprocessed = control_image(source_path, controlnet_module)
+                with jobs.run('comfyui', 'generate', job_id=job_id, project_id=project_id,
+                              priority=data.get('priority')):
+                    result = comfyui_gen.generate_controlnet(
+                        prompt=prompt,
+                        negative_prompt=negative_prompt,
+                        width=width,
+                        height=height,
+                        steps=steps,
+                        cfg_scale=cfg_scale,
+                        seed=seed,
+                        sampler=sampler_name,
+                        scheduler=scheduler,
+                        model=checkpoint_hint,
+                        source_image_path=control_path,
+                        controlnet_module=cn_module,
+                        controlnet_weight=controlnet_weight,
+                        preprocessed=preprocessed,
+                        workflow_name=data.get('workflow'),
+                    )
             else:
                 # Standard img2img or txt2img
                 denoising_strength = data.get('denoising_strength', 0.75)
-                result = comfyui_gen.generate(
-                    prompt=prompt,
-                    negative_prompt=negative_prompt,
-                    width=width,
-                    height=height,
-                    steps=steps,
-                    cfg_scale=cfg_scale,
-                    seed=seed,
-                    sampler=sampler_name,
-                    scheduler=scheduler,
-                    model=checkpoint_hint,
-                    source_image_path=source_path,
-                    denoising_strength=denoising_strength,
-                )
+                with jobs.run('comfyui', 'generate', job_id=job_id, project_id=project_id,
+                              priority=data.get('priority')):
+                    result = comfyui_gen.generate(
+                        prompt=prompt,
+                        negative_prompt=negative_prompt,
+                        width=width,
+                        height=height,
+                        steps=steps,
+                        cfg_scale=cfg_scale,
+                        seed=seed,
+                        sampler=sampler_name,
+                        scheduler=scheduler,
+                        model=checkpoint_hint,
+                        source_image_path=source_path,
+                        denoising_strength=denoising_strength,
+                        workflow_name=data.get('workflow'),
+                    )
+            health.record('comfyui', result)
 
         # ── Cloud API ──
         elif provider_key and provider_key not in ('local', 'comfyui') and model_info.get('api_model_id'):
-            provider = provider_model.get_by_key(provider_key)
+            cloud = True
+            with timing.stage('db_lookup'):
+                provider = provider_model.get_by_key(provider_key)
             if not provider or not provider.get('api_key'):
                 return jsonify({'status': 'error', 'message': f'{provider_key} API key ayarlanmamış. Settings > Providers\'dan ekleyin.'}), 400
 
-            api_key = provider['api_key']
-            base_url = provider.get('base_url')
-            api_model_id = model_info['api_model_id']
-
             # Get source image for cloud img2img (floorplan, sketch)
-            cloud_source_b64 = data.get('source_image_base64')
-            if not cloud_source_b64 and source_image_id:
-                source = image_model.get_by_id(source_image_id)
-                if source:
-                    folder = project_model.get_project_path(source['project_id'])
-                    if folder:
-                        src = folder / source['filename']
-                        if src.exists():
-                            import base64 as b64mod
-                            cloud_source_b64 = b64mod.b64encode(src.read_bytes()).decode('utf-8')
-
-            if provider_key == 'stability':
-                cloud_gen = StabilityGenerator(
-                    api_key=api_key,
-                    base_url=base_url or 'https://api.stability.ai/v2beta'
-                )
-                result = cloud_gen.generate(
+            with timing.stage('source'):
+                cloud_source_b64 = data.get('source_image_base64')
+                if not cloud_source_b64 and source_image_id:
+                    src = source_image_path(source_image_id)
+                    if src:
+                        cloud_source_b64 = base64.b64encode(src.read_bytes()).decode('utf-8')
+
+            # Primary model + fallbacks: hedge slow calls, fail over on 429/5xx
+            candidates = resolve_candidates(model_info, provider,
+                                            needs_source_image=bool(cloud_source_b64))
+            with timing.stage('backend'):
+                result = hedged_generate(
+                    candidates,
+                    kind='preview' if full_request else 'generate',
                     prompt=prompt,
-                    model_id=api_model_id,
                     negative_prompt=negative_prompt,
                     width=width,
                     height=height,
                     seed=seed,
                     source_image_base64=cloud_source_b64,
                 )
-            elif provider_key == 'openai':
-                cloud_gen = OpenAIGenerator(
-                    api_key=api_key,
-                    base_url=base_url or 'https://api.openai.com/v1'
-                )
-                result = cloud_gen.generate(
-                    prompt=prompt,
-                    model_id=api_model_id,
-                    width=width,
-                    height=height,
-                )
-            elif provider_key == 'grok':
-                cloud_gen = GrokGenerator(
-                    api_key=api_key,
-                    base_url=base_url or 'https://api.x.ai/v1'
-                )
-                result = cloud_gen.generate(
-                    prompt=prompt,
-                    model_id=api_model_id,
-                    width=width,
-                    height=height,
-                )
-            else:
-                # Gemini / Imagen (default cloud)
-                cloud_gen = GeminiGenerator(
-                    api_key=api_key,
-                    base_url=base_url or 'https://generativelanguage.googleapis.com/v1beta'
-                )
-                result = cloud_gen.generate(
-                    prompt=prompt,
-                    model_id=api_model_id,
-                    width=width,
-                    height=height,
-                )
 
         # ── Local SD WebUI ──
         else:
+            if not health.allow('local'):
+                return jsonify({'status': 'error', 'message': health.unavailable_message('local')}), 503
+
             # Switch SD WebUI model if specified
             if model:
-                generator.set_model(model)
+                with timing.stage('model_load'):
+                    get_generator().set_model(model)
 
             # Find source image for ControlNet
-            source_path = None
-            source_image_base64 = data.get('source_image_base64')
-            if source_image_base64:
-                import tempfile, base64
-                tmp = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-                tmp.write(base64.b64decode(source_image_base64))
-                tmp.close()
-                source_path = tmp.name
-            elif source_image_id:
-                source = image_model.get_by_id(source_image_id)
-                if source:
-                    folder = project_model.get_project_path(source['project_id'])
-                    if folder:
-                        src = folder / source['filename']
-                        if src.exists():
-                            source_path = str(src)
+            with timing.stage('source'):
+                source_path = load_source(data, source_image_id)
 
             # Parse sampler name and scheduler
             sampler_name = sampler
@@ -268,32 +390,45 @@ def register_routes(bp):
                     scheduler = sched
                     break
 
-            result = generator.generate(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                width=width,
-                height=height,
-                steps=steps,
-                cfg_scale=cfg_scale,
-                seed=seed,
-                sampler=sampler_name,
-                scheduler=scheduler,
-                source_image_path=source_path,
-                controlnet_module=controlnet_module,
-                controlnet_weight=controlnet_weight,
-            )
+            control_path, cn_module, preprocessed = control_image(source_path, controlnet_module)
+            with jobs.run('local', 'generate', job_id=job_id, project_id=project_id,
+                          priority=data.get('priority')):
+                result = get_generator().generate(
+                    prompt=prompt,
+                    negative_prompt=negative_prompt,
+                    width=width,
+                    height=height,
+                    steps=steps,
+                    cfg_scale=cfg_scale,
+                    seed=seed,
+                    sampler=sampler_name,
+                    scheduler=scheduler,
+                    source_image_path=control_path,
+                    controlnet_module=cn_module,
+                    controlnet_weight=controlnet_weight,
+                    preprocessed=preprocessed,
+                )
+            health.record('local', result)
 
+        if shared is None and not cloud:        # cloud calls are recorded per candidate (cloud_policy)
+            metrics.record_result(provider_key or 'local', model_info['key'] if model_info else model,
+                                  'preview' if full_request else 'generate', result)
+        if result.get('cancelled'):
+            return jobs.cancelled_response(job_id)
         if 'error' in result:
             return jsonify({'status': 'error', 'message': result['error']}), 500
 
-        # Save to project if project_id provided
+        # Save to project if project_id provided (drafts are not kept);
+        # a coalesced request reuses the leader's row in the same project
         saved_image = None
-        if project_id:
+        content_hash = None
+        if shared and shared.get('project_id') == project_id:
+            saved_image = shared.get('saved_image')
+        if project_id and not full_request and not saved_image:
             folder = project_model.get_project_path(project_id)
             if folder:
-                filename = f"gen_{int(time.time())}.png"
-                save_path = folder / filename
-                generator.save_image(result['image_base64'], save_path)
+                with timing.stage('write'):
+                    content_hash = result.get('content_hash') or image_store.put_base64(result['image_base64'])
 
                 settings = {
                     'prompt': prompt,
@@ -312,30 +447,37 @@ def register_routes(bp):
                     'source': 'controlnet_depth' if source_path else 'txt2img',
                     'source_image_id': source_image_id,
                 }
-                saved_image = image_model.create(
-                    project_id=project_id,
-                    filename=filename,
-                    settings=settings,
-                    parent_id=source_image_id,
-                )
-
-        return jsonify({
+                if result.get('served_by'):
+                    settings['served_by'] = result['served_by']
+                settings['timings'] = timing.current().as_dict()
+                with timing.stage('db_commit'):
+                    saved_image = image_model.add_to_project(
+                        project_id, content_hash, f"gen_{int(time.time())}", '.png',
+                        settings=settings, parent_id=source_image_id, folder=folder,
+                    )
+
+        response = {
             'status': 'success',
             'image_base64': result['image_base64'],
             'seed': result.get('seed'),
             'elapsed': result.get('elapsed'),
+            'served_by': result.get('served_by'),
+            'job_id': job_id,
             'saved_image': saved_image,
-        })
+            'preview': bool(full_request),
+            'full_request': dict(full_request, seed=result.get('seed', seed)) if full_request else None,
+            'timings': timing.current().as_dict(),
+        }
+        if shared:
+            response['coalesced_with'] = shared['coalesced_with']
+        else:
+            coalesce.publish(dict(response, project_id=project_id), content_hash)
+        return jsonify(response)
 
     @bp.route('/sd-status', methods=['GET'])
     def sd_status():
-        """Check SD WebUI connection + available models"""
-        connected = generator.check_connection()
-        data = {'status': 'success', 'connected': connected}
-        if connected:
-            data['models'] = generator.get_models()
-            data['controlnet_models'] = generator.get_controlnet_models()
-        return jsonify(data)
+        """SD WebUI connection + available models (cached by the health monitor, ?refresh=1 probes live)"""
+        return jsonify({'status': 'success', **health.get_status('local', refresh=request.args.get('refresh') == '1')})
 
     @bp.route('/sketch-to-image', methods=['POST'])
     def sketch_to_image():
@@ -367,14 +509,10 @@ def register_routes(bp):
         if not folder:
             return jsonify({'status': 'error', 'message': 'Proje bulunamadı'}), 404
 
-        filename = f"gen_{int(time.time())}.png"
-        save_path = folder / filename
-        generator.save_image(image_base64, save_path)
-
-        saved_image = image_model.create(
-            project_id=project_id,
-            filename=filename,
-            settings=settings,
+        content_hash = image_store.put_base64(image_base64)
+        saved_image = image_model.add_to_project(
+            project_id, content_hash, f"gen_{int(time.time())}", '.png',
+            settings=settings, folder=folder,
         )
 
         return jsonify({'status': 'success', 'image': saved_image})
@@ -382,30 +520,99 @@ def register_routes(bp):
     @bp.route('/upscalers', methods=['GET'])
     def list_upscalers():
         """Get available upscaler models from SD WebUI"""
-        upscalers = generator.get_upscalers()
+        upscalers = get_generator().get_upscalers()
         return jsonify({'status': 'success', 'upscalers': upscalers})
 
     @bp.route('/upscale', methods=['POST'])
     def upscale_image():
-        """Upscale an image via SD WebUI or Cloud API"""
+        """Upscale an image via SD WebUI or Cloud API.
+
+        Input: image_base64, or source_image_id (read from disk).
+        With project_id the result is saved to the project; Stability and
+        ComfyUI outputs are then streamed straight into the blob store and the
+        response carries the saved image instead of a base64 payload.
+        """
+        try:
+            with timing.record():
+                return _do_upscale()
+        except jobs.JobCancelled as e:
+            metrics.error('upscale', 'cancelled')
+            return jobs.cancelled_response(str(e))
+        except jobs.QueueTimeout as e:
+            metrics.error('upscale', 'queue_timeout')
+            return jobs.queue_timeout_response(str(e))
+        except jobs.QueueFull as e:
+            metrics.error('upscale', 'queue_full')
+            return jobs.queue_full_response(str(e))
+        except jobs.DuplicateJob as e:
+            metrics.error('upscale', 'duplicate_job')
+            return jobs.duplicate_job_response(str(e))
+        finally:
+            health.release()
+
+    def _do_upscale():
         data = request.json
+        job_id = str(data.get('job_id') or uuid4().hex)[:64]
         image_base64 = data.get('image_base64')
-        if not image_base64:
-            return jsonify({'status': 'error', 'message': 'image_base64 gerekli'}), 400
+        source_image_id = data.get('source_image_id')
+        project_id = data.get('project_id')
+        source_path = source_image_path(source_image_id) if source_image_id else None
+        if not image_base64 and not source_path:
+            return jsonify({'status': 'error', 'message': 'image_base64 veya source_image_id gerekli'}), 400
+        if project_id and not project_model.get_project_path(project_id):
+            return jsonify({'status': 'error', 'message': 'Proje bulunamadı'}), 404
+        to_store = bool(project_id)
 
         provider_key = data.get('provider_key', 'local')
         model_key = data.get('model_key', '')
 
+        # Output cap before any branch allocates pixels (CPU, GPU, CPU fallback, tiled);
+        # Stability's upscalers pick their own output size
+        if provider_key != 'stability' or data.get('tiled'):
+            try:
+                width, height = image_size(image_base64, source_path)
+                scale = float(data.get('upscaling_resize', 2))
+            except (OSError, ValueError, TypeError):
+                return jsonify({'status': 'error', 'message': 'Görsel veya ölçek okunamadı'}), 400
+            if width * height * scale * scale > app_config.get('upscale.max_output_pixels', 12288 * 12288):
+                return jsonify({'status': 'error', 'message': 'Çıktı çözünürlüğü çok büyük'}), 400
+
+        if data.get('tiled'):
+            return _upscale_tiled(data, job_id, image_base64, source_path, project_id, source_image_id)
+
+        def run_cpu():
+            from api.cpu_upscaler import CPUUpscaler
+            return CPUUpscaler().upscale(
+                image_base64=image_base64,
+                image_path=None if image_base64 else str(source_path),
+                scale=data.get('upscaling_resize', 2),
+                sharpen=data.get('sharpen', 0.5),
+                to_store=to_store,
+            )
+
+        # GPU backend down → CPU upscaler instead of a 503 (upscale.cpu_fallback)
+        if provider_key not in ('stability', 'comfyui', 'cpu'):
+            provider_key = 'local'
+        cpu_fallback = app_config.get('upscale.cpu_fallback', True)
+        fallback_from = None
+        if provider_key in ('local', 'comfyui') and not health.allow(provider_key):
+            if not cpu_fallback:
+                return jsonify({'status': 'error', 'message': health.unavailable_message(provider_key)}), 503
+            fallback_from, provider_key = provider_key, 'cpu'
+
+        # ── Built-in CPU ──
+        if provider_key == 'cpu':
+            result = run_cpu()
+
         # ── Cloud: Stability AI ──
-        if provider_key == 'stability':
+        elif provider_key == 'stability':
             provider = provider_model.get_by_key('stability')
             if not provider or not provider.get('api_key'):
                 return jsonify({'status': 'error', 'message': 'Stability AI API key ayarlanmamış.'}), 400
+            if not wait_for_slot(provider):
+                return jsonify({'status': 'error', 'message': 'stability hız limiti doldu, biraz sonra tekrar deneyin'}), 429
 
-            cloud_gen = StabilityGenerator(
-                api_key=provider['api_key'],
-                base_url=provider.get('base_url') or 'https://api.stability.ai/v2beta'
-            )
+            cloud_gen = create_cloud_generator(provider)
 
             model_info = ai_model_model.get_by_key(model_key) if model_key else None
             api_model_id = model_info['api_model_id'] if model_info else 'conservative-upscale'
@@ -413,11 +620,15 @@ def register_routes(bp):
             if api_model_id == 'conservative-upscale':
                 result = cloud_gen.upscale(
                     image_base64=image_base64,
+                    image_path=None if image_base64 else str(source_path),
                     prompt=data.get('prompt', ''),
                     creativity=data.get('creativity', 0.35),
+                    to_store=to_store,
                 )
             else:
                 # Structure control (img2img enhance)
+                if not image_base64:
+                    image_base64 = base64.b64encode(source_path.read_bytes()).decode('utf-8')
                 result = cloud_gen._generate_structure(
                     prompt=data.get('prompt', 'high quality, detailed, enhanced'),
                     source_image_base64=image_base64,
@@ -425,14 +636,20 @@ def register_routes(bp):
 
         # ── ComfyUI ──
         elif provider_key == 'comfyui':
+            from api.comfyui_generator import ComfyUIGenerator
             comfyui_gen = ComfyUIGenerator()
             upscale_model = data.get('upscaler_1', '')
             scale = data.get('upscaling_resize', 2)
-            result = comfyui_gen.upscale(
-                image_base64=image_base64,
-                upscale_model=upscale_model,
-                scale=scale,
-            )
+            with jobs.run('comfyui', 'upscale', job_id=job_id, project_id=project_id,
+                          priority=data.get('priority')):
+                result = comfyui_gen.upscale(
+                    image_base64=image_base64,
+                    image_path=None if image_base64 else str(source_path),
+                    upscale_model=upscale_model,
+                    scale=scale,
+                    to_store=to_store,
+                )
+            health.record('comfyui', result)
 
         # ── Local: SD WebUI ──
         else:
@@ -440,44 +657,149 @@ def register_routes(bp):
             upscaling_resize = data.get('upscaling_resize', 2)
             upscaler_2 = data.get('upscaler_2', '')
             upscaler_2_visibility = data.get('upscaler_2_visibility', 0.0)
+            if not image_base64:
+                # SD WebUI extras API only takes base64 JSON
+                with timing.stage('source'):
+                    image_base64 = base64.b64encode(source_path.read_bytes()).decode('utf-8')
+
+            with jobs.run('local', 'upscale', job_id=job_id, project_id=project_id,
+                          priority=data.get('priority')):
+                result = get_generator().upscale(
+                    image_base64=image_base64,
+                    upscaler_1=upscaler_1,
+                    upscaling_resize=upscaling_resize,
+                    upscaler_2=upscaler_2,
+                    upscaler_2_visibility=upscaler_2_visibility,
+                )
+            health.record('local', result)
 
-            result = generator.upscale(
-                image_base64=image_base64,
-                upscaler_1=upscaler_1,
-                upscaling_resize=upscaling_resize,
-                upscaler_2=upscaler_2,
-                upscaler_2_visibility=upscaler_2_visibility,
-            )
+        model_label = model_key or data.get('upscaler_1', '')
+        metrics.record_result(provider_key, model_label, 'upscale', result)
+        if result.get('cancelled'):
+            return jobs.cancelled_response(job_id)
+        if result.get('unreachable') and cpu_fallback:
+            fallback_from, provider_key = provider_key, 'cpu'
+            result = run_cpu()
+            metrics.record_result('cpu', model_label, 'upscale', result)
 
         if 'error' in result:
             return jsonify({'status': 'error', 'message': result['error']}), 500
 
+        if not project_id:
+            return jsonify({
+                'status': 'success',
+                'image_base64': result['image_base64'],
+                'elapsed': result.get('elapsed'),
+                'fallback_from': fallback_from,
+                'timings': timing.current().as_dict(),
+            })
+
+        # Streamed results are already in the blob store; SD WebUI returns base64
+        with timing.stage('write'):
+            content_hash = result.get('content_hash') or image_store.put_base64(result['image_base64'])
+        settings = {
+            'source': 'upscale',
+            'provider': provider_key,
+            'model': model_key or data.get('upscaler_1'),
+            'scale': data.get('upscaling_resize'),
+            'source_image_id': source_image_id,
+            'fallback_from': fallback_from,
+            'timings': timing.current().as_dict(),
+        }
+        with timing.stage('db_commit'):
+            saved_image = image_model.add_to_project(
+                project_id, content_hash, f"upscale_{int(time.time())}", '.png',
+                settings=settings, parent_id=source_image_id,
+            )
         return jsonify({
             'status': 'success',
-            'image_base64': result['image_base64'],
             'elapsed': result.get('elapsed'),
+            'saved_image': saved_image,
+            'fallback_from': fallback_from,
+            'timings': timing.current().as_dict(),
         })
 
+    def _upscale_tiled(data, job_id, image_base64, source_path, project_id, source_image_id):
+        """Tiled upscale across local backends (8K+ outputs), as a batch job on each"""
+        from PIL import Image
+        from io import BytesIO
+        from api.tiled_upscale import upscale_tiled, available_backends
+
+        backends = available_backends(data.get('backends'))
+        if not backends:
+            return jsonify({'status': 'error', 'message': 'Tiled upscale için erişilebilir backend yok'}), 503
+
+        with timing.stage('source'):
+            source = Image.open(source_path if source_path else BytesIO(base64.b64decode(image_base64)))
+        scale = int(data.get('upscaling_resize', 2))      # output size checked in _do_upscale
+
+        start = time.time()
+        try:
+            # Slot wait is recorded as 'queue' by jobs.run, the tile loop as 'tiles'
+            image = upscale_tiled(source, scale, backends, options={
+                'upscaler_1': data.get('upscaler_1', 'R-ESRGAN 4x+'),
+                'upscaler_2': data.get('upscaler_2', ''),
+                'upscaler_2_visibility': data.get('upscaler_2_visibility', 0.0),
+                'upscale_model': data.get('upscale_model', ''),
+            }, tile=data.get('tile_size'), job_id=job_id, project_id=project_id)
+        except RuntimeError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+        elapsed = round(time.time() - start, 1)
+
+        if not project_id:
+            with timing.stage('write'):
+                buf = BytesIO()
+                image.save(buf, format='PNG')
+            return jsonify({
+                'status': 'success',
+                'image_base64': base64.b64encode(buf.getvalue()).decode('utf-8'),
+                'elapsed': elapsed,
+                'width': image.width,
+                'height': image.height,
+                'timings': timing.current().as_dict(),
+            })
+
+        with timing.stage('write'):
+            content_hash = image_store.put_image(image)
+        settings = {
+            'source': 'upscale_tiled',
+            'backends': backends,
+            'scale': scale,
+            'width': image.width,
+            'height': image.height,
+            'source_image_id': source_image_id,
+            'timings': timing.current().as_dict(),
+        }
+        with timing.stage('db_commit'):
+            saved_image = image_model.add_to_project(
+                project_id, content_hash, f"upscale_{int(time.time())}", '.png',
+                settings=settings, parent_id=source_image_id,
+            )
+        return jsonify({'status': 'success', 'elapsed': elapsed, 'saved_image': saved_image,
+                        'timings': timing.current().as_dict()})
+
     @bp.route('/comfyui-upscalers', methods=['GET'])
     def comfyui_upscalers():
         """Get available upscale models from ComfyUI"""
+        from api.comfyui_generator import ComfyUIGenerator
         comfyui_gen = ComfyUIGenerator()
         models = comfyui_gen.get_upscale_models()
         return jsonify({'status': 'success', 'upscalers': models})
 
     @bp.route('/comfyui-status', methods=['GET'])
     def comfyui_status():
-        """Check ComfyUI connection + available checkpoints"""
-        comfyui_gen = ComfyUIGenerator()
-        connected = comfyui_gen.check_connection()
-        data = {'status': 'success', 'connected': connected}
-        if connected:
-            data['checkpoints'] = comfyui_gen.get_checkpoints()
-        return jsonify(data)
+        """ComfyUI connection + available checkpoints (cached by the health monitor, ?refresh=1 probes live)"""
+        return jsonify({'status': 'success', **health.get_status('comfyui', refresh=request.args.get('refresh') == '1')})
+
+    @bp.route('/health', methods=['GET'])
+    def backend_health():
+        """Cached health + circuit state of all local backends"""
+        return jsonify({'status': 'success', 'backends': health.get_all()})
 
     @bp.route('/comfyui-checkpoints', methods=['GET'])
     def comfyui_checkpoints():
         """Get available ComfyUI checkpoint models"""
+        from api.comfyui_generator import ComfyUIGenerator
         comfyui_gen = ComfyUIGenerator()
         checkpoints = comfyui_gen.get_checkpoints()
         return jsonify({'status': 'success', 'checkpoints': checkpoints})
@@ -486,10 +808,22 @@ def register_routes(bp):
     def comfyui_controlnet_options():
         """Get available ControlNet preprocessors filtered by checkpoint compatibility"""
         checkpoint = request.args.get('checkpoint', '')
+        from api.comfyui_generator import ComfyUIGenerator
         comfyui_gen = ComfyUIGenerator()
         options = comfyui_gen.get_available_controlnet_options(checkpoint=checkpoint)
         return jsonify({'status': 'success', 'options': options})
 
+    @bp.route('/comfyui-workflows', methods=['GET'])
+    def comfyui_workflows_list():
+        """List workflow templates, validated against the ComfyUI server's nodes"""
+        from api import comfyui_workflows
+        from api.comfyui_generator import ComfyUIGenerator
+        object_info = ComfyUIGenerator().get_object_info()
+        templates = comfyui_workflows.list_templates()
+        for item in templates:
+            item['problems'] = comfyui_workflows.get(item['name']).validate(object_info)
+        return jsonify({'status': 'success', 'workflows': templates, 'validated': bool(object_info)})
+
     @bp.route('/status', methods=['GET'])
     def api_status():
         """Check API and service status"""
@@ -13,6 +13,7 @@ Usage:
 
 import requests
 import time
+from api import metrics
 
 
 class GrokGenerator:
@@ -62,6 +63,7 @@ class GrokGenerator:
                 },
                 timeout=self.timeout,
             )
+            metrics.record_transfer('grok', r)
             r.raise_for_status()
             elapsed = round(time.time() - start, 1)
 
@@ -80,7 +82,8 @@ class GrokGenerator:
             }
 
         except requests.exceptions.HTTPError as e:
-            return {"error": self._parse_error(e)}
+            return {"error": self._parse_error(e), "status_code": e.response.status_code,
+                    "retry_after": e.response.headers.get("Retry-After")}
         except requests.exceptions.ConnectionError:
             return {"error": "Grok API bağlantı hatası"}
         except requests.exceptions.Timeout:
@@ -0,0 +1,269 @@
+"""
+api/health.py
+MekanAI - Backend Health Monitor & Circuit Breaker
+
+A daemon thread probes the local backends (SD WebUI, ComfyUI) every
+`health.interval` seconds and caches the result, so status endpoints answer
+from memory instead of waiting on a live probe.
+
+Each backend has a circuit breaker fed by probes and real requests:
+
+    closed     → requests pass; `failure_threshold` consecutive
+                 connection failures open the circuit
+    open       → requests fail fast (no connect timeout); after
+                 `reset_timeout` seconds one trial request / probe is let through
+    half_open  → trial in flight; success closes, failure re-opens
+
+A trial that ends without an outcome (queue timeout, cancellation, an error
+before the backend call) gives its slot back at the end of the request, so
+the next request can try again — also when the monitor is disabled.
+
+Usage:
+    from api import health
+    if not health.allow('local'):
+        return error 503
+    result = gen.generate(...)
+    health.record('local', result)
+    ...
+    health.release()        # end of request (finally)
+"""
+import os
+import threading
+import time
+from config import config
+from models.base import db_session
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+BACKEND_NAMES = {
+    'local': 'SD WebUI',
+    'comfyui': 'ComfyUI',
+}
+
+
+# ============================================
+# CIRCUIT BREAKER
+# ============================================
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (thread-safe)"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_owner = None     # token of the caller holding the half-open trial
+        self._lock = threading.Lock()
+
+    def allow(self, owner=None):
+        """True if a call may go through now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN      # exactly one trial call
+                self.trial_owner = owner
+                return True
+            return False
+
+    def release(self, owner):
+        """Give back a trial that ended without an outcome (no-op once recorded)"""
+        with self._lock:
+            if self.state == HALF_OPEN and self.trial_owner is owner:
+                self.state = OPEN           # reset_timeout already passed: next call is the trial
+                self.trial_owner = None
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_owner = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"[!] Circuit opened after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.time()
+            self.trial_owner = None
+
+    def retry_in(self):
+        """Seconds until the next trial is allowed (0 if closed)"""
+        if self.state == CLOSED:
+            return 0
+        return max(0.0, self.reset_timeout - (time.time() - self.opened_at))
+
+
+# ============================================
+# PROBES
+# ============================================
+def _probe_sd():
+    from api.sd_generator import AIGenerator
+    gen = AIGenerator()
+    if not gen.check_connection():
+        return False, {}
+    return True, {
+        'models': gen.get_models(),
+        'controlnet_models': gen.get_controlnet_models(),
+    }
+
+
+def _probe_comfyui():
+    from api.comfyui_generator import ComfyUIGenerator
+    gen = ComfyUIGenerator()
+    if not gen.check_connection():
+        return False, {}
+    return True, {'checkpoints': gen.get_checkpoints()}
+
+
+PROBES = {
+    'local': _probe_sd,
+    'comfyui': _probe_comfyui,
+}
+
+
+# ============================================
+# MONITOR
+# ============================================
+_breakers = {}
+_snapshots = {}
+_state_lock = threading.Lock()
+_thread = None
+_stop = threading.Event()
+_request = threading.local()        # half-open trials taken by this thread's request
+
+
+def _breaker(key):
+    with _state_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(
+                failure_threshold=config.get('health.failure_threshold', 3),
+                reset_timeout=config.get('health.reset_timeout', 30),
+            )
+        return _breakers[key]
+
+
+def probe(key):
+    """Probe one backend now, update its breaker and cached snapshot"""
+    start = time.time()
+    try:
+        connected, details = PROBES[key]()
+    except Exception as e:
+        print(f"[!] Health probe {key} failed: {e}")
+        connected, details = False, {}
+    finally:
+        db_session.remove()     # probes may run on the monitor thread
+
+    breaker = _breaker(key)
+    if connected:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+    snapshot = {
+        'connected': connected,
+        'checked_at': time.time(),
+        'latency_ms': round((time.time() - start) * 1000),
+        **details,
+    }
+    with _state_lock:
+        _snapshots[key] = snapshot
+    return snapshot
+
+
+def _run():
+    interval = config.get('health.interval', 15)
+    while not _stop.is_set():
+        for key in PROBES:
+            breaker = _breaker(key)
+            # Open circuit: only probe once reset_timeout has passed (half-open)
+            if breaker.state == OPEN and breaker.retry_in() > 0:
+                continue
+            probe(key)
+        _stop.wait(interval)
+
+
+def ensure_started():
+    """Start the monitor thread in this process (idempotent)"""
+    global _thread
+    if not config.get('health.enabled', True):
+        return
+    with _state_lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name='health-monitor', daemon=True)
+        _thread.start()
+
+
+def _reset_after_fork():
+    """Threads don't survive fork — each worker starts its own monitor"""
+    global _thread, _state_lock
+    _thread = None
+    _state_lock = threading.Lock()
+    _breakers.clear()
+    _snapshots.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ============================================
+# PUBLIC API
+# ============================================
+def allow(key):
+    """Fail-fast gate before calling a backend"""
+    ensure_started()
+    breaker = _breaker(key)
+    token = object()
+    if not breaker.allow(token):
+        return False
+    if breaker.trial_owner is token:
+        _request.trials = getattr(_request, 'trials', []) + [(breaker, token)]
+    return True
+
+
+def record(key, result):
+    """Feed a request outcome ({'error', 'unreachable'} dict) into the breaker"""
+    if result.get('unreachable'):
+        _breaker(key).record_failure()
+    else:
+        _breaker(key).record_success()
+
+
+def release():
+    """End of request: hand back half-open trials it took but never recorded"""
+    trials = getattr(_request, 'trials', None)
+    if not trials:
+        return
+    _request.trials = []
+    for breaker, token in trials:
+        breaker.release(token)
+
+
+def unavailable_message(key):
+    name = BACKEND_NAMES.get(key, key)
+    return (f"{name} şu an erişilemiyor, "
+            f"{int(_breaker(key).retry_in()) + 1}s sonra tekrar denenecek")
+
+
+def get_status(key, refresh=False):
+    """Cached health for one backend (live probe if refresh or nothing cached yet)"""
+    ensure_started()
+    with _state_lock:
+        snapshot = _snapshots.get(key)
+    if snapshot is None or refresh:
+        snapshot = probe(key)
+    breaker = _breaker(key)
+    return {
+        **snapshot,
+        'circuit': breaker.state,
+        'retry_in': round(breaker.retry_in(), 1),
+    }
+
+
+def get_all():
+    return {key: get_status(key) for key in PROBES}
@@ -0,0 +1,378 @@
+"""
+api/jobs.py
+MekanAI - Generation Jobs & Cancellation
+
+Requests for the local GPU backends (SD WebUI, ComfyUI) run as jobs:
+
+    queued   → waits for one of the backend's `jobs.slots.<backend>` slots
+    running  → backend call in progress
+    cancel   → DELETE /api/jobs/<id> from any worker process:
+               queued  - leaves the queue, the waiting request returns 409
+               running - ComfyUI prompt is deleted / interrupted, SD WebUI
+                         gets /sdapi/v1/interrupt; the request returns 409
+
+Job state lives in the `jobs` table (models/job.py), so a cancel reaches the
+worker process that owns the job. Each process runs a heartbeat thread that
+keeps its jobs alive and picks up cancel requests; rows whose heartbeat is
+older than `jobs.stale_after` (crashed worker) no longer hold a slot.
+
+A request coalesced with an identical in-flight one (api/coalesce.py) waits
+as a running job on the pseudo-backend `coalesce`; cancelling it returns 409
+without touching the leader's render.
+
+Clients pass their own `job_id` (e.g. crypto.randomUUID()) so they can cancel
+a request that has not answered yet; an id that is already taken is rejected
+with 409.
+
+Scheduling: each job has a priority class (interactive | normal | batch) and
+a tenant (its project, else the client address). When a slot frees up:
+
+    1. class  - weighted fair share: the class with the lowest
+                (jobs started in the last `jobs.fair_window` s + 1) / weight
+                wins, so previews jump ahead but batches are never starved
+    2. tenant - within the class, the project served least recently wins
+    3. job    - oldest queued job of that tenant
+
+A class may cap its waiting requests per backend (`max_waiting`); beyond that the request
+is rejected with 429 so bulk clients can't tie up every server thread.
+GET /api/jobs/stats reports queue depth and wait times per backend and class.
+
+Usage:
+    from api import jobs
+    with jobs.run('comfyui', 'generate', job_id=data.get('job_id')) as job:
+        result = gen.generate(...)      # generators check jobs.current()
+"""
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+from flask import jsonify, request
+from config import config
+import models.job as job_model
+import models.flight as flight_model
+from models import image_store
+from api import metrics
+from api import timing
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobCancelled(Exception):
+    """Job was cancelled while waiting for a slot"""
+
+
+class QueueTimeout(Exception):
+    """No backend slot became free within jobs.max_queue_wait"""
+
+
+class QueueFull(Exception):
+    """The priority class already has `max_waiting` queued jobs"""
+
+
+class DuplicateJob(Exception):
+    """A job with the client-supplied job_id already exists"""
+
+
+# ============================================
+# SCHEDULING
+# ============================================
+PRIORITIES = ('interactive', 'normal', 'batch')
+DEFAULT_WEIGHTS = {'interactive': 8, 'normal': 4, 'batch': 1}
+
+
+def _class_config(priority, key, default=None):
+    return config.get(f'jobs.classes.{priority}.{key}', default)
+
+
+def normalize_priority(priority):
+    return priority if priority in PRIORITIES else 'normal'
+
+
+def tenant_for(project_id=None):
+    """Fair-share key of the current request: its project, else the client"""
+    if project_id:
+        return f"project:{project_id}"
+    return f"ip:{request.remote_addr}" if request else None
+
+
+def pick_next(queued, served):
+    """Choose the job to start from this backend's queued rows (see module doc)"""
+    by_class = {}
+    for row in queued:
+        by_class.setdefault(normalize_priority(row.priority), []).append(row)
+
+    def class_key(priority):
+        weight = _class_config(priority, 'weight', DEFAULT_WEIGHTS[priority])
+        used = sum(n for (p, _), n in served.items() if p == priority)
+        return ((used + 1) / weight, -weight)
+    rows = by_class[min(by_class, key=class_key)]
+
+    # Least-served tenant in the class, oldest job first (rows are in arrival order)
+    return min(rows, key=lambda row: (served.get((row.priority, row.tenant), 0), row.created_at)).id
+
+
+# ============================================
+# JOB
+# ============================================
+class Job:
+    """In-process handle of a job owned by this worker"""
+
+    def __init__(self, job_id, backend, kind, project_id=None):
+        self.id = job_id
+        self.backend = backend
+        self.kind = kind
+        self.project_id = project_id
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def wait(self, seconds):
+        """Sleep up to `seconds`; returns True early if the job is cancelled"""
+        return self._cancel.wait(seconds)
+
+    def poll_cancelled(self):
+        """Cancelled check that reads the job row now instead of waiting for the heartbeat"""
+        if not self._cancel.is_set() and job_model.cancel_requested(self.id):
+            self._cancel.set()
+        return self.cancelled
+
+    def set_handle(self, handle):
+        """Record the backend's id for this job so any worker can cancel it"""
+        job_model.set_handle(self.id, handle)
+
+
+# ============================================
+# BACKEND CANCELLATION
+# ============================================
+def _cancel_sd(job_id, handle):
+    # /sdapi/v1/interrupt stops whatever SD WebUI is rendering: only send it
+    # while this job still holds the slot, not after it finished
+    row = job_model.get_by_id(job_id)
+    if row and row['state'] == 'running':
+        from api.generate import get_generator
+        get_generator().interrupt()
+
+
+def _cancel_comfyui(job_id, handle):
+    if handle:
+        from api.comfyui_generator import ComfyUIGenerator
+        ComfyUIGenerator().cancel(handle)
+
+
+CANCELLERS = {
+    'local': _cancel_sd,
+    'comfyui': _cancel_comfyui,
+}
+
+
+# ============================================
+# REGISTRY
+# ============================================
+_local_jobs = {}            # job_id → Job owned by this process
+_changed = threading.Condition()
+_current = threading.local()
+_thread = None
+
+
+def current():
+    """Job running on this thread (None outside jobs.run)"""
+    return getattr(_current, 'job', None)
+
+
+def _heartbeat_loop():
+    interval = config.get('jobs.heartbeat_interval', 1)
+    stale_after = config.get('jobs.stale_after', 30)
+    grace = config.get('coalesce.grace', 10)
+    last_purge = last_reap = last_flights = 0
+    while True:
+        time.sleep(interval)
+        with _changed:
+            owned = dict(_local_jobs)
+        try:
+            cancelled = job_model.heartbeat(list(owned))
+            # Jobs of dead workers free their slot (here, not in every waiting request's poll)
+            if time.time() - last_reap > stale_after / 3:
+                job_model.reap(stale_after)
+                last_reap = time.time()
+            # Coalesced results nobody claims again still free their blobs once the grace ends
+            if time.time() - last_flights > grace:
+                flight_model.purge(grace, config.get('server.worker_timeout', 360))
+                last_flights = time.time()
+            if time.time() - last_purge > 600:
+                job_model.purge(config.get('jobs.keep_finished', 3600))
+                image_store.empty_trash()
+                last_purge = time.time()
+        except Exception as e:
+            print(f"[!] Job heartbeat failed: {e}")
+            continue
+        if cancelled:
+            for job_id in cancelled:
+                owned[job_id]._cancel.set()
+            with _changed:
+                _changed.notify_all()
+
+
+def _ensure_heartbeat():
+    global _thread
+    with _changed:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_heartbeat_loop, name='job-heartbeat', daemon=True)
+            _thread.start()
+
+
+def _reset_after_fork():
+    global _thread, _changed
+    _thread = None
+    _changed = threading.Condition()
+    _local_jobs.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@contextmanager
+def run(backend, kind='generate', job_id=None, project_id=None, priority='normal', tenant=None):
+    """Queue for a backend slot, then run the body as the thread's current job.
+
+    Raises JobCancelled (cancelled while queued), QueueTimeout, QueueFull or DuplicateJob.
+    """
+    priority = normalize_priority(priority)
+    job = Job(job_id or uuid4().hex, backend, kind, project_id)
+    slots = config.get(f'jobs.slots.{backend}', 1)
+    window = config.get('jobs.fair_window', 600)
+    deadline = time.time() + config.get('jobs.max_queue_wait', 600)
+    max_waiting = _class_config(priority, 'max_waiting')
+    if max_waiting and job_model.count_queued(backend, priority) >= max_waiting:
+        raise QueueFull(priority)
+    _ensure_heartbeat()
+
+    queued_at = time.time()
+    if not job_model.enqueue(job.id, backend, kind, project_id, owner=OWNER,
+                             priority=priority, tenant=tenant or tenant_for(project_id)):
+        raise DuplicateJob(job.id)
+    with _changed:
+        _local_jobs[job.id] = job
+    state = 'failed'
+    try:
+        while not job_model.try_start(job.id, backend, slots, pick_next, window):
+            if job.cancelled:
+                state = 'cancelled'
+                raise JobCancelled(job.id)
+            if time.time() > deadline:
+                raise QueueTimeout(backend)
+            # Woken early by a local release / cancel; other processes are seen on the next poll
+            with _changed:
+                _changed.wait(0.5)
+        waited = time.time() - queued_at
+        metrics.observe('mekanai_queue_wait_seconds', waited, backend=backend, priority=priority)
+        timing.add('queue', waited)
+
+        _current.job = job
+        try:
+            yield job
+            state = 'cancelled' if job.cancelled else 'done'
+        finally:
+            _current.job = None
+    finally:
+        job_model.finish(job.id, state)
+        with _changed:
+            _local_jobs.pop(job.id, None)
+            _changed.notify_all()
+
+
+@contextmanager
+def follow(job_id, project_id=None, priority='normal', tenant=None):
+    """Register a request that waits for another request's result (no backend slot).
+
+    The body polls job.wait(); the row is deleted afterwards so the same
+    job_id can still enter jobs.run() if the request ends up rendering itself.
+    """
+    job = Job(job_id, 'coalesce', 'generate', project_id)
+    _ensure_heartbeat()
+    if not job_model.enqueue(job.id, 'coalesce', 'generate', project_id, owner=OWNER,
+                             priority=normalize_priority(priority), tenant=tenant or tenant_for(project_id),
+                             state='running'):
+        raise DuplicateJob(job.id)
+    with _changed:
+        _local_jobs[job.id] = job
+    try:
+        yield job
+    finally:
+        job_model.delete(job.id)
+        with _changed:
+            _local_jobs.pop(job.id, None)
+
+
+def cancel(job_id):
+    """Cancel a queued or running job (any worker). Returns the job row or None."""
+    row = job_model.request_cancel(job_id)
+    if not row:
+        return None
+    with _changed:
+        job = _local_jobs.get(job_id)
+        if job:
+            job._cancel.set()
+            _changed.notify_all()
+    if row['state'] == 'running' and row['backend'] in CANCELLERS:
+        try:
+            CANCELLERS[row['backend']](job_id, row['handle'])
+            print(f"[*] Job {job_id} cancelled on {row['backend']}")
+        except Exception as e:
+            print(f"[!] Backend cancel for job {job_id} failed: {e}")
+    return row
+
+
+def cancelled_response(job_id):
+    return jsonify({'status': 'cancelled', 'message': 'İş iptal edildi', 'job_id': job_id}), 409
+
+
+def queue_full_response(priority):
+    return jsonify({'status': 'error',
+                    'message': f'{priority} kuyruğu dolu, önceki işler bitince tekrar deneyin'}), 429
+
+
+def duplicate_job_response(job_id):
+    return jsonify({'status': 'error', 'message': 'Bu job_id zaten kullanılıyor', 'job_id': job_id}), 409
+
+
+def queue_timeout_response(backend):
+    from api.health import BACKEND_NAMES
+    name = BACKEND_NAMES.get(backend, backend)
+    return jsonify({'status': 'error', 'message': f'{name} kuyruğu dolu, biraz sonra tekrar deneyin'}), 503
+
+
+# ============================================
+# ROUTES
+# ============================================
+def register_routes(bp):
+    """Register job API routes"""
+
+    @bp.route('/jobs', methods=['GET'])
+    def list_jobs():
+        return jsonify({'status': 'success', 'jobs': job_model.get_active()})
+
+    @bp.route('/jobs/stats', methods=['GET'])
+    def job_stats():
+        """Queue depth and wait times (s) per backend and priority class"""
+        return jsonify({'status': 'success',
+                        'window': config.get('jobs.fair_window', 600),
+                        'stats': job_model.get_stats(config.get('jobs.fair_window', 600))})
+
+    @bp.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = job_model.get_by_id(job_id)
+        if not job:
+            return jsonify({'status': 'error', 'message': 'İş bulunamadı'}), 404
+        return jsonify({'status': 'success', 'job': job})
+
+    @bp.route('/jobs/<job_id>', methods=['DELETE'])
+    def delete_job(job_id):
+        row = cancel(job_id)
+        if not row:
+            return jsonify({'status': 'error', 'message': 'Aktif iş bulunamadı'}), 404
+        return jsonify({'status': 'success', 'job_id': job_id, 'was': row['state']})
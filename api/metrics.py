@@ -0,0 +1,304 @@
+"""
+api/metrics.py
+MekanAI - Prometheus Metrics
+
+GET /metrics serves the Prometheus text format (no client library needed):
+
+    mekanai_request_duration_seconds   histogram  endpoint, method, status
+    mekanai_queue_wait_seconds         histogram  backend, priority
+    mekanai_backend_duration_seconds   histogram  provider, model, kind
+    mekanai_backend_bytes_total        counter    provider, direction (sent | received)
+    mekanai_db_queries_per_request     histogram  endpoint
+    mekanai_db_seconds_per_request     histogram  endpoint
+    mekanai_cache_lookups_total        counter    cache, result (hit | miss)
+    mekanai_errors_total               counter    source, type
+
+Every worker process keeps its own registry and writes a snapshot to
+`metrics.dir` every `metrics.flush_interval` seconds; a scrape merges the
+snapshots, so gunicorn workers report as one. Snapshots of exited workers are
+kept (counters must not go backwards) until `metrics.retention` expires.
+
+Usage:
+    from api import metrics
+    metrics.observe('mekanai_queue_wait_seconds', 1.2, backend='local', priority='normal')
+    metrics.inc('mekanai_cache_lookups_total', cache='control_map', result='hit')
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+from flask import Response, request
+from config import config
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# name → (type, help, label names, buckets)
+METRICS = {
+    'mekanai_request_duration_seconds': (
+        'histogram', 'End-to-end HTTP request latency', ('endpoint', 'method', 'status'), LATENCY_BUCKETS),
+    'mekanai_queue_wait_seconds': (
+        'histogram', 'Time a job waited for a backend slot', ('backend', 'priority'), LATENCY_BUCKETS),
+    'mekanai_backend_duration_seconds': (
+        'histogram', 'Backend render / upscale time per call', ('provider', 'model', 'kind'), LATENCY_BUCKETS),
+    'mekanai_backend_bytes_total': (
+        'counter', 'Bytes sent to and received from image backends', ('provider', 'direction'), None),
+    'mekanai_db_queries_per_request': (
+        'histogram', 'SQL statements executed per HTTP request', ('endpoint',), COUNT_BUCKETS),
+    'mekanai_db_seconds_per_request': (
+        'histogram', 'Time spent in SQL per HTTP request', ('endpoint',), DB_BUCKETS),
+    'mekanai_cache_lookups_total': (
+        'counter', 'Cache lookups by result', ('cache', 'result'), None),
+    'mekanai_errors_total': (
+        'counter', 'Errors by source and type', ('source', 'type'), None),
+}
+
+SKIPPED_ENDPOINTS = ('static', 'metrics')
+
+
+# ============================================
+# REGISTRY
+# ============================================
+_values = {name: {} for name in METRICS}     # name → {label tuple: float | [bucket counts..., sum]}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_state = {'file': None, 'dirty': False, 'thread': None}
+_request = threading.local()
+
+
+def _labels(name, labels):
+    return tuple(str(labels.get(label, '')) for label in METRICS[name][2])
+
+
+def inc(name, value=1, **labels):
+    """Add to a counter"""
+    key = _labels(name, labels)
+    with _lock:
+        series = _values[name]
+        series[key] = series.get(key, 0) + value
+        _state['dirty'] = True
+    _ensure_flusher()
+
+
+def observe(name, value, **labels):
+    """Record one histogram observation"""
+    buckets = METRICS[name][3]
+    key = _labels(name, labels)
+    index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+    with _lock:
+        series = _values[name].get(key)
+        if series is None:
+            series = _values[name][key] = [0] * (len(buckets) + 2)     # buckets, +Inf, sum
+        series[index] += 1
+        series[-1] += value
+        _state['dirty'] = True
+    _ensure_flusher()
+
+
+# ============================================
+# INSTRUMENTATION HELPERS
+# ============================================
+def cache(name, hit):
+    inc('mekanai_cache_lookups_total', cache=name, result='hit' if hit else 'miss')
+
+
+def error(source, error_type):
+    inc('mekanai_errors_total', source=source, type=error_type)
+
+
+def error_type(result):
+    """Bounded error label for a generator result dict"""
+    if result.get('cancelled'):
+        return 'cancelled'
+    if result.get('unreachable'):
+        return 'unreachable'
+    status = result.get('status_code')
+    if status == 429:
+        return 'rate_limited'
+    if status:
+        return f"http_{status}"
+    return 'backend_error'
+
+
+def record_result(provider, model, kind, result):
+    """Backend time (successful calls) or error count for a generator result"""
+    if 'error' in result:
+        error(provider, error_type(result))
+    elif result.get('elapsed') is not None:
+        observe('mekanai_backend_duration_seconds', result['elapsed'],
+                provider=provider, model=model or 'default', kind=kind)
+
+
+def record_transfer(provider, response, streamed=False):
+    """Request / response body sizes of a `requests` call to a backend"""
+    body = response.request.body if response.request is not None else None
+    sent = len(body.encode('utf-8') if isinstance(body, str) else body or b'')
+    if streamed:
+        received = int(response.headers.get('Content-Length') or 0)
+    else:
+        received = len(response.content or b'')
+    inc('mekanai_backend_bytes_total', sent, provider=provider, direction='sent')
+    inc('mekanai_backend_bytes_total', received, provider=provider, direction='received')
+
+
+# ============================================
+# SNAPSHOTS (multi-process)
+# ============================================
+def _dir():
+    return Path(config.get('metrics.dir', 'data/temp/metrics'))
+
+
+def _flush():
+    with _flush_lock:           # one writer at a time: a snapshot never replaces a newer one
+        with _lock:
+            if not _state['dirty']:
+                return
+            snapshot = {name: [[list(key), value] for key, value in series.items()]
+                        for name, series in _values.items() if series}
+            _state['dirty'] = False
+            if _state['file'] is None:
+                _state['file'] = f"{os.getpid()}-{uuid4().hex[:8]}.json"
+            filename = _state['file']
+        folder = _dir()
+        folder.mkdir(parents=True, exist_ok=True)
+        tmp = folder / f".{filename}.tmp"
+        tmp.write_text(json.dumps(snapshot), encoding='utf-8')
+        os.replace(tmp, folder / filename)
+
+
+def _flush_loop():
+    interval = config.get('metrics.flush_interval', 5)
+    while True:
+        time.sleep(interval)
+        try:
+            _flush()
+        except Exception as e:
+            print(f"[!] Metrics flush failed: {e}")
+
+
+def _ensure_flusher():
+    if _state['thread'] is not None:
+        return
+    with _lock:
+        if _state['thread'] is None:
+            _state['thread'] = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+            _state['thread'].start()
+
+
+def _reset_after_fork():
+    """Workers start from zero; the parent's values stay in its own snapshot"""
+    global _lock, _flush_lock
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    for series in _values.values():
+        series.clear()
+    _state.update(file=None, dirty=False, thread=None)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _merged():
+    """Sum of every process snapshot (this process is flushed first)"""
+    _flush()
+    merged = {name: {} for name in METRICS}
+    for path in _dir().glob('*.json'):
+        try:
+            snapshot = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        for name, series in snapshot.items():
+            if name not in merged:
+                continue
+            target = merged[name]
+            for labels, value in series:
+                key = tuple(labels)
+                if isinstance(value, list):
+                    current = target.get(key)
+                    target[key] = [a + b for a, b in zip(current, value)] if current else list(value)
+                else:
+                    target[key] = target.get(key, 0) + value
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_str(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render():
+    """Prometheus text exposition of the merged registry"""
+    lines = []
+    for name, series in _merged().items():
+        kind, help_text, label_names, buckets = METRICS[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(series.items()):
+            if kind == 'counter':
+                lines.append(f"{name}{_label_str(label_names, key)} {value:g}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-1]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_label_str(label_names, key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_str(label_names, key)} {value[-1]:g}")
+            lines.append(f"{name}_count{_label_str(label_names, key)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def _purge_old_snapshots():
+    retention = config.get('metrics.retention', 86400)
+    for path in _dir().glob('*.json'):
+        try:
+            if time.time() - path.stat().st_mtime > retention:
+                path.unlink()
+        except OSError:
+            pass
+
+
+# ============================================
+# FLASK INTEGRATION
+# ============================================
+def init_app(app):
+    """Request latency + per-request SQL stats, and the GET /metrics route.
+
+    SQL totals come from api/sql_log.py, which must be installed first.
+    """
+    from api import sql_log
+
+    _purge_old_snapshots()
+
+    @app.before_request
+    def _start_request_metrics():
+        _request.start = time.perf_counter()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        start = getattr(_request, 'start', None)
+        _request.start = None
+        if start is None or request.endpoint in SKIPPED_ENDPOINTS:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe('mekanai_request_duration_seconds', time.perf_counter() - start,
+                endpoint=endpoint, method=request.method, status=response.status_code)
+        db = sql_log.current()
+        if db is not None:
+            observe('mekanai_db_queries_per_request', db.count, endpoint=endpoint)
+            observe('mekanai_db_seconds_per_request', db.seconds, endpoint=endpoint)
+        return response
+
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
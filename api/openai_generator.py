@@ -14,6 +14,7 @@ Usage:
 
 import requests
 import time
+from api import metrics
 
 
 class OpenAIGenerator:
@@ -64,10 +65,12 @@ class OpenAIGenerator:
                 },
                 timeout=self.timeout,
             )
+            metrics.record_transfer('openai', r)
             elapsed = round(time.time() - start, 1)
 
             if r.status_code != 200:
-                return {"error": self._parse_error(r)}
+                return {"error": self._parse_error(r), "status_code": r.status_code,
+                        "retry_after": r.headers.get("Retry-After")}
 
             data = r.json()
             images = data.get('data', [])
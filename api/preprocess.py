@@ -0,0 +1,154 @@
+"""
+api/preprocess.py
+MekanAI - ControlNet Preprocessing (OpenCV)
+
+Builds ControlNet control maps on the app server instead of the GPU box:
+edge / line extraction is cheap CPU work, and doing it here keeps the GPU
+backends busy with diffusion only. Maps are white lines on black, computed
+in the shared process pool and cached per source image + module, so
+re-rolling a seed on the same floor plan skips the preprocessing entirely.
+The cache keeps the `controlnet.cache_keep` most recently used maps.
+
+    canny            Canny edges
+    lineart          Thin dark-line extraction (sketches, drawings)
+    scribble         Thick, gap-closed strokes (rough hand sketches)
+    floorplan_walls  Long straight wall segments; text, hatching and
+                     furniture symbols are dropped
+
+Usage:
+    from api import preprocess
+    control_path = preprocess.run('canny', 'room.png')
+    gen.generate(..., source_image_path=control_path,
+                 controlnet_module=preprocess.CONTROL_TASK['canny'], preprocessed=True)
+"""
+import hashlib
+import os
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from config import config
+from api.cpu_pool import get_pool
+from api import metrics
+
+# Local module → ControlNet model task (SD WebUI / ComfyUI model lookup)
+CONTROL_TASK = {
+    'canny': 'canny',
+    'lineart': 'lineart',
+    'scribble': 'scribble',
+    'floorplan_walls': 'lineart',
+}
+
+# Modules only available here (no backend-side preprocessor)
+LOCAL_ONLY = {'floorplan_walls'}
+
+
+# ============================================
+# PREPROCESSORS (run in worker processes)
+# ============================================
+def _canny(cv2, gray):
+    gray = cv2.GaussianBlur(gray, (3, 3), 0)
+    return cv2.Canny(gray, 100, 200)
+
+
+def _lineart(cv2, gray):
+    # Dark strokes on light paper → white on black, locally thresholded
+    lines = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                  cv2.THRESH_BINARY_INV, 15, 8)
+    return cv2.morphologyEx(lines, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+
+
+def _scribble(cv2, gray):
+    lines = _lineart(cv2, cv2.GaussianBlur(gray, (5, 5), 0))
+    lines = cv2.morphologyEx(lines, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    return cv2.dilate(lines, np.ones((3, 3), np.uint8), iterations=2)
+
+
+def _floorplan_walls(cv2, gray):
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+
+    # Walls are long horizontal / vertical runs; text and symbols are not
+    run = max(15, min(gray.shape) // 40)
+    horizontal = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (run, 1)))
+    vertical = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, run)))
+    walls = cv2.bitwise_or(horizontal, vertical)
+
+    # Close door / window gaps at corners, drop leftover specks
+    walls = cv2.morphologyEx(walls, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(walls, connectivity=8)
+    keep = np.zeros(count, dtype=bool)
+    keep[1:] = np.maximum(stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT]) >= run * 2
+    return np.where(keep[labels], 255, 0).astype(np.uint8)
+
+
+PREPROCESSORS = {
+    'canny': _canny,
+    'lineart': _lineart,
+    'scribble': _scribble,
+    'floorplan_walls': _floorplan_walls,
+}
+
+
+def _process(module, source_path, target_path):
+    """Worker: read source, build control map, write PNG atomically"""
+    import cv2
+    gray = np.asarray(Image.open(source_path).convert('L'))
+    control = PREPROCESSORS[module](cv2, gray)
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    Image.fromarray(control).convert('RGB').save(tmp_path, format='PNG')
+    os.replace(tmp_path, target_path)
+    return target_path
+
+
+# ============================================
+# PUBLIC API
+# ============================================
+def is_local(module):
+    """True if this module should be preprocessed on the app server"""
+    if module in LOCAL_ONLY:
+        return True
+    return module in PREPROCESSORS and config.get('controlnet.local_preprocess', True)
+
+
+def run(module, source_path):
+    """
+    Control map for a source image (cached).
+
+    Returns:
+        Path (str) of the control PNG; raises on failure
+    """
+    if module not in PREPROCESSORS:
+        raise ValueError(f"Bilinmeyen ön işlemci: {module}")
+
+    digest = hashlib.sha256(Path(source_path).read_bytes()).hexdigest()
+    cache_dir = Path(config.get('controlnet.cache_dir', 'data/temp/control'))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    target = cache_dir / f"{digest[:32]}_{module}.png"
+    if target.exists():
+        metrics.cache('control_map', True)
+        try:
+            target.touch()          # recently used maps survive _prune
+        except OSError:
+            pass
+        return str(target)
+    metrics.cache('control_map', False)
+
+    path = get_pool().submit(_process, module, str(source_path), str(target)).result()
+    _prune(cache_dir)
+    return path
+
+
+def _prune(cache_dir):
+    """Keep the `controlnet.cache_keep` most recently used control maps"""
+    keep = config.get('controlnet.cache_keep', 500)
+    maps = []
+    for path in cache_dir.glob('*.png'):
+        try:
+            maps.append((path.stat().st_mtime, path))
+        except OSError:
+            pass                    # pruned by another worker meanwhile
+    maps.sort(reverse=True)
+    for _, path in maps[keep:]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
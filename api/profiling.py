@@ -0,0 +1,217 @@
+"""
+api/profiling.py
+MekanAI - Opt-in Request Profiling
+
+A profiled request runs under cProfile and logs the SQL it executes; both are
+written to `profiling.dir`:
+
+    <id>.prof   pstats dump (python -m pstats <file>, snakeviz)
+    <id>.json   method, path, status, duration, SQL log, top functions
+
+A request is profiled when it
+    - carries `X-Profile: <token>` (profiling.token, or the
+      MEKANAI_PROFILING_TOKEN environment variable), or
+    - is picked by `profiling.sample_rate` (share of requests, default 0)
+
+GET /debug/profiles lists the stored profiles and GET /debug/profiles/<file>
+downloads one; both need the token (X-Profile header or ?token=). Without a
+token only sampling works and profiles stay on the server. Profiled responses
+carry `X-Profile-Id`. SQL parameters are logged (truncated), so a profile of a
+settings write can hold an API key — treat the files like the database.
+
+One request per process is profiled at a time (the profiler hook is
+process-wide on newer Pythons); concurrent requests run unprofiled. Only the
+request thread is profiled. The SQL log is the request's api/sql_log.py
+statement log, switched on for profiled requests only; when nothing is
+profiled the cost is a header lookup per request.
+"""
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+from flask import abort, jsonify, request, send_from_directory
+from config import config
+from api import diagnostics
+from api import sql_log
+
+HEADER = 'X-Profile'
+TOP_FUNCTIONS = 40
+MAX_QUERIES = 1000
+SKIPPED_ENDPOINTS = ('static', 'metrics', 'profiles_list', 'profiles_download')
+_FILENAME = re.compile(r'^[\w.-]+\.(prof|json)$')
+
+_busy = threading.Lock()
+_active = threading.local()
+
+
+def _dir():
+    return Path(config.get('profiling.dir', 'data/profiles'))
+
+
+def _token():
+    return os.environ.get('MEKANAI_PROFILING_TOKEN') or config.get('profiling.token') or ''
+
+
+def _authorized(allow_query=False):
+    token = _token()
+    given = request.headers.get(HEADER) or (request.args.get('token') if allow_query else None) or ''
+    return bool(token) and hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8'))
+
+
+def _trigger():
+    """'header' | 'sample' | None for the current request"""
+    if request.endpoint in SKIPPED_ENDPOINTS:
+        return None
+    if request.headers.get(HEADER):
+        return 'header' if _authorized() else None
+    rate = config.get('profiling.sample_rate', 0)
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+# ============================================
+# CAPTURE
+# ============================================
+def _start(trigger):
+    if not _busy.acquire(blocking=False):
+        return
+    _active.trigger = trigger
+    _active.sql = sql_log.current() or sql_log.RequestStats()
+    _active.sql_before = (_active.sql.count, _active.sql.seconds)
+    _active.sql.log_queries(MAX_QUERIES)
+    _active.started = time.perf_counter()
+    _active.profiler = cProfile.Profile()
+    try:
+        _active.profiler.enable()
+    except ValueError:          # another profiler (e.g. a debugger) owns the hook
+        _active.profiler = _active.sql = None
+        _busy.release()
+
+
+def _finish(status):
+    """Stop profiling this thread's request and store it (returns the profile id)"""
+    profiler = getattr(_active, 'profiler', None)
+    if profiler is None:
+        return None
+    try:
+        profiler.disable()
+        duration = time.perf_counter() - _active.started
+        stats, (count, seconds) = _active.sql, _active.sql_before
+        sql = {
+            'count': stats.count - count,
+            'total_ms': round((stats.seconds - seconds) * 1000, 1),
+            'truncated': stats.count - count > len(stats.queries),
+            'queries': stats.queries,
+        }
+        return _save(profiler, sql, _active.trigger, status, duration)
+    except Exception as e:
+        print(f"[!] Profile save failed: {e}")
+        return None
+    finally:
+        _active.profiler = _active.sql = None
+        _busy.release()
+
+
+def _top_functions(profiler):
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+    return [{
+        'function': f"{name} ({Path(filename).name}:{line})" if line else name,
+        'calls': calls,
+        'own_ms': round(own * 1000, 3),
+        'cumulative_ms': round(cumulative * 1000, 3),
+    } for (filename, line, name), (_, calls, own, cumulative, _) in rows]
+
+
+def _save(profiler, sql, trigger, status, duration):
+    folder = _dir()
+    folder.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^a-z0-9]+', '-', request.path.lower()).strip('-')[:40] or 'root'
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method.lower()}-{slug}-{uuid4().hex[:6]}"
+    profiler.dump_stats(str(folder / f"{profile_id}.prof"))
+    report = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.path,
+        'query_string': request.query_string.decode('utf-8', 'replace'),
+        'endpoint': request.url_rule.rule if request.url_rule else None,
+        'status': status,
+        'trigger': trigger,
+        'duration_ms': round(duration * 1000, 1),
+        'pid': os.getpid(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sql': sql,
+        'top_functions': _top_functions(profiler),
+    }
+    (folder / f"{profile_id}.json").write_text(json.dumps(report, indent=1, ensure_ascii=False), encoding='utf-8')
+    _prune(folder)
+    diagnostics.note(f"Profiled {request.method} {request.path}: {report['duration_ms']} ms, "
+                     f"{sql['count']} queries → {profile_id}")
+    return profile_id
+
+
+def _prune(folder):
+    """Keep the newest `profiling.keep` profiles"""
+    keep = config.get('profiling.keep', 100)
+    reports = sorted(folder.glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in reports[keep:]:
+        for stale in (path, path.with_suffix('.prof')):
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+
+# ============================================
+# FLASK INTEGRATION
+# ============================================
+def init_app(app):
+    """Profiling hooks + GET /debug/profiles[/<file>] (needs api/sql_log.py installed first)"""
+    @app.before_request
+    def _start_profile():
+        trigger = _trigger()
+        if trigger:
+            _start(trigger)
+
+    @app.after_request
+    def _finish_profile(response):
+        profile_id = _finish(response.status_code)
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    @app.teardown_request
+    def _abort_profile(exception=None):
+        _finish(500)            # unhandled exception: after_request did not run
+
+    def profiles_list():
+        if not _authorized(allow_query=True):
+            abort(403 if _token() else 404)
+        items = []
+        for path in sorted(_dir().glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True):
+            try:
+                report = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            items.append({key: report.get(key) for key in
+                          ('id', 'method', 'path', 'status', 'trigger', 'duration_ms', 'created_at')})
+            items[-1]['sql_count'] = report.get('sql', {}).get('count')
+        return jsonify({'status': 'success', 'profiles': items})
+
+    def profiles_download(filename):
+        if not _authorized(allow_query=True):
+            abort(403 if _token() else 404)
+        if not _FILENAME.match(filename):
+            abort(404)
+        return send_from_directory(str(_dir().resolve()), filename, as_attachment=True)
+
+    app.add_url_rule('/debug/profiles', 'profiles_list', profiles_list)
+    app.add_url_rule('/debug/profiles/<filename>', 'profiles_download', profiles_download)
@@ -26,6 +26,11 @@ import time
 import json
 from pathlib import Path
 import models.ai_provider as provider_model
+from api import jobs
+from api import metrics
+from api import timing
+
+CANCELLED = {"error": "İş iptal edildi", "cancelled": True}
 
 
 class AIGenerator:
@@ -52,17 +57,27 @@ class AIGenerator:
     def _request(self, endpoint, payload):
         """Send request to SD WebUI and handle response"""
         url = self._get_base_url()
+        job = jobs.current()
         try:
+            if job and job.cancelled:
+                return dict(CANCELLED)
             start = time.time()
-            r = requests.post(
-                f"{url}{endpoint}",
-                json=payload,
-                timeout=self.timeout
-            )
+            with timing.stage('sampling'):
+                r = requests.post(
+                    f"{url}{endpoint}",
+                    json=payload,
+                    timeout=self.timeout
+                )
+            metrics.record_transfer('local', r)
+            # Interrupted via DELETE /api/jobs/<id> (possibly from another worker):
+            # discard the partial image
+            if job and job.poll_cancelled():
+                return dict(CANCELLED)
             r.raise_for_status()
             elapsed = round(time.time() - start, 1)
 
-            data = r.json()
+            with timing.stage('decode'):
+                data = r.json()
             if not data.get('images'):
                 return {"error": "Görsel oluşturulamadı - boş yanıt"}
 
@@ -83,7 +98,7 @@ class AIGenerator:
             }
 
         except requests.exceptions.ConnectionError:
-            return {"error": f"SD WebUI bağlantı hatası: {url}"}
+            return {"error": f"SD WebUI bağlantı hatası: {url}", "unreachable": True}
         except requests.exceptions.Timeout:
             return {"error": "Zaman aşımı - görsel oluşturma çok uzun sürdü"}
         except requests.exceptions.HTTPError as e:
@@ -111,7 +126,7 @@ class AIGenerator:
                  steps=30, cfg_scale=7.0, seed=-1, sampler="DPM++ SDE",
                  scheduler="Karras", source_image_path=None,
                  controlnet_module="depth_midas", controlnet_model="control_sd15_depth",
-                 controlnet_weight=1.0, denoising_strength=0.75):
+                 controlnet_weight=1.0, denoising_strength=0.75, preprocessed=False):
         """
         Generate image - with or without ControlNet source image.
 
@@ -125,6 +140,9 @@ class AIGenerator:
             source_image_path: Path to source room photo (optional)
             controlnet_module: ControlNet preprocessor (default: depth_midas)
             controlnet_model: ControlNet model name (default: control_sd15_depth)
+            preprocessed: source_image_path is already a control map
+                          (api/preprocess.py) — send it with module "none";
+                          controlnet_module then only picks the CN model
 
         Returns:
             dict with 'image_base64', 'seed', 'elapsed' on success
@@ -146,7 +164,8 @@ class AIGenerator:
 
         # ControlNet with source image
         if source_image_path:
-            img_b64 = self._encode_image(source_image_path)
+            with timing.stage('source'):
+                img_b64 = self._encode_image(source_image_path)
             if not img_b64:
                 return {"error": f"Kaynak görsel bulunamadı: {source_image_path}"}
 
@@ -158,7 +177,7 @@ class AIGenerator:
                     "args": [
                         {
                             "enabled": True,
-                            "module": controlnet_module,
+                            "module": "none" if preprocessed else controlnet_module,
                             "model": cn_model,
                             "weight": controlnet_weight,
                             "image": img_b64,
@@ -277,6 +296,15 @@ class AIGenerator:
 
     # ── Status & Info ────────────────────────────────
 
+    def interrupt(self):
+        """Stop the generation currently running on SD WebUI"""
+        try:
+            url = self._get_base_url()
+            r = requests.post(f"{url}/sdapi/v1/interrupt", timeout=5)
+            return r.status_code == 200
+        except Exception:
+            return False
+
     def check_connection(self):
         """Check if SD WebUI is reachable"""
         try:
@@ -344,17 +372,25 @@ class AIGenerator:
             "extras_upscaler_2_visibility": upscaler_2_visibility,
         }
 
+        job = jobs.current()
         try:
+            if job and job.cancelled:
+                return dict(CANCELLED)
             start = time.time()
-            r = requests.post(
-                f"{url}/sdapi/v1/extra-single-image",
-                json=payload,
-                timeout=self.timeout
-            )
+            with timing.stage('sampling'):
+                r = requests.post(
+                    f"{url}/sdapi/v1/extra-single-image",
+                    json=payload,
+                    timeout=self.timeout
+                )
+            metrics.record_transfer('local', r)
+            if job and job.poll_cancelled():
+                return dict(CANCELLED)
             r.raise_for_status()
             elapsed = round(time.time() - start, 1)
 
-            data = r.json()
+            with timing.stage('decode'):
+                data = r.json()
             image = data.get('image')
             if not image:
                 return {"error": "Upscale sonucu boş döndü"}
@@ -365,7 +401,7 @@ class AIGenerator:
             }
 
         except requests.exceptions.ConnectionError:
-            return {"error": f"SD WebUI bağlantı hatası: {url}"}
+            return {"error": f"SD WebUI bağlantı hatası: {url}", "unreachable": True}
         except requests.exceptions.Timeout:
             return {"error": "Zaman aşımı - upscale işlemi çok uzun sürdü"}
         except requests.exceptions.HTTPError as e:
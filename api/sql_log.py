@@ -0,0 +1,155 @@
+"""
+api/sql_log.py
+MekanAI - Per-Request SQL Accounting
+
+SQLAlchemy cursor events count and time every statement of a request:
+
+    Server-Timing      response header `db;dur=<ms>;desc="<n> queries", total;dur=<ms>`
+                       (browser devtools → Network → Timing)
+    slow statements    any statement over `sql_log.slow_ms` is printed with the
+                       app call site that issued it (also outside requests)
+    query count        requests over `sql_log.max_queries` statements are printed
+    repeats            a statement run `sql_log.repeat_warn` times in one request
+                       (lazy loads in a loop, N+1) is printed once, with its call site
+
+Warnings go through api/diagnostics.py (off with system.log_level: error).
+These are the app's only cursor listeners: api/metrics.py reads the
+per-request totals for its DB histograms and api/profiling.py the statement
+log of a profiled request, so this is installed before both (after_request
+hooks run in reverse order).
+
+Usage:
+    stats = sql_log.current()       # RequestStats of this thread's request, or None
+    stats.count, stats.seconds
+    stats.log_queries(1000)         # also keep each statement: stats.queries
+"""
+import threading
+import time
+import traceback
+from pathlib import Path
+from flask import request
+from config import config
+from api import diagnostics
+
+_ROOT = str(Path(__file__).resolve().parent.parent)
+_SELF = str(Path(__file__).resolve())
+
+_settings = {'slow': 0.1, 'max_queries': 50, 'repeat_warn': 10, 'server_timing': True, 'stack_depth': 3}
+_request = threading.local()
+
+
+class RequestStats:
+    """SQL totals of one request"""
+    __slots__ = ('started', 'count', 'seconds', 'repeats', 'repeated', 'queries', 'query_limit')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.seconds = 0.0
+        self.repeats = {}           # statement → executions
+        self.repeated = []          # (statement, call site) that hit repeat_warn
+        self.queries = None         # statement log, only when asked for (log_queries)
+        self.query_limit = 0
+
+    def log_queries(self, limit):
+        """From now on also keep each statement as {'sql', 'params', 'ms'}, up to `limit`"""
+        self.queries = []
+        self.query_limit = limit
+
+
+def current():
+    return getattr(_request, 'stats', None)
+
+
+def call_site():
+    """Innermost app frames (project files outside site-packages) of the current stack"""
+    frames = [f for f in traceback.extract_stack()[:-1]
+              if f.filename.startswith(_ROOT) and f.filename != _SELF and 'site-packages' not in f.filename]
+    depth = _settings['stack_depth']
+    return ' ← '.join(f"{Path(f.filename).relative_to(_ROOT).as_posix()}:{f.lineno} {f.name}"
+                      for f in reversed(frames[-depth:])) or 'unknown'
+
+
+def _short(statement, limit=300):
+    text = ' '.join(statement.split())
+    return text if len(text) <= limit else text[:limit] + '…'
+
+
+def _params(parameters, limit=200):
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + '…'
+
+
+# ============================================
+# CURSOR EVENTS
+# ============================================
+# The start time lives on the statement's execution context, which is dropped
+# with the statement — one that raises leaves nothing behind on the connection
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._sql_log_start = time.perf_counter()
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_sql_log_start', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = current()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        runs = stats.repeats[statement] = stats.repeats.get(statement, 0) + 1
+        if runs == _settings['repeat_warn']:
+            stats.repeated.append((statement, call_site()))
+        if stats.queries is not None and len(stats.queries) < stats.query_limit:
+            stats.queries.append({'sql': statement, 'params': _params(parameters), 'ms': round(elapsed * 1000, 3)})
+    if _settings['slow'] and elapsed >= _settings['slow'] and diagnostics.enabled('warning'):
+        where = f"{request.method} {request.path}" if stats is not None else 'background'
+        diagnostics.warn(f"Slow SQL {elapsed * 1000:.1f} ms ({where}) at {call_site()}: {_short(statement)}")
+
+
+# ============================================
+# FLASK INTEGRATION
+# ============================================
+def init_app(app):
+    """Cursor events + per-request stats, Server-Timing and warnings"""
+    from sqlalchemy import event
+    from models.base import engine
+
+    _settings.update(
+        slow=(config.get('sql_log.slow_ms', 100) or 0) / 1000,
+        max_queries=config.get('sql_log.max_queries', 50) or 0,
+        repeat_warn=config.get('sql_log.repeat_warn', 10) or 0,
+        server_timing=config.get('sql_log.server_timing', True),
+        stack_depth=config.get('sql_log.stack_depth', 3),
+    )
+    event.listen(engine, 'before_cursor_execute', _before_cursor)
+    event.listen(engine, 'after_cursor_execute', _after_cursor)
+
+    @app.before_request
+    def _start_sql_stats():
+        _request.stats = RequestStats()
+
+    @app.after_request
+    def _report_sql_stats(response):
+        stats = current()
+        if stats is None:
+            return response
+        if _settings['server_timing']:
+            total = (time.perf_counter() - stats.started) * 1000
+            response.headers.add('Server-Timing', f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"')
+            response.headers.add('Server-Timing', f'total;dur={total:.1f}')
+        if request.endpoint == 'static':
+            return response
+        if _settings['max_queries'] and stats.count > _settings['max_queries']:
+            diagnostics.warn(f"{request.method} {request.path}: {stats.count} SQL statements "
+                             f"({stats.seconds * 1000:.0f} ms)")
+        for statement, site in stats.repeated:
+            diagnostics.warn(f"{request.method} {request.path}: statement ran {stats.repeats[statement]}× "
+                             f"(N+1?) at {site}: {_short(statement, 160)}")
+        return response
+
+    @app.teardown_request
+    def _clear_sql_stats(exception=None):
+        _request.stats = None
@@ -14,11 +14,15 @@ Usage:
     gen = StabilityGenerator(api_key="...", base_url="https://api.stability.ai/v2beta")
     result = gen.generate(prompt="modern living room", model_id="stable-image-core")
     result = gen.upscale(image_base64="...", prompt="high quality interior")
+    # Large outputs: stream straight into the blob store, no base64 in memory
+    result = gen.upscale(image_path="room.png", to_store=True)   # → 'content_hash'
 """
 
 import requests
 import base64
 import time
+import models.image_store as image_store
+from api import metrics
 
 
 class StabilityGenerator:
@@ -108,8 +112,9 @@ class StabilityGenerator:
 
         return self._post_request(url, data, files=files)
 
-    def upscale(self, image_base64, prompt="", negative_prompt="",
-                creativity=0.35, seed=-1, output_format="png"):
+    def upscale(self, image_base64=None, prompt="", negative_prompt="",
+                creativity=0.35, seed=-1, output_format="png",
+                image_path=None, to_store=False):
         """
         Upscale image via Conservative Upscale endpoint.
         Scales from 64x64 up to 4K resolution (20-40x).
@@ -118,10 +123,17 @@ class StabilityGenerator:
             image_base64: Base64-encoded source image
             prompt: Description of desired output
             creativity: Detail generation (0 to 0.35, default 0.35)
+            image_path: Source image file (instead of image_base64)
+            to_store: Stream the result into the blob store and return
+                      'content_hash' instead of 'image_base64'
         """
         url = f"{self.base_url}/stable-image/upscale/conservative"
 
-        image_bytes = base64.b64decode(image_base64)
+        if image_path:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+        else:
+            image_bytes = base64.b64decode(image_base64)
 
         data = {
             "output_format": output_format,
@@ -139,10 +151,10 @@ class StabilityGenerator:
             "image": ("source.png", image_bytes, "image/png"),
         }
 
-        return self._post_request(url, data, files=files)
+        return self._post_request(url, data, files=files, to_store=to_store)
 
-    def _post_request(self, url, data, files=None):
-        """Execute API request and return result"""
+    def _post_request(self, url, data, files=None, to_store=False):
+        """Execute API request and return result (to_store: stream body to blob store)"""
         if not files:
             files = {"none": ''}
 
@@ -157,21 +169,24 @@ class StabilityGenerator:
                 files=files,
                 data=data,
                 timeout=self.timeout,
+                stream=to_store,
             )
-            elapsed = round(time.time() - start, 1)
+            metrics.record_transfer('stability', r, streamed=to_store)
 
             if r.status_code != 200:
-                return {"error": self._parse_error(r)}
+                return {"error": self._parse_error(r), "status_code": r.status_code,
+                        "retry_after": r.headers.get("Retry-After")}
 
             # Response is raw image bytes
-            image_b64 = base64.b64encode(r.content).decode('utf-8')
             result_seed = r.headers.get('seed')
-
-            return {
-                "image_base64": image_b64,
-                "seed": int(result_seed) if result_seed else None,
-                "elapsed": elapsed,
-            }
+            result = {"seed": int(result_seed) if result_seed else None}
+            if to_store:
+                with r:
+                    result["content_hash"] = image_store.put_response(r)
+            else:
+                result["image_base64"] = base64.b64encode(r.content).decode('utf-8')
+            result["elapsed"] = round(time.time() - start, 1)
+            return result
 
         except requests.exceptions.ConnectionError:
             return {"error": "Stability AI bağlantı hatası"}
@@ -0,0 +1,246 @@
+"""
+api/tiled_upscale.py
+MekanAI - Tiled Upscale Pipeline
+
+Splits a large image into overlapping tiles, upscales them in parallel on
+every available backend (SD WebUI, ComfyUI, ...) and blends the seams with
+complementary linear feathering in NumPy. Output is assembled band by band
+(one row of tiles at a time), so peak memory is the uint8 result plus two
+float32 bands — enough for 8K+ print renders.
+
+The whole tile loop is one batch-priority job per backend it uses (api/jobs.py),
+so it respects backend slots and fair scheduling. The first job carries the
+request's job_id; DELETE /api/jobs/<job_id> stops the loop before the next tile.
+
+Usage:
+    from api.tiled_upscale import upscale_tiled
+    image = upscale_tiled(Image.open("room.png"), scale=4, backends=['local', 'comfyui'],
+                          options={'upscaler_1': 'R-ESRGAN 4x+'}, job_id=job_id)
+"""
+import base64
+import io
+import math
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from uuid import uuid4
+import numpy as np
+from PIL import Image
+from config import config
+from api import health
+from api import jobs
+from api import timing
+
+
+# ============================================
+# BACKENDS
+# ============================================
+def _sd_backend(options):
+    from api.generate import get_generator
+    gen = get_generator()
+
+    def run(tile_b64, scale):
+        return gen.upscale(
+            image_base64=tile_b64,
+            upscaler_1=options.get('upscaler_1', 'R-ESRGAN 4x+'),
+            upscaling_resize=scale,
+            upscaler_2=options.get('upscaler_2', ''),
+            upscaler_2_visibility=options.get('upscaler_2_visibility', 0.0),
+        )
+    return run
+
+
+def _comfyui_backend(options):
+    from api.comfyui_generator import ComfyUIGenerator
+    gen = ComfyUIGenerator()
+
+    def run(tile_b64, scale):
+        return gen.upscale(
+            image_base64=tile_b64,
+            upscale_model=options.get('upscale_model', ''),
+            scale=scale,
+        )
+    return run
+
+
+# Provider key → factory(options) → run(tile_base64, scale) -> result dict
+BACKENDS = {
+    'local': _sd_backend,
+    'comfyui': _comfyui_backend,
+}
+
+
+def available_backends(requested=None):
+    """Requested (or all known) backends whose circuit is not open"""
+    keys = requested or list(BACKENDS)
+    return [key for key in keys if key in BACKENDS and health.allow(key)]
+
+
+@contextmanager
+def backend_jobs(backends, job_id=None, project_id=None, priority='batch'):
+    """Hold one job (slot) on each backend for the whole tile loop.
+
+    Slots are taken in sorted backend order, so two tiled upscales can never
+    each hold a backend the other is waiting for. Yields the held jobs.
+    """
+    job_id = job_id or uuid4().hex
+    with ExitStack() as stack:
+        held = []
+        for i, key in enumerate(sorted(backends)):
+            held.append(stack.enter_context(jobs.run(
+                key, 'upscale', job_id=job_id if i == 0 else f"{job_id[:48]}.{key}",
+                project_id=project_id, priority=priority)))
+        yield held
+
+
+# ============================================
+# GEOMETRY
+# ============================================
+def tile_positions(length, tile, overlap):
+    """Start offsets of tiles covering [0, length) with at least `overlap` px shared"""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    step = (length - tile) / (count - 1)
+    return [round(i * step) for i in range(count)]
+
+
+def _axis_weights(size, overlap_before, overlap_after, feather):
+    """1-D blend weights for one tile axis.
+
+    Inside each overlap a linear ramp of width min(overlap, feather) sits in
+    the middle of the shared region; the neighbour uses the mirrored ramp,
+    so the two weights always sum to exactly 1 (no normalization pass).
+    """
+    weights = np.ones(size, dtype=np.float32)
+    if overlap_before:
+        ramp = min(overlap_before, feather)
+        start = (overlap_before - ramp) // 2
+        weights[:start] = 0
+        weights[start:start + ramp] = (np.arange(ramp, dtype=np.float32) + 0.5) / ramp
+    if overlap_after:
+        ramp = min(overlap_after, feather)
+        start = size - overlap_after + (overlap_after - ramp) // 2
+        weights[start:start + ramp] *= 1 - (np.arange(ramp, dtype=np.float32) + 0.5) / ramp
+        weights[start + ramp:] = 0
+    return weights
+
+
+# ============================================
+# PIPELINE
+# ============================================
+def _encode_png(image):
+    buf = io.BytesIO()
+    image.save(buf, format='PNG')
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+
+def upscale_tiled(image, scale, backends, options=None,
+                  tile=None, overlap=None, feather=None, job_id=None, project_id=None):
+    """
+    Upscale a PIL image tile by tile across backends.
+
+    Args:
+        image: PIL.Image (converted to RGB)
+        scale: Integer scale factor
+        backends: Provider keys to spread tiles over (see BACKENDS)
+        options: Backend options (upscaler_1, upscale_model, ...)
+        tile/overlap/feather: Source-pixel tile geometry (default: upscale.* config)
+        job_id/project_id: Job identity for the backend slots (see backend_jobs)
+
+    Returns:
+        PIL.Image on success, raises RuntimeError if a tile fails on every backend,
+        jobs.JobCancelled / QueueTimeout / QueueFull from the job queue
+    """
+    with backend_jobs(backends, job_id, project_id) as held, timing.stage('tiles'):
+        return _run_tiles(image, scale, backends, options or {}, tile, overlap, feather, held)
+
+
+def _run_tiles(image, scale, backends, options, tile, overlap, feather, held):
+    scale = int(scale)
+    tile = tile or config.get('upscale.tile_size', 512)
+    overlap = min(overlap or config.get('upscale.tile_overlap', 32), tile // 4)
+    feather = (feather or config.get('upscale.tile_feather', 24)) * scale
+
+    image = image.convert('RGB')
+    width, height = image.size
+    out_w, out_h = width * scale, height * scale
+    xs = tile_positions(width, tile, overlap)
+    ys = tile_positions(height, tile, overlap)
+    tile_w, tile_h = min(tile, width), min(tile, height)
+
+    # Each backend handles one tile at a time; workers take whichever is free
+    runners = queue.Queue()
+    for key in backends:
+        runners.put((key, BACKENDS[key](options)))
+
+    def check_cancelled():
+        if any(job.cancelled for job in held):
+            raise jobs.JobCancelled(held[0].id)
+
+    def upscale_one(box):
+        check_cancelled()
+        crop_b64 = _encode_png(image.crop(box))
+        tried = []
+        for _ in range(len(backends)):
+            key, run = runners.get()
+            try:
+                check_cancelled()       # between tiles (and before a retry on another backend)
+                result = run(crop_b64, scale)
+            finally:
+                runners.put((key, run))
+            health.record(key, result)
+            if 'error' not in result:
+                out = Image.open(io.BytesIO(base64.b64decode(result['image_base64']))).convert('RGB')
+                expected = ((box[2] - box[0]) * scale, (box[3] - box[1]) * scale)
+                if out.size != expected:
+                    out = out.resize(expected, Image.LANCZOS)
+                return np.asarray(out)
+            tried.append(f"{key}: {result['error']}")
+        raise RuntimeError(f"Tile {box} upscale edilemedi — " + '; '.join(tried))
+
+    print(f"[*] Tiled upscale {width}x{height} → {out_w}x{out_h}: "
+          f"{len(xs) * len(ys)} tiles on {', '.join(backends)}")
+
+    canvas = np.empty((out_h, out_w, 3), dtype=np.uint8)
+    pending = None          # weighted rows shared with the next band
+    executor = ThreadPoolExecutor(max_workers=len(backends))
+    try:
+        rows = {}
+
+        def submit_row(r):
+            if r < len(ys) and r not in rows:
+                rows[r] = [executor.submit(upscale_one, (x, ys[r], x + tile_w, ys[r] + tile_h)) for x in xs]
+
+        submit_row(0)
+        for r, y in enumerate(ys):
+            submit_row(r + 1)       # prefetch one row: bounded memory, backends stay busy
+            band_top = y * scale
+            band = np.zeros((tile_h * scale, out_w, 3), dtype=np.float32)
+            for c, x in enumerate(xs):
+                pixels = rows[r][c].result()
+                wx = _axis_weights(
+                    tile_w * scale,
+                    (xs[c - 1] + tile_w - x) * scale if c > 0 else 0,
+                    (x + tile_w - xs[c + 1]) * scale if c + 1 < len(xs) else 0,
+                    feather,
+                )
+                band[:, x * scale:(x + tile_w) * scale] += pixels * wx[None, :, None]
+                rows[r][c] = None
+
+            overlap_above = (ys[r - 1] + tile_h - y) * scale if r > 0 else 0
+            overlap_below = (y + tile_h - ys[r + 1]) * scale if r + 1 < len(ys) else 0
+            band *= _axis_weights(tile_h * scale, overlap_above, overlap_below, feather)[:, None, None]
+            if pending is not None:
+                band[:len(pending)] += pending
+
+            # Rows below the next band's start are final
+            done = band.shape[0] - overlap_below
+            canvas[band_top:band_top + done] = np.clip(band[:done] + 0.5, 0, 255).astype(np.uint8)
+            pending = band[done:] if overlap_below else None
+            del rows[r]
+    finally:
+        # Error / cancel: drop the prefetched tiles that have not started yet
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return Image.fromarray(canvas)
@@ -0,0 +1,101 @@
+"""
+api/timing.py
+MekanAI - Per-Stage Job Timing
+
+`elapsed` from the generators is one number, measured differently by each
+backend. A timeline breaks a generate / upscale request into stages (s):
+
+    prompt         prompt + style / perspective / lighting snippet assembly
+    db_lookup      model / provider rows
+    model_load     SD WebUI checkpoint switch
+    source         source image load, decode of uploaded base64, encode for the backend
+    preprocess     ControlNet map on the app server (api/preprocess.py)
+    upload         source image upload to the backend (ComfyUI)
+    queue          wait for a local backend slot (api/jobs.py)
+    backend_queue  ComfyUI: queued on the server before execution started
+    sampling       backend execution (SD WebUI: the whole txt2img round trip)
+    backend        opaque cloud API call
+    download       output image download (ComfyUI; streamed into the blob store
+                   when saving to a project)
+    decode         backend response parsing (SD WebUI JSON)
+    tiles          tiled upscale: tile round trips + seam blending (api/tiled_upscale.py)
+    coalesce       wait for an identical in-flight request (api/coalesce.py)
+    write          blob store write
+    db_commit      images row insert
+    other          everything not covered above
+    total          wall time of the request so far
+
+The breakdown is returned as `timings` and stored in the image's settings
+(written before the row is committed, so the stored copy has no db_commit).
+
+Usage:
+    with timing.record() as timeline:
+        with timing.stage('prompt'):
+            ...
+        timeline.as_dict()
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ('prompt', 'db_lookup', 'model_load', 'source', 'preprocess', 'upload', 'queue', 'backend_queue',
+          'sampling', 'backend', 'download', 'decode', 'tiles', 'coalesce', 'write', 'db_commit')
+
+_current = threading.local()
+
+
+class Timeline:
+    """Accumulated stage durations of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self):
+        total = time.perf_counter() - self.started
+        ordered = [name for name in STAGES if name in self.stages]
+        ordered += [name for name in self.stages if name not in STAGES]
+        result = {name: round(self.stages[name], 3) for name in ordered}
+        result['other'] = round(max(0.0, total - sum(self.stages.values())), 3)
+        result['total'] = round(total, 3)
+        return result
+
+
+def current():
+    """Timeline of the request on this thread (None outside timing.record)"""
+    return getattr(_current, 'timeline', None)
+
+
+@contextmanager
+def record():
+    """Collect stage timings for the body on this thread"""
+    previous = current()
+    timeline = _current.timeline = Timeline()
+    try:
+        yield timeline
+    finally:
+        _current.timeline = previous
+
+
+@contextmanager
+def stage(name):
+    """Time the body as `name` (no-op outside timing.record)"""
+    timeline = current()
+    if timeline is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timeline.add(name, time.perf_counter() - start)
+
+
+def add(name, seconds):
+    """Record a span measured elsewhere (queue wait, backend-reported times)"""
+    timeline = current()
+    if timeline is not None:
+        timeline.add(name, seconds)
@@ -7,24 +7,26 @@ Modular architecture:
     - Views:  views/ (page routes)
     - API:    api/   (REST endpoints)
 """
+import os
+import sys
 from flask import Flask, session
 from dotenv import load_dotenv
-from config import Config
+from config import config as app_config
 
 # .env dosyasından API key'leri yükle (DB'de yoksa env'den okunur)
 load_dotenv('configs/.env')
 
-# Import blueprints
-from views import create_views_blueprint
-from api import create_api_blueprint
-from models.base import init_db, shutdown_session
-
 
 def create_app():
     """Application factory"""
-
-    # Load configuration
-    config = Config()
+    # Imported here so that importing this module (CPU pool workers, see the
+    # guard below) does not pull in the views, API and database engine
+    from views import create_views_blueprint
+    from api import create_api_blueprint
+    from models.base import init_db, shutdown_session
+
+    # Configuration is parsed once at import (config.config) and shared
+    config = app_config
     config.validate()
     config.ensure_directories()
 
@@ -56,6 +58,20 @@ def create_app():
     # Error handlers
     register_error_handlers(app)
 
+    # Per-request SQL count / time, slow-query log, Server-Timing (before metrics: it reads the totals)
+    from api import sql_log
+    sql_log.init_app(app)
+
+    # Prometheus metrics (GET /metrics)
+    if config.get('metrics.enabled', True):
+        from api import metrics
+        metrics.init_app(app)
+
+    # Opt-in request profiling (X-Profile header / sampling)
+    if config.get('profiling.enabled', True):
+        from api import profiling
+        profiling.init_app(app)
+
     @app.after_request
     def add_headers(response):
         # Cache static files (CSS, JS, images, fonts)
@@ -86,10 +102,57 @@ def register_error_handlers(app):
                              error_message='Sunucu hatası'), 500
 
 
-# Create app instance
-app = create_app()
+def profile_startup(top=15):
+    """
+    Measure a cold `import app` in a fresh interpreter (python -X importtime)
+    and report the slowest modules. Returns exit code 1 if the wall time
+    exceeds system.startup_budget_ms.
+    """
+    import subprocess
+    import time
+
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        print("[-] Startup profile failed")
+        return 1
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+
+    print(f"\n{'self ms':>9} {'cumul ms':>9}  module")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[:top]:
+        print(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {name}")
+
+    budget_ms = app_config.get('system.startup_budget_ms', 2000)
+    print(f"\n[i] Cold start: {wall_ms:.0f} ms (budget {budget_ms} ms)")
+    if wall_ms > budget_ms:
+        print("[-] Startup budget exceeded")
+        return 1
+    print("[+] Startup within budget")
+    return 0
+
+
+# Create app instance. Spawned CPU pool workers (api/cpu_pool.py) re-import the
+# main module as __mp_main__; they must not build their own app.
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
+    if '--profile-startup' in sys.argv:
+        sys.exit(profile_startup())
+
     config = app.config['APP_CONFIG']
     host = config.get('server.host', '0.0.0.0')
     port = config.get('server.port', 5000)
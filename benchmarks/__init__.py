@@ -0,0 +1,4 @@
+"""
+MekanAI Benchmarks
+Run from the project root: python -m benchmarks.<name>
+"""
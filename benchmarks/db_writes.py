@@ -0,0 +1,121 @@
+"""
+benchmarks/db_writes.py
+MekanAI - Concurrent image_model.create throughput (SQLite)
+
+Compares the original connection setup ("before": WAL + foreign_keys only,
+no write serialization, no retries) with the configured tuning profile
+("after") on a throwaway database.
+
+Usage:
+    python -m benchmarks.db_writes
+    python -m benchmarks.db_writes --threads 16 --per-thread 200 --processes 2
+"""
+import argparse
+import multiprocessing
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from config import config
+import models.base as base
+import models.image as image_model
+import models.project as project_model
+from models.project import Project
+
+
+SCENARIOS = {
+    'before': ({'profile': 'legacy'}, {'serialize': False, 'retries': 0}),
+    'after': (config.get('database.sqlite', {}) or {'profile': 'tuned'},
+              {'serialize': True, 'retries': 5}),
+}
+
+
+def _bind(db_path, sqlite_cfg, policy):
+    """Point the shared scoped session at a fresh engine for this scenario"""
+    base.db_session.remove()
+    base.engine = base.create_db_engine(db_path, sqlite_cfg)
+    base.db_session.configure(bind=base.engine)
+    base.write_policy.update(policy)
+
+
+def _writer(project_id, count, stats, lock):
+    ok = failed = 0
+    for i in range(count):
+        try:
+            # Same read-then-write shape as a generation save in api/generate.py
+            project_model.get_by_id(project_id)
+            image_model.create(project_id, f"bench_{threading.get_ident()}_{i}.png",
+                               settings={'source': 'benchmark', 'i': i})
+            ok += 1
+        except Exception:
+            base.db_session.rollback()
+            failed += 1
+    base.db_session.remove()
+    with lock:
+        stats['ok'] += ok
+        stats['failed'] += failed
+
+
+def _run_threads(db_path, sqlite_cfg, policy, project_id, threads, per_thread):
+    _bind(db_path, sqlite_cfg, policy)
+    stats = {'ok': 0, 'failed': 0}
+    lock = threading.Lock()
+    workers = [threading.Thread(target=_writer, args=(project_id, per_thread, stats, lock))
+               for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return stats
+
+
+def _process_entry(args):
+    return _run_threads(*args)
+
+
+def run_scenario(name, threads, per_thread, processes):
+    sqlite_cfg, policy = SCENARIOS[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'bench.db'
+        _bind(db_path, sqlite_cfg, policy)
+        base.Base.metadata.create_all(bind=base.engine)
+        project = Project(name='bench', folder_name='bench')
+        base.db_session.add(project)
+        base.db_session.commit()
+        project_id = project.id
+        base.db_session.remove()
+
+        job = (db_path, sqlite_cfg, policy, project_id, threads, per_thread)
+        start = time.perf_counter()
+        if processes > 1:
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(processes) as pool:
+                results = pool.map(_process_entry, [job] * processes)
+        else:
+            results = [_run_threads(*job)]
+        elapsed = time.perf_counter() - start
+        base.engine.dispose()
+
+    ok = sum(r['ok'] for r in results)
+    failed = sum(r['failed'] for r in results)
+    return {'scenario': name, 'ok': ok, 'failed': failed,
+            'elapsed': elapsed, 'rows_per_sec': ok / elapsed if elapsed else 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--per-thread', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"[*] {args.processes} process(es) × {args.threads} threads × {args.per_thread} creates\n")
+    print(f"{'scenario':<10} {'ok':>7} {'failed':>7} {'seconds':>9} {'rows/s':>9}")
+    for name in ('before', 'after'):
+        r = run_scenario(name, args.threads, args.per_thread, args.processes)
+        print(f"{r['scenario']:<10} {r['ok']:>7} {r['failed']:>7} {r['elapsed']:>9.2f} {r['rows_per_sec']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+"""
+benchmarks/loadtest.py
+MekanAI - Mixed-workload load test with ramp-up
+
+Virtual users loop over weighted actions with a random think time in between:
+
+    browse     GET /canvas, /projects or /projects/<id>
+    image      GET /projects/<id>/images/<file>
+    generate   POST /api/generate-image (local / comfyui / cloud models in turn)
+    upload     POST /api/projects/<id>/upload (one image)
+    settings   GET /api/settings/styles + PUT of one style (same values)
+
+Users ramp from --start-users by --step-users every --step-seconds up to
+--max-users. Reported: per-step throughput / latency / error rate, per-route
+percentiles, and the saturation point — the first step where throughput grows
+by less than a quarter of the users added (+50 % users → under +12.5 % req/s),
+or errors pass 1 %.
+
+Without --url the app runs in-process against benchmarks/mock_backends.py on a
+throwaway data directory (see benchmarks/pipeline.py), so it runs on a laptop.
+With --url it targets a running instance; point its providers at
+`python -m benchmarks.mock_backends` first, or `generate` hits real backends.
+It creates a "loadtest" project there (or uses --project-id).
+
+Usage:
+    python -m benchmarks.loadtest
+    python -m benchmarks.loadtest --mix browse=60,image=30,generate=10 --max-users 64 --step-seconds 20
+    python -m benchmarks.loadtest --url http://localhost:5000 --json loadtest.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from config import config
+from benchmarks.mock_backends import MockBackends, parse_size
+from benchmarks.pipeline import (PROVIDER_MIX, generate_payload, git_commit, isolate, percentile,
+                                 start_app, upload_files)
+
+ACTIONS = ('browse', 'image', 'generate', 'upload', 'settings')
+DEFAULT_MIX = 'browse=45,image=25,generate=10,upload=10,settings=10'
+
+# Throughput gain below this share of the user gain between steps → saturated
+SATURATION_SCALING = 0.25
+SATURATION_ERRORS = 0.01
+
+
+def parse_mix(value):
+    """'browse=45,image=25,...' → {action: weight}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"unknown action '{name}' (choose from {', '.join(ACTIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ============================================
+# RECORDING
+# ============================================
+class _Stats:
+    """Latencies per (ramp step, route)"""
+
+    def __init__(self):
+        self.step = 0
+        self.samples = {}           # (step, route) → [latencies]
+        self.errors = {}            # (step, route) → count
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def record(self, step, route, elapsed, error=None):
+        key = (step, route)
+        with self._lock:
+            self.samples.setdefault(key, []).append(elapsed)
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + 1
+                self.last_error = error
+
+    def by_step(self, step):
+        latencies = [x for (s, _), values in self.samples.items() if s == step for x in values]
+        errors = sum(count for (s, _), count in self.errors.items() if s == step)
+        return latencies, errors
+
+    def by_route(self):
+        routes = {}
+        for (_, route), values in self.samples.items():
+            routes.setdefault(route, []).extend(values)
+        errors = {}
+        for (_, route), count in self.errors.items():
+            errors[route] = errors.get(route, 0) + count
+        return routes, errors
+
+
+class _Client:
+    """Shared target state + one timed request helper"""
+
+    def __init__(self, base_url, project_id, image_size, stats):
+        self.base_url = base_url
+        self.project_id = project_id
+        self.image_size = image_size
+        self.stats = stats
+        self.filenames = []
+        self.styles = []
+        self._upload_seq = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, route, path, **kwargs):
+        """Time one request; `route` is the label it is reported under"""
+        step = self.stats.step
+        start = time.perf_counter()
+        error = None
+        r = None
+        try:
+            r = requests.request(method, self.base_url + path, timeout=300, **kwargs)
+            if r.status_code >= 400:
+                error = f"HTTP {r.status_code} {method} {path}"
+            elif r.headers.get('Content-Type', '').startswith('application/json') \
+                    and r.json().get('status') == 'error':
+                error = f"{method} {path}: {r.json().get('message')}"
+        except (requests.RequestException, ValueError) as e:
+            error = f"{method} {path}: {e}"
+        self.stats.record(step, f"{method} {route}", time.perf_counter() - start, error)
+        return None if error else r
+
+    def next_upload_seed(self):
+        with self._lock:
+            self._upload_seq += 1
+            return self._upload_seq
+
+
+# ============================================
+# ACTIONS
+# ============================================
+def _browse(client, rng):
+    page = rng.choice(('/canvas', '/projects', '/projects/<id>'))
+    client.request('GET', page, page.replace('<id>', str(client.project_id)))
+
+
+def _image(client, rng):
+    if not client.filenames:
+        return _browse(client, rng)
+    name = rng.choice(client.filenames)
+    client.request('GET', '/projects/<id>/images/<file>', f"/projects/{client.project_id}/images/{name}")
+
+
+def _generate(client, rng):
+    _, model = rng.choice(PROVIDER_MIX)
+    client.request('POST', '/api/generate-image', '/api/generate-image',
+                   json=generate_payload(model, client.project_id, client.image_size))
+
+
+def _upload(client, rng):
+    files = upload_files(1, client.image_size, client.next_upload_seed())
+    r = client.request('POST', '/api/projects/<id>/upload', f"/api/projects/{client.project_id}/upload",
+                       files=files)
+    if r is not None:
+        with client._lock:
+            client.filenames.extend(r.json().get('saved', []))
+
+
+def _settings(client, rng):
+    r = client.request('GET', '/api/settings/<table>', '/api/settings/styles')
+    styles = r.json().get('items', []) if r is not None else client.styles
+    if styles:
+        style = rng.choice(styles)
+        client.request('PUT', '/api/settings/<table>/<id>', f"/api/settings/styles/{style['id']}",
+                       json={'name': style['name']})
+
+
+RUNNERS = {
+    'browse': _browse,
+    'image': _image,
+    'generate': _generate,
+    'upload': _upload,
+    'settings': _settings,
+}
+
+
+def _user(client, mix, think, stop, seed):
+    rng = random.Random(seed)
+    actions, weights = list(mix), list(mix.values())
+    while not stop.is_set():
+        RUNNERS[rng.choices(actions, weights)[0]](client, rng)
+        if think > 0:
+            stop.wait(rng.expovariate(1 / think))
+
+
+# ============================================
+# RUN
+# ============================================
+def _prepare(base_url, project_id, image_size, stats):
+    if project_id is None:
+        r = requests.post(f"{base_url}/api/projects", json={'name': 'loadtest'}, timeout=30)
+        r.raise_for_status()
+        project_id = r.json()['project']['id']
+    client = _Client(base_url, project_id, image_size, stats)
+    # A few images to serve before the first upload lands
+    r = requests.post(f"{base_url}/api/projects/{project_id}/upload",
+                      files=upload_files(5, image_size, 0), timeout=120)
+    client.filenames = r.json().get('saved', []) if r.ok else []
+    r = requests.get(f"{base_url}/api/settings/styles", timeout=30)
+    client.styles = r.json().get('items', []) if r.ok else []
+    return client
+
+
+def run(base_url, args):
+    """Ramp users up step by step; returns (step rows, route rows, last error)"""
+    stats = _Stats()
+    client = _prepare(base_url, args.project_id, args.image_size, stats)
+    stop = threading.Event()
+    threads = []
+    steps = []
+    users = args.start_users
+    step = 0
+    while users <= args.max_users:
+        stats.step = step
+        while len(threads) < users:
+            t = threading.Thread(target=_user, args=(client, args.mix, args.think, stop, args.seed + len(threads)),
+                                 daemon=True)
+            t.start()
+            threads.append(t)
+        started = time.perf_counter()
+        time.sleep(args.step_seconds)
+        steps.append((step, users, time.perf_counter() - started))
+        users += args.step_users
+        step += 1
+    stats.step = step           # requests still in flight land in a discarded step
+    stop.set()
+    for t in threads:
+        t.join(timeout=300)
+
+    step_rows = []
+    for step, users, seconds in steps:
+        latencies, errors = stats.by_step(step)
+        step_rows.append({
+            'users': users,
+            'requests': len(latencies),
+            'rps': round(len(latencies) / seconds, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'error_rate': round(errors / len(latencies), 4) if latencies else 0,
+        })
+    routes, errors = stats.by_route()
+    route_rows = [{
+        'route': route,
+        'requests': len(values),
+        'errors': errors.get(route, 0),
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+        'max_ms': round(max(values) * 1000, 1),
+    } for route, values in sorted(routes.items())]
+    return step_rows, route_rows, stats.last_error
+
+
+def saturation_point(step_rows):
+    """(last healthy step, first saturated step, reason) or None"""
+    for prev, cur in zip(step_rows, step_rows[1:]):
+        if cur['error_rate'] > SATURATION_ERRORS:
+            return prev, cur, f"error rate {cur['error_rate']:.1%}"
+        user_gain = cur['users'] / prev['users'] - 1
+        rps_gain = cur['rps'] / prev['rps'] - 1 if prev['rps'] else 0
+        if rps_gain < user_gain * SATURATION_SCALING:
+            return prev, cur, (f"+{user_gain:.0%} users → {rps_gain:+.0%} req/s, "
+                               f"p95 {prev['p95_ms']:.0f} → {cur['p95_ms']:.0f} ms")
+    return None
+
+
+def _report(step_rows, route_rows):
+    print(f"\n{'users':>6} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for r in step_rows:
+        print(f"{r['users']:>6} {r['requests']:>9} {r['rps']:>8.2f} {r['p50_ms']:>9.1f} "
+              f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['error_rate']:>7.1%}")
+
+    print(f"\n{'route':<38} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for r in route_rows:
+        print(f"{r['route']:<38} {r['requests']:>9} {r['errors']:>7} {r['p50_ms']:>9.1f} "
+              f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+
+    point = saturation_point(step_rows)
+    if point:
+        healthy, saturated, reason = point
+        print(f"\n[!] Saturation at {saturated['users']} users ({reason}); "
+              f"max sustained ≈ {healthy['rps']} req/s with {healthy['users']} users")
+    elif step_rows:
+        print(f"\n[+] No saturation up to {step_rows[-1]['users']} users")
+    return point
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='running instance (default: in-process app + mock backends)')
+    parser.add_argument('--project-id', type=int, default=None, help='existing project to browse / upload into')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"default: {DEFAULT_MIX}")
+    parser.add_argument('--start-users', type=int, default=4)
+    parser.add_argument('--step-users', type=int, default=4)
+    parser.add_argument('--max-users', type=int, default=32)
+    parser.add_argument('--step-seconds', type=float, default=15)
+    parser.add_argument('--think', type=float, default=0.5, help='mean s between a user\'s requests (0 = none)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the user mix')
+    parser.add_argument('--threads', type=int, default=None, help='in-process app threads (see benchmarks.pipeline)')
+    parser.add_argument('--latency', type=float, default=0.5, help='s per mock SD / ComfyUI render')
+    parser.add_argument('--cloud-latency', type=float, default=None, help='s per mock cloud call')
+    parser.add_argument('--image-size', type=parse_size, default=(768, 512), help='WxH')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--verbose', action='store_true', help='show app log output (in-process)')
+    args = parser.parse_args()
+
+    print(f"[*] {args.start_users}→{args.max_users} users (+{args.step_users} every {args.step_seconds:g}s), "
+          f"mix {', '.join(f'{k}={v:g}' for k, v in args.mix.items())}")
+    if args.url:
+        step_rows, route_rows, last_error = run(args.url.rstrip('/'), args)
+    else:
+        threads = args.threads or config.get('server.workers', 2) * config.get('server.threads', 4)
+        mocks = MockBackends(args.latency, args.cloud_latency, image_size=args.image_size).start()
+        with tempfile.TemporaryDirectory() as tmp:
+            isolate(Path(tmp))
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with quiet:
+                server, base_url = start_app(mocks, threads)
+                step_rows, route_rows, last_error = run(base_url, args)
+            server.close()
+            mocks.stop()
+            from models.base import engine
+            engine.dispose()
+    if last_error:
+        print(f"[!] Last error: {last_error}")
+    point = _report(step_rows, route_rows)
+
+    if args.json:
+        report = {
+            'commit': git_commit(),
+            'target': args.url or 'in-process',
+            'params': {k: v for k, v in vars(args).items() if k not in ('json', 'verbose')},
+            'steps': step_rows,
+            'routes': route_rows,
+            'saturation': {'users': point[1]['users'], 'max_rps': point[0]['rps'], 'reason': point[2]}
+            if point else None,
+        }
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding='utf-8')
+        print(f"[+] Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
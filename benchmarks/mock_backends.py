@@ -0,0 +1,325 @@
+"""
+benchmarks/mock_backends.py
+MekanAI - Stand-in Image Backends (no GPU, no API keys)
+
+Local HTTP servers that answer like the real backends, with a configurable
+render latency and output size, so the app's own overhead can be measured:
+
+    sd        SD WebUI Forge   /sdapi/v1/txt2img, img2img, extra-single-image,
+                               options, sd-models, samplers, upscalers, interrupt,
+                               /controlnet/model_list, /controlnet/module_list
+    comfyui   ComfyUI          /prompt, /history/<id>, /view, /queue, /interrupt,
+                               /upload/image, /object_info[/<class>], /system_stats
+    cloud     one server, one path prefix per provider:
+                               /gemini/models/<id>:generateContent | :predict
+                               /openai/images/generations
+                               /grok/images/generations
+                               /stability/stable-image/...   (raw image body)
+
+SD WebUI and ComfyUI render one job at a time (one GPU each), so queued jobs
+wait like on the real servers; ComfyUI history carries execution_start /
+execution_success timestamps. Cloud calls run concurrently. ComfyUI's
+websocket is not emulated — the app polls /history.
+
+Output images are random-noise PNGs (they do not compress, so a WxH image is
+~W*H*3 bytes on the wire, x4/3 as base64).
+
+Usage:
+    python -m benchmarks.mock_backends                      # serve until Ctrl+C
+    python -m benchmarks.mock_backends --latency 2 --image-size 1024x1024
+
+    mocks = MockBackends(latency=0.2).start()
+    mocks.urls['sd'], mocks.urls['comfyui'], mocks.provider_url('gemini')
+    mocks.stop()
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from uuid import uuid4
+
+from PIL import Image
+
+CLOUD_PROVIDERS = ('gemini', 'openai', 'grok', 'stability')
+
+CHECKPOINTS = ['sdxl_base.safetensors', 'realvisxl.safetensors', 'sdxl_turbo.safetensors',
+               'flux1-dev.safetensors', 'sd3.5_large_turbo.safetensors']
+SAMPLERS = ['euler', 'euler_ancestral', 'dpmpp_2m', 'dpmpp_sde']
+SCHEDULERS = ['normal', 'karras', 'exponential', 'sgm_uniform']
+
+# Node classes used by data/workflows (required inputs left open, except combos)
+OBJECT_INFO = {
+    'CheckpointLoaderSimple': {'input': {'required': {'ckpt_name': [CHECKPOINTS]}}},
+    'KSampler': {'input': {'required': {'sampler_name': [SAMPLERS], 'scheduler': [SCHEDULERS]}}},
+    'ControlNetLoader': {'input': {'required': {'control_net_name': [[
+        'control_v11f1p_sd15_depth.pth', 'controlnet-union-sdxl.safetensors']]}}},
+    'UpscaleModelLoader': {'input': {'required': {'model_name': [['RealESRGAN_x4plus.pth']]}}},
+    'CLIPTextEncode': {'input': {'required': {}}},
+    'ControlNetApplyAdvanced': {'input': {'required': {}}},
+    'EmptyLatentImage': {'input': {'required': {}}},
+    'ImageScale': {'input': {'required': {}}},
+    'ImageUpscaleWithModel': {'input': {'required': {}}},
+    'LoadImage': {'input': {'required': {}}},
+    'SaveImage': {'input': {'required': {}}},
+    'VAEDecode': {'input': {'required': {}}},
+    'VAEEncode': {'input': {'required': {}}},
+}
+
+
+def noise_png(width, height, seed=0):
+    """Incompressible PNG of the given size"""
+    rng = random.Random(seed)
+    img = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
+
+# ============================================
+# SERVER
+# ============================================
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        backend = self.server.backend
+        path = urlparse(self.path).path
+        backend.count(path)
+        try:
+            status, payload, headers = backend.handle(method, path, body, self.headers)
+        except Exception as e:
+            status, payload, headers = 500, {'error': str(e)}, {}
+        if isinstance(payload, bytes):
+            data, content_type = payload, headers.pop('Content-Type', 'image/png')
+        else:
+            data, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Backend:
+    """Shared render timing / output image; subclasses map paths to responses"""
+
+    def __init__(self, latency, jitter, image_size):
+        self.latency = latency
+        self.jitter = jitter
+        self.image = noise_png(*image_size)
+        self.image_b64 = base64.b64encode(self.image).decode('ascii')
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+        self.server = None
+
+    def count(self, path):
+        with self._calls_lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+
+    def render_time(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def serve(self, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.backend = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class MockSD(_Backend):
+    """SD WebUI: renders block the (single) GPU for the render time"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._gpu = threading.Lock()
+        self._seed = 0
+
+    def handle(self, method, path, body, headers):
+        if path in ('/sdapi/v1/txt2img', '/sdapi/v1/img2img'):
+            params = json.loads(body or b'{}')
+            with self._gpu:
+                time.sleep(self.render_time())
+                self._seed += 1
+            seed = params.get('seed', -1)
+            seed = seed if seed is not None and seed >= 0 else self._seed
+            return 200, {'images': [self.image_b64], 'info': json.dumps({'seed': seed})}, {}
+        if path == '/sdapi/v1/extra-single-image':
+            with self._gpu:
+                time.sleep(self.render_time())
+            return 200, {'image': self.image_b64}, {}
+        if path == '/sdapi/v1/options':
+            return 200, {'sd_model_checkpoint': CHECKPOINTS[0]} if method == 'GET' else {}, {}
+        if path == '/sdapi/v1/sd-models':
+            return 200, [{'title': name, 'model_name': name.rsplit('.', 1)[0]} for name in CHECKPOINTS], {}
+        if path == '/sdapi/v1/samplers':
+            return 200, [{'name': 'DPM++ 2M Karras'}, {'name': 'Euler a'}], {}
+        if path == '/sdapi/v1/upscalers':
+            return 200, [{'name': 'None'}, {'name': 'R-ESRGAN 4x+'}], {}
+        if path == '/sdapi/v1/interrupt':
+            return 200, {}, {}
+        if path == '/controlnet/model_list':
+            return 200, {'model_list': OBJECT_INFO['ControlNetLoader']['input']['required']['control_net_name'][0]}, {}
+        if path == '/controlnet/module_list':
+            return 200, {'module_list': ['none', 'depth_midas', 'canny', 'lineart_realistic']}, {}
+        return 404, {'detail': 'Not Found'}, {}
+
+
+class MockComfyUI(_Backend):
+    """ComfyUI: prompts execute one after another on a virtual GPU timeline"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._lock = threading.Lock()
+        self._gpu_free_at = 0.0
+        self._prompts = {}      # prompt_id → (start, end)
+
+    def handle(self, method, path, body, headers):
+        if path == '/prompt' and method == 'POST':
+            prompt_id = uuid4().hex
+            with self._lock:
+                start = max(time.time(), self._gpu_free_at)
+                self._gpu_free_at = end = start + self.render_time()
+                self._prompts[prompt_id] = (start, end)
+            return 200, {'prompt_id': prompt_id, 'number': len(self._prompts), 'node_errors': {}}, {}
+        if path.startswith('/history/'):
+            prompt_id = path.rsplit('/', 1)[1]
+            with self._lock:
+                span = self._prompts.get(prompt_id)
+            if span is None or time.time() < span[1]:
+                return 200, {}, {}
+            start, end = span
+            return 200, {prompt_id: {
+                'status': {'status_str': 'success', 'completed': True, 'messages': [
+                    ['execution_start', {'prompt_id': prompt_id, 'timestamp': int(start * 1000)}],
+                    ['execution_success', {'prompt_id': prompt_id, 'timestamp': int(end * 1000)}],
+                ]},
+                'outputs': {'9': {'images': [{'filename': f"{prompt_id}.png", 'subfolder': '', 'type': 'output'}]}},
+            }}, {}
+        if path == '/view':
+            return 200, self.image, {'Content-Type': 'image/png'}
+        if path == '/upload/image':
+            return 200, {'name': f"{uuid4().hex[:12]}.png", 'subfolder': '', 'type': 'input'}, {}
+        if path == '/queue':
+            return 200, {'queue_running': [], 'queue_pending': []} if method == 'GET' else {}, {}
+        if path == '/interrupt':
+            return 200, {}, {}
+        if path == '/system_stats':
+            return 200, {'system': {'os': 'mock'}, 'devices': []}, {}
+        if path == '/object_info':
+            return 200, OBJECT_INFO, {}
+        if path.startswith('/object_info/'):
+            node_class = path.rsplit('/', 1)[1]
+            if node_class in OBJECT_INFO:
+                return 200, {node_class: OBJECT_INFO[node_class]}, {}
+        return 404, {'error': 'Not Found'}, {}
+
+
+class MockCloud(_Backend):
+    """Gemini / Imagen, OpenAI, Grok and Stability under /<provider>/..."""
+
+    def handle(self, method, path, body, headers):
+        provider, _, rest = path.lstrip('/').partition('/')
+        if method != 'POST' or provider not in CLOUD_PROVIDERS:
+            return 404, {'error': {'message': 'Not Found'}}, {}
+        time.sleep(self.render_time())
+        if provider == 'gemini':
+            if rest.endswith(':predict'):
+                return 200, {'predictions': [{'bytesBase64Encoded': self.image_b64, 'mimeType': 'image/png'}]}, {}
+            return 200, {'candidates': [{'content': {'parts': [
+                {'text': 'mock'}, {'inlineData': {'mimeType': 'image/png', 'data': self.image_b64}}]}}]}, {}
+        if provider in ('openai', 'grok'):
+            return 200, {'created': int(time.time()), 'data': [{'b64_json': self.image_b64}]}, {}
+        return 200, self.image, {'Content-Type': 'image/png', 'seed': str(random.randint(1, 2 ** 31))}
+
+
+class MockBackends:
+    """All stand-ins on ephemeral ports"""
+
+    def __init__(self, latency=0.5, cloud_latency=None, jitter=0.0, image_size=(768, 512), host='127.0.0.1'):
+        cloud_latency = latency if cloud_latency is None else cloud_latency
+        self.host = host
+        self.backends = {
+            'sd': MockSD(latency, jitter, image_size),
+            'comfyui': MockComfyUI(latency, jitter, image_size),
+            'cloud': MockCloud(cloud_latency, jitter, image_size),
+        }
+        self.urls = {}
+
+    def start(self, ports=None):
+        ports = ports or {}
+        for name, backend in self.backends.items():
+            self.urls[name] = backend.serve(self.host, ports.get(name, 0))
+        return self
+
+    def stop(self):
+        for backend in self.backends.values():
+            backend.stop()
+
+    def provider_url(self, provider_key):
+        """base_url for an ai_providers row"""
+        if provider_key == 'local':
+            return self.urls['sd']
+        if provider_key == 'comfyui':
+            return self.urls['comfyui']
+        return f"{self.urls['cloud']}/{provider_key}"
+
+    def calls(self):
+        """Request counts per backend and path"""
+        return {name: dict(backend.calls) for name, backend in self.backends.items()}
+
+
+def parse_size(value):
+    width, _, height = value.lower().partition('x')
+    return int(width), int(height or width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--latency', type=float, default=0.5, help='s per SD / ComfyUI render')
+    parser.add_argument('--cloud-latency', type=float, default=None, help='s per cloud call (default: --latency)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='± s added to each latency')
+    parser.add_argument('--image-size', type=parse_size, default=(768, 512), help='WxH of returned images')
+    parser.add_argument('--sd-port', type=int, default=7860)
+    parser.add_argument('--comfyui-port', type=int, default=8188)
+    parser.add_argument('--cloud-port', type=int, default=8190)
+    args = parser.parse_args()
+
+    mocks = MockBackends(args.latency, args.cloud_latency, args.jitter, args.image_size, args.host)
+    mocks.start({'sd': args.sd_port, 'comfyui': args.comfyui_port, 'cloud': args.cloud_port})
+    print("[+] Mock backends running (set these as provider base_url in Settings > Providers):")
+    for key in ('local', 'comfyui') + CLOUD_PROVIDERS:
+        print(f"    {key:<10} {mocks.provider_url(key)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mocks.stop()
+
+
+if __name__ == '__main__':
+    main()
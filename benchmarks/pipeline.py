@@ -0,0 +1,399 @@
+"""
+benchmarks/pipeline.py
+MekanAI - End-to-end app overhead against mock backends
+
+Runs the Flask app in-process on waitress, as wsgi.py does without gunicorn
+(--threads defaults to server.workers × server.threads, the production request
+concurrency), on a throwaway data directory, points every provider at
+benchmarks/mock_backends.py and drives it over HTTP:
+
+    single_generate    sequential /api/generate-image on SD WebUI, saved to a project
+    concurrent_users   --users clients at once, each on one of local / comfyui /
+                       gemini / openai / stability / grok (round robin)
+    gallery_browse     /projects, /projects/<id> and image files of a populated project
+    upload_burst       --users clients uploading --upload-files images each at once
+
+Reported per scenario: requests, errors, req/s, p50 / p99 latency (ms) and
+peak RSS (MB, sampled; client threads share the process). With a fixed mock
+latency the difference to the mock time is MekanAI's own overhead. Save runs
+with --json and compare two commits with --compare.
+
+Provider rate limits are lifted and health probes are off, so the numbers
+measure the app rather than token buckets.
+
+Usage:
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --users 50 --latency 0.2 --json bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.pipeline --scenario gallery_browse --compare bench-abc123.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from config import config
+from benchmarks.mock_backends import CLOUD_PROVIDERS, MockBackends, noise_png, parse_size
+
+SCENARIOS = ('single_generate', 'concurrent_users', 'gallery_browse', 'upload_burst')
+
+# provider key → model key used for its generate requests
+PROVIDER_MIX = (
+    ('local', 'sdxl_base'),
+    ('comfyui', 'flux_dev'),
+    ('gemini', 'gemini_flash_image'),
+    ('openai', 'dalle3'),
+    ('stability', 'stability_core'),
+    ('grok', 'grok_imagine'),
+)
+
+
+# ============================================
+# SETUP
+# ============================================
+def isolate(tmp):
+    """Send every data path of the app into `tmp` (before the app is imported)"""
+    for key in ('projects', 'uploads', 'outputs', 'temp', 'db', 'blobs'):
+        config.set(f'paths.{key}', str(tmp / key))
+    config.set('database.type', 'sqlite')
+    config.set('database.path', str(tmp / 'db' / 'bench.db'))
+    config.set('metrics.dir', str(tmp / 'temp' / 'metrics'))
+    config.set('controlnet.cache_dir', str(tmp / 'temp' / 'control'))
+    config.set('health.enabled', False)
+
+
+def point_providers(mocks):
+    import models.ai_provider as provider_model
+    from models.base import db_session
+
+    for key in ('local', 'comfyui') + CLOUD_PROVIDERS:
+        provider = provider_model.get_by_key(key)
+        if provider:
+            provider_model.update(provider['id'], base_url=mocks.provider_url(key), api_key='benchmark',
+                                  enabled=True, rate_limit=None, rate_burst=None)
+    db_session.remove()
+
+
+class _AppServer:
+    """waitress serving the app in a background thread"""
+
+    def __init__(self, server):
+        self.server = server
+        self._thread = threading.Thread(target=server.run, daemon=True)
+        self._thread.start()
+
+    def close(self, timeout=10):
+        """Finish running requests, end the serve loop and join it.
+
+        The sockets are closed by a trigger thunk in the loop's own thread, so
+        run() returns instead of polling a closed descriptor (EBADF).
+        """
+        from waitress import wasyncore
+        self.server.task_dispatcher.shutdown()
+        self.server.trigger.pull_trigger(lambda: wasyncore.close_all(self.server._map))
+        self._thread.join(timeout)
+
+
+def start_app(mocks, threads):
+    """Serve the app on a free port; returns (server, base_url), server.close() stops it"""
+    import logging
+    from waitress import create_server
+    from app import app
+
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)     # "Task queue depth is N" per request
+    point_providers(mocks)
+    server = create_server(app, host='127.0.0.1', port=0, threads=threads,
+                           channel_timeout=config.get('server.worker_timeout', 360))
+    return _AppServer(server), f"http://127.0.0.1:{server.effective_port}"
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# ============================================
+# MEASUREMENT
+# ============================================
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource     # peak, not current, where /proc is missing (macOS: bytes)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if platform.system() == 'Darwin' else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+class _RssSampler:
+    """Peak resident memory while the body runs"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_mb())
+
+
+class _Recorder:
+    """Latency of every request of a scenario"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def call(self, method, url, **kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            r = requests.request(method, url, timeout=300, **kwargs)
+            if r.status_code >= 400:
+                error = f"HTTP {r.status_code} {url}: {r.text[:200]}"
+            elif r.headers.get('Content-Type', '').startswith('application/json') \
+                    and r.json().get('status') == 'error':
+                error = f"{url}: {r.json().get('message')}"
+        except (requests.RequestException, ValueError) as e:
+            r, error = None, f"{url}: {e}"
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+            if error:
+                self.errors += 1
+                self.last_error = error
+        return r
+
+
+def generate_payload(model, project_id, size):
+    return {
+        'prompt': 'modern scandinavian living room, oak floor, large windows',
+        'model': model,
+        'width': size[0],
+        'height': size[1],
+        'steps': 20,
+        'seed': -1,
+        'project_id': project_id,
+    }
+
+
+def upload_files(count, size, seed):
+    return [('images', (f"bench_{seed}_{i}.png", noise_png(*size, seed=seed * 1000 + i), 'image/png'))
+            for i in range(count)]
+
+
+# ============================================
+# SCENARIOS
+# ============================================
+def _single_generate(rec, base_url, project_id, args):
+    payload = generate_payload('sdxl_base', project_id, args.image_size)
+    for _ in range(args.requests):
+        rec.call('POST', f"{base_url}/api/generate-image", json=payload)
+
+
+def _concurrent_users(rec, base_url, project_id, args):
+    def user(i):
+        _, model = PROVIDER_MIX[i % len(PROVIDER_MIX)]
+        for _ in range(args.per_user):
+            rec.call('POST', f"{base_url}/api/generate-image",
+                     json=generate_payload(model, project_id, args.image_size))
+
+    with ThreadPoolExecutor(args.users) as pool:
+        list(pool.map(user, range(args.users)))
+
+
+def _gallery_browse(rec, base_url, project_id, args):
+    # Populate outside the measured requests
+    filenames = []
+    for batch in range(math.ceil(args.gallery_images / 10)):
+        files = upload_files(min(10, args.gallery_images - batch * 10), args.image_size, batch)
+        r = requests.post(f"{base_url}/api/projects/{project_id}/upload", files=files, timeout=300)
+        filenames += r.json().get('saved', [])
+    rec.latencies.clear()
+
+    def user(i):
+        for round_ in range(args.per_user):
+            rec.call('GET', f"{base_url}/projects")
+            rec.call('GET', f"{base_url}/projects/{project_id}")
+            for k in range(4):
+                name = filenames[(i * 7 + round_ * 4 + k) % len(filenames)]
+                rec.call('GET', f"{base_url}/projects/{project_id}/images/{name}")
+
+    with ThreadPoolExecutor(args.users) as pool:
+        list(pool.map(user, range(args.users)))
+
+
+def _upload_burst(rec, base_url, project_id, args):
+    payloads = [upload_files(args.upload_files, args.image_size, i) for i in range(args.users)]
+
+    def user(i):
+        rec.call('POST', f"{base_url}/api/projects/{project_id}/upload", files=payloads[i])
+
+    with ThreadPoolExecutor(args.users) as pool:
+        list(pool.map(user, range(args.users)))
+
+
+RUNNERS = {
+    'single_generate': _single_generate,
+    'concurrent_users': _concurrent_users,
+    'gallery_browse': _gallery_browse,
+    'upload_burst': _upload_burst,
+}
+
+
+def run_scenario(name, base_url, args):
+    r = requests.post(f"{base_url}/api/projects", json={'name': f"bench {name}"}, timeout=30)
+    project_id = r.json()['project']['id']
+    rec = _Recorder()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    if args.tracemalloc:
+        tracemalloc.start()
+    with quiet, _RssSampler() as rss:
+        start = time.perf_counter()
+        RUNNERS[name](rec, base_url, project_id, args)
+        elapsed = time.perf_counter() - start
+    result = {
+        'scenario': name,
+        'requests': len(rec.latencies),
+        'errors': rec.errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(rec.latencies) / elapsed, 2) if elapsed else 0,
+        'p50_ms': round(percentile(rec.latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(rec.latencies, 99) * 1000, 1),
+        'peak_rss_mb': round(rss.peak, 1),
+    }
+    if args.tracemalloc:
+        result['py_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    if rec.last_error:
+        print(f"[!] {name}: {rec.errors} error(s), last: {rec.last_error}")
+    return result
+
+
+# ============================================
+# REPORT
+# ============================================
+def _print_row(r):
+    print(f"{r['scenario']:<18} {r['requests']:>8} {r['errors']:>7} {r['rps']:>9.2f} "
+          f"{r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['peak_rss_mb']:>9.1f}")
+
+
+def _compare(results, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text(encoding='utf-8'))
+    before = {r['scenario']: r for r in baseline['results']}
+    print(f"\n[i] vs {baseline.get('commit', '?')} ({baseline_path})")
+    print(f"{'scenario':<18} {'req/s':>9} {'p50':>9} {'p99':>9} {'rss':>9}")
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+
+    for r in results:
+        old = before.get(r['scenario'])
+        if old:
+            print(f"{r['scenario']:<18} {delta(r['rps'], old['rps']):>9} {delta(r['p50_ms'], old['p50_ms']):>9} "
+                  f"{delta(r['p99_ms'], old['p99_ms']):>9} {delta(r['peak_rss_mb'], old['peak_rss_mb']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append', help='repeatable (default: all)')
+    parser.add_argument('--users', type=int, default=50, help='concurrent clients')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='app request threads (default: server.workers × server.threads)')
+    parser.add_argument('--per-user', type=int, default=1, help='generations / browse rounds per client')
+    parser.add_argument('--requests', type=int, default=20, help='single_generate request count')
+    parser.add_argument('--gallery-images', type=int, default=60)
+    parser.add_argument('--upload-files', type=int, default=4, help='images per upload request')
+    parser.add_argument('--latency', type=float, default=0.2, help='s per mock SD / ComfyUI render')
+    parser.add_argument('--cloud-latency', type=float, default=None, help='s per mock cloud call')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--image-size', type=parse_size, default=(768, 512), help='WxH')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report peak Python allocations (slower)')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='baseline --json file from another commit')
+    parser.add_argument('--verbose', action='store_true', help='show app log output')
+    args = parser.parse_args()
+    scenarios = args.scenario or list(SCENARIOS)
+    args.threads = args.threads or config.get('server.workers', 2) * config.get('server.threads', 4)
+
+    mocks = MockBackends(args.latency, args.cloud_latency, args.jitter, args.image_size).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        isolate(Path(tmp))
+        with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+            server, base_url = start_app(mocks, args.threads)
+
+        commit = git_commit()
+        print(f"[*] {commit} · {args.users} users · {args.threads} app threads · mock latency {args.latency}s · "
+              f"{args.image_size[0]}x{args.image_size[1]} images\n")
+        print(f"{'scenario':<18} {'requests':>8} {'errors':>7} {'req/s':>9} "
+              f"{'p50 ms':>9} {'p99 ms':>9} {'rss MB':>9}")
+        results = []
+        for name in scenarios:
+            results.append(run_scenario(name, base_url, args))
+            _print_row(results[-1])
+
+        server.close()
+        mocks.stop()
+        from models.base import engine
+        engine.dispose()
+
+    if args.json:
+        report = {
+            'commit': commit,
+            'python': platform.python_version(),
+            'params': {k: v for k, v in vars(args).items() if k not in ('json', 'compare', 'verbose')},
+            'backend_calls': mocks.calls(),
+            'results': results,
+        }
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding='utf-8')
+        print(f"\n[+] Results written to {args.json}")
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -94,24 +94,115 @@ class Config:
                 'language': 'tr',
                 'theme': 'dark',
                 'debug_mode': False,
-                'log_level': 'info'
+                'log_level': 'info',
+                'startup_budget_ms': 2000
             },
             'server': {
                 'host': '0.0.0.0',
                 'port': 5000,
                 'secret_key': secrets.token_hex(32),
-                'max_upload_size': 16777216
+                'max_upload_size': 16777216,
+                'workers': 2,
+                'threads': 4,
+                'worker_timeout': 360
             },
             'database': {
                 'type': 'sqlite',
-                'path': 'data/db/mekanai.db'
+                'path': 'data/db/mekanai.db',
+                'sqlite': {
+                    'profile': 'tuned',
+                    'busy_timeout': 5000,
+                    'serialize_writes': True,
+                    'write_retries': 5
+                }
             },
             'paths': {
                 'projects': 'data/projects',
                 'uploads': 'data/uploads',
                 'outputs': 'data/outputs',
                 'temp': 'data/temp',
-                'db': 'data/db'
+                'db': 'data/db',
+                'blobs': 'data/blobs'
+            },
+            'upscale': {
+                'tile_size': 512,
+                'tile_overlap': 32,
+                'tile_feather': 24,
+                'max_output_pixels': 12288 * 12288,
+                'cpu_fallback': True
+            },
+            'cpu': {
+                'workers': 0
+            },
+            'controlnet': {
+                'local_preprocess': True,
+                'cache_dir': 'data/temp/control',
+                'cache_keep': 500
+            },
+            'comfyui': {
+                'workflows_dir': 'data/workflows',
+                'object_info_ttl': 300,
+                'workflows': {}
+            },
+            'preview': {
+                'steps': 10,
+                'scale': 1.0,
+                'model': ''
+            },
+            'jobs': {
+                'slots': {'local': 1, 'comfyui': 2},
+                'max_queue_wait': 600,
+                'heartbeat_interval': 1,
+                'stale_after': 30,
+                'keep_finished': 3600,
+                'fair_window': 600,
+                'classes': {
+                    'interactive': {'weight': 8},
+                    'normal': {'weight': 4},
+                    'batch': {'weight': 1, 'max_waiting': 4}
+                }
+            },
+            'coalesce': {
+                'enabled': True,
+                'grace': 10
+            },
+            'metrics': {
+                'enabled': True,
+                'dir': 'data/temp/metrics',
+                'flush_interval': 5,
+                'retention': 86400
+            },
+            'sql_log': {
+                'slow_ms': 100,
+                'max_queries': 50,
+                'repeat_warn': 10,
+                'server_timing': True,
+                'stack_depth': 3
+            },
+            'profiling': {
+                'enabled': True,
+                'token': '',
+                'sample_rate': 0.0,
+                'dir': 'data/profiles',
+                'keep': 100
+            },
+            'health': {
+                'enabled': True,
+                'interval': 15,
+                'failure_threshold': 3,
+                'reset_timeout': 30
+            },
+            'cloud': {
+                'hedge_after': 45,
+                'hedge_min_samples': 20,
+                'hedge_min': 5,
+                'retry': {
+                    'max_attempts': 4,
+                    'base_delay': 1.0,
+                    'max_delay': 30,
+                    'max_queue_wait': 60
+                },
+                'fallbacks': {}
             }
         }
         self.save()
@@ -119,9 +210,9 @@ class Config:
     def ensure_directories(self) -> None:
         """Create necessary directories if they don't exist"""
         paths = self.get('paths', {})
-        for path_name, path_value in paths.items():
+        for path_value in paths.values():
             Path(path_value).mkdir(parents=True, exist_ok=True)
-            print(f"[+] Directory ensured: {path_value}")
+        print(f"[+] {len(paths)} directories ensured")
 
     def validate(self) -> bool:
         """Validate configuration"""
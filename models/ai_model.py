@@ -6,7 +6,7 @@ from pathlib import Path
 from datetime import datetime
 from sqlalchemy import Column, Integer, String, Text, Float, Boolean, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
-from .base import Base, db_session
+from .base import Base, JSONText, db_session
 
 # ============================================
 # MODEL
@@ -22,7 +22,7 @@ class AIModel(Base):
     type = Column(String(50), nullable=False)                        # checkpoint, controlnet, adapter, upscaler, cloud_api
     api_model_id = Column(String(100))                               # cloud API model identifier (e.g. gemini-2.5-flash-image)
     description = Column(Text)
-    capabilities = Column(Text)                                      # JSON array: ["txt2img", "img2img"]
+    capabilities = Column(JSONText)                                  # JSON array: ["txt2img", "img2img"]
     default_steps = Column(Integer)
     default_cfg_scale = Column(Float)
     default_sampler = Column(String(50))
@@ -155,7 +155,7 @@ def seed_from_json():
 
     # Provider key → id mapping
     from .ai_provider import AIProvider
-    provider_map = {p.key: p.id for p in db_session.query(AIProvider).all()}
+    provider_map = dict(db_session.query(AIProvider.key, AIProvider.id).all())   # legacy-safe columns
 
     with open(json_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -33,6 +33,8 @@ class AIProvider(Base):
     api_key = Column(String(500))                                        # API key (cloud providers)
     description = Column(Text)
     icon = Column(String(50))
+    rate_limit = Column(Integer)                                        # requests/min (null = unlimited)
+    rate_burst = Column(Integer)                                        # token bucket size (default = rate_limit)
     enabled = Column(Boolean, default=True)
     sort_order = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -56,6 +58,8 @@ class AIProvider(Base):
             'api_key': api_key,
             'description': self.description or '',
             'icon': self.icon or '',
+            'rate_limit': self.rate_limit,
+            'rate_burst': self.rate_burst,
             'enabled': self.enabled,
             'sort_order': self.sort_order,
         }
@@ -125,6 +129,8 @@ def seed_from_json():
             api_key=item.get('api_key', ''),
             description=item.get('description', ''),
             icon=item.get('icon', ''),
+            rate_limit=item.get('rate_limit'),
+            rate_burst=item.get('rate_burst'),
             enabled=item.get('enabled', True),
             sort_order=item.get('sort_order', 0),
         ))
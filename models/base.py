@@ -2,154 +2,282 @@
 MekanAI - Database Base
 SQLAlchemy engine, session, and Base configuration
 """
-from sqlalchemy import create_engine, event, inspect, text
+import os
+import time
+import random
+import functools
+import threading
+import json
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, Text, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
 from config import config
 
 Base = declarative_base()
 
-# ── Engine & Session (module-level) ──────────────
-_db_path = config.get('database.path', 'data/db/mekanai.db')
-engine = create_engine(
-    f"sqlite:///{_db_path}",
-    echo=False,
-    pool_pre_ping=True,
-    connect_args={"check_same_thread": False},
-)
+# ── SQLite Tuning ────────────────────────────────
+# database.sqlite.profile selects a pragma set; database.sqlite.pragmas overrides
+# individual values. "legacy" reproduces the original WAL + foreign_keys only.
+SQLITE_PROFILES = {
+    'legacy': {
+        'journal_mode': 'WAL',
+        'foreign_keys': 'ON',
+    },
+    'safe': {
+        'journal_mode': 'WAL',
+        'foreign_keys': 'ON',
+        'synchronous': 'FULL',
+        'temp_store': 'MEMORY',
+    },
+    'tuned': {
+        'journal_mode': 'WAL',
+        'foreign_keys': 'ON',
+        'synchronous': 'NORMAL',     # durable in WAL mode, no fsync per commit
+        'cache_size': -32000,        # ~32 MB page cache
+        'mmap_size': 268435456,      # 256 MB memory-mapped reads
+        'temp_store': 'MEMORY',
+    },
+}
+
+DB_TYPE = config.get('database.type', 'sqlite')
+
+# Write policy for @write_transaction (see below)
+write_policy = {
+    'serialize': DB_TYPE == 'sqlite' and config.get('database.sqlite.serialize_writes', True),
+    'retries': config.get('database.sqlite.write_retries', 5),
+}
+
+
+def sqlite_pragmas(sqlite_cfg=None):
+    """Resolve the pragma dict for a database.sqlite config section"""
+    sqlite_cfg = sqlite_cfg or {}
+    pragmas = dict(SQLITE_PROFILES.get(sqlite_cfg.get('profile', 'tuned'), SQLITE_PROFILES['tuned']))
+    if sqlite_cfg.get('profile') != 'legacy':
+        pragmas['busy_timeout'] = sqlite_cfg.get('busy_timeout', 5000)
+    pragmas.update(sqlite_cfg.get('pragmas') or {})
+    return pragmas
+
+
+def create_db_engine(db_path, sqlite_cfg=None):
+    """Create a SQLite engine with the configured pragma profile applied per connection"""
+    pragmas = sqlite_pragmas(sqlite_cfg)
+    busy_timeout_ms = pragmas.get('busy_timeout', 5000)
+    new_engine = create_engine(
+        f"sqlite:///{db_path}",
+        echo=False,
+        # Local file: no network round trip to guard against, so no pre-ping
+        connect_args={"check_same_thread": False, "timeout": busy_timeout_ms / 1000},
+    )
+
+    def _set_sqlite_pragma(dbapi_conn, connection_record):
+        """Apply pragma profile (WAL, foreign keys, sync, cache...) to a new connection"""
+        cursor = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    event.listen(new_engine, "connect", _set_sqlite_pragma)
+    return new_engine
+
+
+# ── Server Databases (PostgreSQL) ────────────────
 
+def create_server_engine(db_cfg):
+    """Create a pooled engine for a networked database (PostgreSQL).
 
-def _set_sqlite_pragma(dbapi_conn, connection_record):
-    """Enable WAL mode and foreign keys for SQLite"""
-    cursor = dbapi_conn.cursor()
-    cursor.execute("PRAGMA journal_mode=WAL")
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
+    URL precedence: DATABASE_URL env > database.url > database.host/port/name/user/password
+    """
+    url = os.environ.get('DATABASE_URL') or db_cfg.get('url')
+    if not url:
+        url = (f"postgresql+psycopg://{db_cfg.get('user', 'mekanai')}:{db_cfg.get('password', '')}"
+               f"@{db_cfg.get('host', 'localhost')}:{db_cfg.get('port', 5432)}/{db_cfg.get('name', 'mekanai')}")
+    pool_cfg = db_cfg.get('pool', {}) or {}
+    return create_engine(
+        url,
+        echo=False,
+        pool_size=pool_cfg.get('size', 5),
+        max_overflow=pool_cfg.get('max_overflow', 10),
+        pool_timeout=pool_cfg.get('timeout', 30),
+        pool_recycle=pool_cfg.get('recycle', 1800),
+        pool_pre_ping=True,  # network connections can drop between requests
+    )
 
 
-event.listen(engine, "connect", _set_sqlite_pragma)
+# ── Column Types ─────────────────────────────────
+
+class JSONText(TypeDecorator):
+    """JSON stored as text on SQLite, JSONB on PostgreSQL.
+
+    The application always reads/writes JSON strings (json.dumps / json.loads
+    in the models), so the PostgreSQL variant converts at the boundary.
+    """
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import JSONB
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if dialect.name == 'postgresql' and isinstance(value, str):
+            return json.loads(value) if value else None
+        return value
+
+    def process_result_value(self, value, dialect):
+        if dialect.name == 'postgresql' and value is not None and not isinstance(value, str):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+
+# ── Engine & Session (module-level) ──────────────
+if DB_TYPE == 'sqlite':
+    _db_path = config.get('database.path', 'data/db/mekanai.db')
+    engine = create_db_engine(_db_path, config.get('database.sqlite', {}))
+else:
+    engine = create_server_engine(config.get('database', {}))
 
 session_factory = sessionmaker(bind=engine)
 db_session = scoped_session(session_factory)
 
 
+def _reset_after_fork():
+    """Drop pooled connections/sessions inherited from the parent process.
+
+    Pre-forking servers (gunicorn --preload) create the engine in the master;
+    children must open their own connections instead of sharing its sockets/FDs.
+    """
+    engine.dispose(close=False)
+    db_session.registry.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ── Write Serialization ──────────────────────────
+# SQLite allows one writer at a time. Threads of the same process queue on a
+# lock instead of racing for the file lock; across processes busy_timeout
+# waits, and a stale read snapshot ("database is locked" on upgrade) is
+# rolled back and retried with jittered backoff.
+_write_lock = threading.RLock()
+
+
+def _is_locked_error(exc):
+    msg = str(getattr(exc, 'orig', exc)).lower()
+    return 'database is locked' in msg or 'database is busy' in msg
+
+
+def write_transaction(fn):
+    """Decorator for short CRUD writes that commit on db_session"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        attempts = write_policy['retries'] + 1
+        for attempt in range(attempts):
+            try:
+                if write_policy['serialize']:
+                    with _write_lock:
+                        return fn(*args, **kwargs)
+                return fn(*args, **kwargs)
+            except OperationalError as e:
+                db_session.rollback()
+                if not _is_locked_error(e) or attempt == attempts - 1:
+                    raise
+                time.sleep(min(0.05 * 2 ** attempt, 1.0) * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+# ── Migration Lock ───────────────────────────────
+# Workers of a server without --preload all run init_db on first boot. Schema
+# setup runs under a cross-process lock — a lock file next to the SQLite
+# database, a session-level advisory lock on PostgreSQL — and re-reads the
+# schema version once it holds the lock, so only the first worker migrates.
+MIGRATION_LOCK_ID = 0x4D454B41     # pg_advisory_lock key ("MEKA")
+
+
+@contextmanager
+def _file_lock(path):
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:         # LK_LOCK gives up after ~10 s: keep waiting
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def migration_lock():
+    """Hold the schema-setup lock shared by every process using this database"""
+    if DB_TYPE == 'sqlite':
+        with _file_lock(f"{_db_path}.migrate.lock"):
+            yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_ID})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_ID})
+
+
 # ── Init & Seed ──────────────────────────────────
 
 def init_db():
-    """Create tables and seed data."""
-    # Import all models so Base.metadata knows about them
-    from . import project, image, style, scene, perspective, lighting, ratio, ai_provider, ai_model, mode
+    """Apply pending schema migrations; create + seed tables on first install.
 
-    Base.metadata.create_all(bind=engine)
+    When the database is already at the latest version this is a single
+    SELECT on schema_version — no create_all, seed counts or write transactions.
+    Otherwise the work runs under migration_lock(), once across all workers.
+    """
+    # Import all models so Base.metadata knows about them
+    from . import project, image, style, scene, perspective, lighting, ratio, ai_provider, ai_model, mode, rate_limit, job, flight
+    from . import migrations
 
-    _seed_all()
-    _run_migrations()
-    print("[+] DB initialized (SQLAlchemy ORM)")
+    current = migrations.get_current_version()
+    if current == migrations.LATEST_VERSION:
+        return
 
+    with migration_lock():
+        # Another worker may have finished while this one waited for the lock
+        current = migrations.get_current_version()
+        if current != migrations.LATEST_VERSION:
+            _setup_schema(migrations, current)
 
-def _run_migrations():
-    """Run schema migrations for existing databases"""
-    insp = inspect(engine)
-    # Migration: add parent_id to images table
-    if 'images' in insp.get_table_names():
-        columns = [c['name'] for c in insp.get_columns('images')]
-        if 'parent_id' not in columns:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE images ADD COLUMN parent_id INTEGER REFERENCES images(id) ON DELETE SET NULL"))
-            print("[+] Migration: images.parent_id added")
 
-    # Migration: ai_providers - set local base_url + rename api_key_field → api_key
-    if 'ai_providers' in insp.get_table_names():
-        columns = [c['name'] for c in insp.get_columns('ai_providers')]
+def _setup_schema(migrations, current):
+    if current is None and migrations.is_fresh_install():
+        Base.metadata.create_all(bind=engine)
+        seed_tables()
         with engine.begin() as conn:
-            result = conn.execute(text("SELECT base_url FROM ai_providers WHERE key='local'")).fetchone()
-            if result and not result[0]:
-                conn.execute(text("UPDATE ai_providers SET base_url='http://192.168.1.195:7860' WHERE key='local'"))
-                print("[+] Migration: local provider base_url set")
-            if 'api_key_field' in columns and 'api_key' not in columns:
-                conn.execute(text("ALTER TABLE ai_providers RENAME COLUMN api_key_field TO api_key"))
-                print("[+] Migration: ai_providers.api_key_field → api_key")
-            # Set cloud provider base_urls if empty
-            for pkey, purl in [
-                ('gemini', 'https://generativelanguage.googleapis.com/v1beta'),
-                ('openai', 'https://api.openai.com/v1'),
-                ('stability', 'https://api.stability.ai/v2beta'),
-                ('grok', 'https://api.x.ai/v1'),
-            ]:
-                r = conn.execute(text("SELECT base_url FROM ai_providers WHERE key=:k"), {"k": pkey}).fetchone()
-                if r and not r[0]:
-                    conn.execute(text("UPDATE ai_providers SET base_url=:u WHERE key=:k"), {"u": purl, "k": pkey})
-                    print(f"[+] Migration: {pkey} provider base_url set")
-
-    # Migration: add api_model_id to ai_models + insert Gemini models
-    if 'ai_models' in insp.get_table_names():
-        columns = [c['name'] for c in insp.get_columns('ai_models')]
-        with engine.begin() as conn:
-            if 'api_model_id' not in columns:
-                conn.execute(text("ALTER TABLE ai_models ADD COLUMN api_model_id VARCHAR(100)"))
-                print("[+] Migration: ai_models.api_model_id added")
-            # Insert Gemini models if not present
-            exists = conn.execute(text("SELECT id FROM ai_models WHERE key='gemini_flash_image'")).fetchone()
-            if not exists:
-                gemini_pid = conn.execute(text("SELECT id FROM ai_providers WHERE key='gemini'")).fetchone()
-                if gemini_pid:
-                    pid = gemini_pid[0]
-                    conn.execute(text(
-                        "INSERT INTO ai_models (name,key,provider_id,type,api_model_id,description,capabilities,max_resolution,icon,enabled,sort_order) "
-                        "VALUES ('Gemini 2.5 Flash Image','gemini_flash_image',:pid,'cloud_api','gemini-2.5-flash-image',"
-                        "'Nano Banana — hızlı, ucuz, metin+görsel mixed üretim (~$0.04/görsel)','[\"txt2img\"]',2048,'gemini',1,52)"
-                    ), {"pid": pid})
-                    conn.execute(text(
-                        "INSERT INTO ai_models (name,key,provider_id,type,api_model_id,description,capabilities,max_resolution,icon,enabled,sort_order) "
-                        "VALUES ('Imagen 4 Fast','imagen4_fast',:pid,'cloud_api','imagen-4.0-fast-generate-001',"
-                        "'Google Imagen 4 Fast — en ucuz, hızlı text-to-image ($0.02/görsel)','[\"txt2img\"]',2048,'gemini',1,53)"
-                    ), {"pid": pid})
-                    print("[+] Migration: Gemini models inserted")
-
-            # Set api_model_id for existing cloud models (DALL-E 3, Stability)
-            for mkey, mid in [
-                ('dalle3', 'dall-e-3'),
-                ('stability_sdxl', 'stable-image-core'),
-            ]:
-                r = conn.execute(text("SELECT api_model_id FROM ai_models WHERE key=:k"), {"k": mkey}).fetchone()
-                if r and not r[0]:
-                    conn.execute(text("UPDATE ai_models SET api_model_id=:m WHERE key=:k"), {"m": mid, "k": mkey})
-                    print(f"[+] Migration: {mkey} api_model_id set to {mid}")
-
-    # Migration: Insert ComfyUI provider + models
-    if 'ai_providers' in insp.get_table_names():
-        with engine.begin() as conn:
-            comfyui_exists = conn.execute(text("SELECT id FROM ai_providers WHERE key='comfyui'")).fetchone()
-            if not comfyui_exists:
-                conn.execute(text(
-                    "INSERT INTO ai_providers (name,key,type,base_url,description,icon,enabled,sort_order) "
-                    "VALUES ('ComfyUI','comfyui','local','http://localhost:8188',"
-                    "'ComfyUI — Node tabanlı, gelişmiş workflow desteği','comfyui',0,2)"
-                ))
-                print("[+] Migration: ComfyUI provider inserted")
-
-                # Insert ComfyUI models
-                comfyui_pid = conn.execute(text("SELECT id FROM ai_providers WHERE key='comfyui'")).fetchone()
-                if comfyui_pid:
-                    pid = comfyui_pid[0]
-                    conn.execute(text(
-                        "INSERT INTO ai_models (name,key,provider_id,type,api_model_id,description,capabilities,"
-                        "default_steps,default_cfg_scale,default_sampler,max_resolution,icon,enabled,sort_order) "
-                        "VALUES ('FLUX.1 Dev','flux_dev',:pid,'checkpoint','flux1-dev',"
-                        "'FLUX.1 Dev — yüksek kalite, detaylı, yaratıcı çıktı (ComfyUI)',"
-                        "'[\"txt2img\",\"img2img\"]',20,1.0,'Euler',2048,'flux',1,13)"
-                    ), {"pid": pid})
-                    conn.execute(text(
-                        "INSERT INTO ai_models (name,key,provider_id,type,api_model_id,description,capabilities,"
-                        "default_steps,default_cfg_scale,default_sampler,max_resolution,icon,enabled,sort_order) "
-                        "VALUES ('SD3.5 Large Turbo','sd35_large_turbo',:pid,'checkpoint','sd3.5_large_turbo',"
-                        "'SD 3.5 Large Turbo — hızlı, yüksek kalite (4-8 step, ComfyUI)',"
-                        "'[\"txt2img\",\"img2img\"]',4,1.0,'Euler',1536,'sd35',1,14)"
-                    ), {"pid": pid})
-                    print("[+] Migration: ComfyUI models inserted")
-
-
-def _seed_all():
-    """Seed all reference tables if they are empty"""
+            migrations.stamp(migrations.LATEST_VERSION, conn)
+        print(f"[+] DB created (schema v{migrations.LATEST_VERSION})")
+        return
+
+    migrations.run_pending(current or 0)
+    print(f"[+] DB migrated to schema v{migrations.LATEST_VERSION}")
+
+
+def seed_tables(tables=None):
+    """Seed reference tables (all, or only those named in `tables`) if they are empty"""
     from .style import seed_from_json as seed_styles
     from .scene import seed_from_json as seed_scenes
     from .perspective import seed_from_json as seed_perspectives
@@ -159,14 +287,20 @@ def _seed_all():
     from .ai_model import seed_from_json as seed_ai_models
     from .mode import seed_from_json as seed_modes
 
-    seed_styles()
-    seed_scenes()
-    seed_perspectives()
-    seed_lightings()
-    seed_ratios()
-    seed_ai_providers()
-    seed_ai_models()
-    seed_modes()
+    # Providers before models: model rows look up their provider ids
+    seeders = [
+        ('styles', seed_styles),
+        ('scenes', seed_scenes),
+        ('perspectives', seed_perspectives),
+        ('lightings', seed_lightings),
+        ('ratios', seed_ratios),
+        ('ai_providers', seed_ai_providers),
+        ('ai_models', seed_ai_models),
+        ('modes', seed_modes),
+    ]
+    for table, seed in seeders:
+        if tables is None or table in tables:
+            seed()
 
 
 def shutdown_session(exception=None):
@@ -0,0 +1,123 @@
+"""
+MekanAI - Single-Flight Generations
+One row per in-flight generation, keyed by the hash of its canonical
+parameters. The first request to insert the key renders; identical requests
+from any worker process find the row and wait for the published result.
+
+States: running → done (content_hash + small result JSON); a leader that
+fails deletes its row so a waiting request takes over. The image itself is
+only referenced: it lives in the blob store (models/image_store.py). Done
+rows stay attachable for a short grace period, then are purged together with
+blobs that no image row references.
+"""
+import json
+import time
+from sqlalchemy import Column, String, Float, Text, text
+from .base import Base, engine, write_transaction
+from .image import release_blobs
+
+# ============================================
+# MODEL
+# ============================================
+class Flight(Base):
+    """In-flight (or just finished) generation shared by identical requests"""
+    __tablename__ = "flights"
+
+    key = Column(String(64), primary_key=True)             # sha256 of canonical params
+    job_id = Column(String(64), nullable=False)            # leader's job id
+    state = Column(String(20), nullable=False)
+    content_hash = Column(String(64))                      # rendered image → blob store (done)
+    result = Column(Text)                                  # JSON: seed, saved image ref, ... (no image data)
+    created_at = Column(Float, nullable=False)             # epoch seconds
+    finished_at = Column(Float)
+
+
+# ============================================
+# CRUD
+# ============================================
+# Insert wins atomically on SQLite and PostgreSQL alike; losers attach
+_CLAIM_SQL = text("""
+    INSERT INTO flights (key, job_id, state, created_at)
+    VALUES (:key, :job_id, 'running', :now)
+    ON CONFLICT (key) DO NOTHING
+""")
+
+_EXPIRED = """
+    (state != 'running' AND finished_at < :finished_before)
+    OR (state = 'running' AND created_at < :stale_before)
+"""
+
+
+
+def _purge_expired(conn, grace, stale_after):
+    """Delete expired rows; returns the content hashes they referenced"""
+    now = time.time()
+    expired = {'finished_before': now - grace, 'stale_before': now - stale_after}
+    hashes = [h for (h,) in conn.execute(
+        text(f"SELECT content_hash FROM flights WHERE content_hash IS NOT NULL AND ({_EXPIRED})"), expired)]
+    conn.execute(text(f"DELETE FROM flights WHERE {_EXPIRED}"), expired)
+    return hashes
+
+
+@write_transaction
+def claim(key, job_id, grace, stale_after):
+    """Become the leader for `key`. Returns None if claimed, else the leader's job id."""
+    with engine.begin() as conn:
+        hashes = _purge_expired(conn, grace, stale_after)
+        claimed = conn.execute(_CLAIM_SQL, {'key': key, 'job_id': job_id, 'now': time.time()}).rowcount == 1
+        leader = None if claimed else conn.execute(
+            text("SELECT job_id FROM flights WHERE key = :key"), {'key': key}).scalar()
+    if hashes:
+        release_blobs(hashes)       # blobs of purged flights never saved into a project
+    return None if claimed else leader or ''
+
+
+@write_transaction
+def purge(grace, stale_after):
+    """Drop expired flights without a new claim (idle periods); returns rows purged"""
+    now = time.time()
+    with engine.connect() as conn:
+        count = conn.execute(text(f"SELECT COUNT(*) FROM flights WHERE {_EXPIRED}"),
+                             {'finished_before': now - grace, 'stale_before': now - stale_after}).scalar()
+    if not count:
+        return 0
+    with engine.begin() as conn:
+        hashes = _purge_expired(conn, grace, stale_after)
+    if hashes:
+        release_blobs(hashes)
+    return count
+
+
+@write_transaction
+def publish(key, job_id, content_hash, result):
+    """Leader finished: `content_hash` is the stored image, `result` the rest of the response"""
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE flights SET state = 'done', content_hash = :hash, result = :result, "
+                          "finished_at = :now WHERE key = :key AND job_id = :job_id"),
+                     {'key': key, 'job_id': job_id, 'hash': content_hash, 'result': json.dumps(result),
+                      'now': time.time()})
+
+
+@write_transaction
+def fail(key, job_id):
+    """Leader gave up (error / cancel): drop the row so a waiting request can take over"""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM flights WHERE key = :key AND job_id = :job_id AND state = 'running'"),
+                     {'key': key, 'job_id': job_id})
+
+
+def get_state(key):
+    """(state, job_id) of the flight, or (None, None) once it is gone"""
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT state, job_id FROM flights WHERE key = :key"), {'key': key}).fetchone()
+    return (row.state, row.job_id) if row else (None, None)
+
+
+def get_result(key):
+    """Published result with its content_hash, or None"""
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT content_hash, result FROM flights WHERE key = :key AND state = 'done'"),
+                           {'key': key}).fetchone()
+    if not row or not row.content_hash:
+        return None
+    return dict(json.loads(row.result or '{}'), content_hash=row.content_hash)
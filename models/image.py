@@ -3,9 +3,11 @@ MekanAI - Image Model & CRUD
 """
 import json
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func
+from pathlib import Path
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, func, text
 from sqlalchemy.orm import relationship, backref
-from .base import Base, db_session
+from .base import Base, JSONText, db_session, engine, write_transaction
+from . import image_store
 
 # ============================================
 # MODEL
@@ -18,7 +20,8 @@ class Image(Base):
     project_id = Column(Integer, ForeignKey('projects.id', ondelete='CASCADE'), nullable=False)
     parent_id = Column(Integer, ForeignKey('images.id', ondelete='SET NULL'), nullable=True, index=True)
     filename = Column(String(300), nullable=False)
-    settings = Column(Text, default='{}')
+    content_hash = Column(String(64), nullable=True, index=True)   # sha256 → models/image_store blob
+    settings = Column(JSONText, default='{}')
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -38,6 +41,7 @@ class Image(Base):
             'project_id': self.project_id,
             'parent_id': self.parent_id,
             'filename': self.filename,
+            'content_hash': self.content_hash,
             'settings': settings,
             'child_count': len(self.children) if self.children else 0,
             'created_at': str(self.created_at) if self.created_at else None,
@@ -86,14 +90,17 @@ def get_latest_by_project(project_id):
     return row.to_dict() if row else None
 
 
-def create(project_id, filename, settings=None, parent_id=None):
+@write_transaction
+def create(project_id, filename, settings=None, parent_id=None, content_hash=None):
     settings_json = json.dumps(settings or {}, ensure_ascii=False)
-    image = Image(project_id=project_id, filename=filename, settings=settings_json, parent_id=parent_id)
+    image = Image(project_id=project_id, filename=filename, settings=settings_json,
+                  parent_id=parent_id, content_hash=content_hash)
     db_session.add(image)
     db_session.commit()
     return image.to_dict()
 
 
+@write_transaction
 def update_settings(image_id, settings):
     image = db_session.query(Image).get(image_id)
     if not image:
@@ -104,13 +111,16 @@ def update_settings(image_id, settings):
     return image.to_dict()
 
 
+@write_transaction
 def delete(image_id):
     image = db_session.query(Image).get(image_id)
     if not image:
         return False
+    content_hash = image.content_hash
     _delete_file(image.project_id, image.filename)
     db_session.delete(image)
     db_session.commit()
+    release_blobs([content_hash])
     return True
 
 
@@ -122,15 +132,60 @@ def delete_multiple(image_ids):
     return deleted
 
 
+@write_transaction
 def delete_by_project(project_id):
+    hashes = [h for (h,) in db_session.query(Image.content_hash)
+              .filter(Image.project_id == project_id, Image.content_hash.isnot(None)).distinct()]
     db_session.query(Image).filter(Image.project_id == project_id).delete()
     db_session.commit()
+    release_blobs(hashes)
     return True
 
 
 # ============================================
 # FILESYSTEM
 # ============================================
+@write_transaction
+def add_to_project(project_id, content_hash, stem, ext, settings=None, parent_id=None, folder=None):
+    """Link a stored blob into the project folder under a collision-free name
+    and create its images row. Returns the image dict (None if no project).
+
+    Link and row are one step under the blob store lock, so release_blobs()
+    never sees the link without the row.
+    """
+    from .project import get_project_path
+    folder = folder or get_project_path(project_id)
+    if not folder:
+        return None
+    with image_store.lock():
+        filename = image_store.link_unique(content_hash, folder, stem, ext)
+        try:
+            return create(project_id=project_id, filename=filename, settings=settings,
+                          parent_id=parent_id, content_hash=content_hash)
+        except BaseException:
+            (Path(folder) / filename).unlink(missing_ok=True)
+            raise
+
+
+_REFERENCED_SQL = text("""
+    SELECT 1 FROM images WHERE content_hash = :hash
+    UNION ALL
+    SELECT 1 FROM flights WHERE content_hash = :hash
+""")
+
+
+def release_blobs(hashes):
+    """Remove blobs no images / flights row references any more.
+
+    Call after the delete committed; the check and the removal run under the
+    blob store lock, like add_to_project's link and insert.
+    """
+    with image_store.lock(), engine.connect() as conn:
+        for content_hash in set(filter(None, hashes)):
+            if conn.execute(_REFERENCED_SQL, {'hash': content_hash}).first() is None:
+                image_store.remove(content_hash)
+
+
 def _delete_file(project_id, filename):
     from .project import get_project_path
     folder = get_project_path(project_id)
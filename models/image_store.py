@@ -0,0 +1,263 @@
+"""
+MekanAI - Content-Addressed Image Store
+
+Every image file is stored once under its SHA-256:
+
+    data/blobs/ab/cd/abcd1234...      (2-level hash-sharded directories)
+
+Project folders hold hardlinks (copy fallback across devices) to these blobs, so existing
+URLs /projects/<id>/images/<filename> keep working. `images.content_hash`
+references the blob; a blob is removed when no images row points at it.
+
+Saving (link + images row) and releasing (reference check + remove) run under
+lock(), shared by every worker process, so a release never lands between a
+save's link and its row. A removed blob sits in `.trash` for TRASH_GRACE
+seconds: a save whose put_* deduplicated against it just before gets it back.
+"""
+import base64
+import errno
+import hashlib
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from uuid import uuid4
+from config import config
+
+CHUNK_SIZE = 1024 * 1024
+TRASH_GRACE = 600           # s a removed blob can still be restored
+
+_lock = threading.RLock()
+_held = threading.local()
+
+
+def _root():
+    p = Path(config.get('paths.blobs', 'data/blobs'))
+    p.mkdir(parents=True, exist_ok=True)
+    return p
+
+
+def blob_path(content_hash):
+    """Sharded path for a content hash (file may not exist)"""
+    return _root() / content_hash[:2] / content_hash[2:4] / content_hash
+
+
+def exists(content_hash):
+    return bool(content_hash) and blob_path(content_hash).exists()
+
+
+@contextmanager
+def lock():
+    """Store-wide lock across threads and worker processes (re-entrant per thread)"""
+    from .base import _file_lock        # not at import: CPU pool workers use put_image without the DB
+    with _lock:
+        depth = getattr(_held, 'depth', 0)
+        _held.depth = depth + 1
+        try:
+            if depth:
+                yield
+            else:
+                with _file_lock(_root() / '.lock'):
+                    yield
+        finally:
+            _held.depth = depth
+
+
+# ============================================
+# WRITE
+# ============================================
+def put_chunks(chunks):
+    """Store an iterable of byte chunks, hashing while writing.
+
+    Only one chunk is in memory at a time, so 8K renders / upscales never
+    exist as a full bytes object (or base64 string) in the process.
+    Returns the content hash.
+    """
+    tmp = _root() / f".tmp-{uuid4().hex}"
+    digest = hashlib.sha256()
+    try:
+        with open(tmp, 'wb') as f:
+            for chunk in chunks:
+                if chunk:
+                    digest.update(chunk)
+                    f.write(chunk)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return _commit_tmp(tmp, digest.hexdigest())
+
+
+def put_stream(stream):
+    """Store a binary file-like stream. Returns the content hash."""
+    return put_chunks(iter(lambda: stream.read(CHUNK_SIZE), b''))
+
+
+def put_response(response):
+    """Store the body of a `requests` response opened with stream=True"""
+    return put_chunks(response.iter_content(CHUNK_SIZE))
+
+
+def put_bytes(data):
+    """Store raw bytes. Returns the content hash."""
+    content_hash = hashlib.sha256(data).hexdigest()
+    if exists(content_hash):
+        return content_hash
+    tmp = _root() / f".tmp-{uuid4().hex}"
+    tmp.write_bytes(data)
+    return _commit_tmp(tmp, content_hash)
+
+
+def put_base64(image_base64):
+    """Store a base64-encoded image. Returns the content hash."""
+    return put_bytes(base64.b64decode(image_base64))
+
+
+class _HashingWriter:
+    """File wrapper that hashes everything written through it"""
+
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+def put_image(image, format='PNG'):
+    """Encode a PIL image straight into the store (no intermediate bytes)"""
+    tmp = _root() / f".tmp-{uuid4().hex}"
+    try:
+        with open(tmp, 'wb') as f:
+            writer = _HashingWriter(f)
+            image.save(writer, format=format)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return _commit_tmp(tmp, writer.digest.hexdigest())
+
+
+def _commit_tmp(tmp, content_hash):
+    """Move a fully written temp file into place (dedup if already stored)"""
+    dest = blob_path(content_hash)
+    if dest.exists():
+        tmp.unlink()
+        return content_hash
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp, dest)
+    return content_hash
+
+
+# ============================================
+# READ
+# ============================================
+def get_base64(content_hash):
+    """Base64 of a stored blob (None if it is gone)"""
+    path = blob_path(content_hash)
+    if not path.exists():
+        with lock():
+            if not _restore(content_hash):
+                return None
+    try:
+        return base64.b64encode(path.read_bytes()).decode('ascii')
+    except FileNotFoundError:
+        return None
+
+
+# ============================================
+# PROJECT VIEWS
+# ============================================
+# Hardlink impossible here (other filesystem, link limit, no hardlink support) → copy
+_COPY_ERRNOS = {errno.EXDEV, errno.EMLINK, errno.EPERM, errno.EOPNOTSUPP}
+_NAME_ATTEMPTS = 20
+
+
+def link_unique(content_hash, folder, stem, ext):
+    """Expose a blob in `folder` under a free name and return that name.
+
+    Tries `stem.ext`, then `stem_<hash8>.ext`, then random suffixes. Each name is
+    claimed by creating it exclusively (os.link / O_EXCL copy), so concurrent
+    saves with the same stem get different names and an existing file — which
+    may be a hardlink to another blob — is never written through. Call under
+    lock() together with creating the images row.
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    src = blob_path(content_hash)
+    if not src.exists() and not _restore(content_hash):
+        raise FileNotFoundError(f"Blob {content_hash} not in the store")
+    candidates = [f"{stem}{ext}", f"{stem}_{content_hash[:8]}{ext}"]
+    candidates += [f"{stem}_{content_hash[:8]}_{uuid4().hex[:6]}{ext}" for _ in range(_NAME_ATTEMPTS)]
+    for name in candidates:
+        try:
+            _link_exclusive(src, folder / name)
+            return name
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No free filename for {stem}{ext} in {folder}")
+
+
+def _link_exclusive(src, dest):
+    try:
+        os.link(src, dest)
+        return
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno not in _COPY_ERRNOS:
+            raise
+    with open(src, 'rb') as fsrc, open(dest, 'xb') as fdst:      # 'x' = O_CREAT | O_EXCL
+        try:
+            shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+        except BaseException:
+            fdst.close()
+            os.unlink(dest)
+            raise
+
+
+# ============================================
+# REMOVAL
+# ============================================
+def _trash():
+    p = _root() / '.trash'
+    p.mkdir(exist_ok=True)
+    return p
+
+
+def remove(content_hash):
+    """Retire a blob to the trash (caller holds lock() and checked that nothing references it)"""
+    try:
+        os.replace(blob_path(content_hash), _trash() / f"{content_hash}.{time.time():.0f}")
+    except FileNotFoundError:
+        return False
+    empty_trash()
+    return True
+
+
+def _restore(content_hash):
+    """Move a trashed blob back (caller holds lock()). Returns False if it is gone for good."""
+    retired = sorted(_trash().glob(f"{content_hash}.*"))
+    if not retired:
+        return False
+    dest = blob_path(content_hash)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(retired[-1], dest)
+    for path in retired[:-1]:
+        path.unlink(missing_ok=True)
+    return True
+
+
+def empty_trash(grace=TRASH_GRACE):
+    """Delete blobs retired more than `grace` seconds ago"""
+    before = time.time() - grace
+    for path in _trash().iterdir():
+        try:
+            if float(path.suffix[1:]) < before:
+                path.unlink()
+        except (ValueError, OSError):
+            continue
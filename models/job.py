@@ -0,0 +1,259 @@
+"""
+MekanAI - Generation Jobs
+Shared job table for local GPU backends (SD WebUI, ComfyUI): admission
+slots per backend, cancellation requests and backend handles, visible to
+every worker process. Which queued job gets a free slot is decided by the
+caller's picker (priority classes + fair share, see api/jobs.py).
+Coalesced requests waiting on another request's render are registered as
+running jobs on the pseudo-backend `coalesce` so they can be cancelled too.
+
+States: queued → running → done | failed | cancelled
+        queued/running with a stale heartbeat → abandoned (worker died)
+"""
+import time
+from sqlalchemy import Column, String, Integer, Float, Boolean, text, bindparam
+from sqlalchemy.exc import IntegrityError
+from .base import Base, engine, write_transaction
+
+ACTIVE_STATES = ('queued', 'running')
+
+# ============================================
+# MODEL
+# ============================================
+class Job(Base):
+    """One generation / upscale request on a local backend"""
+    __tablename__ = "jobs"
+
+    id = Column(String(64), primary_key=True)
+    backend = Column(String(50), nullable=False, index=True)   # local | comfyui | coalesce
+    kind = Column(String(20), nullable=False)                  # generate | upscale
+    state = Column(String(20), nullable=False, index=True)
+    priority = Column(String(20), nullable=False, default='normal')   # interactive | normal | batch
+    tenant = Column(String(100))                               # fair-share key (project:<id> / ip:<addr>)
+    project_id = Column(Integer)
+    owner = Column(String(100))                                # host:pid of the waiting worker
+    handle = Column(String(100))                               # backend job id (ComfyUI prompt_id)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(Float, nullable=False)                 # epoch seconds
+    started_at = Column(Float)
+    finished_at = Column(Float)
+    heartbeat = Column(Float, nullable=False)
+
+
+def _row_dict(row):
+    return {
+        'id': row.id,
+        'backend': row.backend,
+        'kind': row.kind,
+        'state': row.state,
+        'priority': row.priority,
+        'tenant': row.tenant,
+        'project_id': row.project_id,
+        'handle': row.handle,
+        'cancel_requested': bool(row.cancel_requested),
+        'created_at': row.created_at,
+        'started_at': row.started_at,
+    }
+
+
+# ============================================
+# CRUD
+# ============================================
+# PostgreSQL (READ COMMITTED) would let two transactions both see a free slot
+# in _START_SQL's COUNT; a per-backend advisory lock held until commit
+# serializes the slot check. SQLite serializes it with the database write lock.
+SLOT_LOCK_NAMESPACE = 0x4A4F4253   # "JOBS"
+_SLOT_LOCK_SQL = text("SELECT pg_advisory_xact_lock(:ns, hashtext(:backend))")
+
+# Claim a slot for the picked job if one is free, in one UPDATE
+_START_SQL = text("""
+    UPDATE jobs SET state = 'running', started_at = :now, heartbeat = :now
+    WHERE id = :id AND state = 'queued' AND cancel_requested = :false
+      AND (SELECT COUNT(*) FROM jobs WHERE backend = :backend AND state = 'running') < :slots
+""")
+
+_QUEUED_SQL = text("""
+    SELECT id, priority, tenant, created_at FROM jobs
+    WHERE backend = :backend AND state = 'queued' AND cancel_requested = :false
+    ORDER BY created_at, id
+""")
+
+_SERVED_SQL = text("""
+    SELECT priority, tenant, COUNT(*) AS served FROM jobs
+    WHERE backend = :backend AND started_at >= :since
+    GROUP BY priority, tenant
+""")
+
+_RUNNING_SQL = text("SELECT COUNT(*) FROM jobs WHERE backend = :backend AND state = 'running'")
+
+_REAP_SQL = text("""
+    UPDATE jobs SET state = 'abandoned', finished_at = :now
+    WHERE state IN ('queued', 'running') AND heartbeat < :stale_before
+""")
+
+
+@write_transaction
+def enqueue(job_id, backend, kind, project_id=None, owner=None, priority='normal', tenant=None, state='queued'):
+    """Insert the job row. Returns False if the id is already taken."""
+    now = time.time()
+    try:
+        with engine.begin() as conn:
+            conn.execute(Job.__table__.insert(), {
+                'id': job_id, 'backend': backend, 'kind': kind, 'state': state,
+                'priority': priority, 'tenant': tenant,
+                'project_id': project_id, 'owner': owner, 'cancel_requested': False,
+                'created_at': now, 'started_at': now if state == 'running' else None, 'heartbeat': now,
+            })
+    except IntegrityError:
+        return False
+    return True
+
+
+def try_start(job_id, backend, slots, pick, window):
+    """Move a queued job to running if the picker chooses it and a slot is free.
+
+    pick(queued_rows, served) → job id, where served maps
+    (priority, tenant) → jobs started on this backend in the last `window` s.
+    Waiting requests poll this: the pick and the free-slot check are reads,
+    the write transaction is only taken when this job may start.
+    """
+    now = time.time()
+    with engine.connect() as conn:
+        queued = conn.execute(_QUEUED_SQL, {'backend': backend, 'false': False}).fetchall()
+        if not queued:
+            return False
+        served = {(row.priority, row.tenant): row.served for row in
+                  conn.execute(_SERVED_SQL, {'backend': backend, 'since': now - window})}
+        if pick(queued, served) != job_id:
+            return False
+        if conn.execute(_RUNNING_SQL, {'backend': backend}).scalar() >= slots:
+            return False
+    return _start(job_id, backend, slots)
+
+
+@write_transaction
+def _start(job_id, backend, slots):
+    """Claim the slot (the UPDATE re-checks it under the write / advisory lock)"""
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(_SLOT_LOCK_SQL, {'ns': SLOT_LOCK_NAMESPACE, 'backend': backend})
+        return conn.execute(_START_SQL, {
+            'id': job_id, 'backend': backend, 'slots': slots, 'now': time.time(), 'false': False,
+        }).rowcount == 1
+
+
+@write_transaction
+def reap(stale_after):
+    """Mark queued / running jobs whose worker stopped heartbeating as abandoned"""
+    now = time.time()
+    with engine.begin() as conn:
+        conn.execute(_REAP_SQL, {'now': now, 'stale_before': now - stale_after})
+
+
+@write_transaction
+def set_handle(job_id, handle):
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE jobs SET handle = :handle WHERE id = :id"),
+                     {'id': job_id, 'handle': handle})
+
+
+@write_transaction
+def finish(job_id, state):
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE jobs SET state = :state, finished_at = :now WHERE id = :id"),
+                     {'id': job_id, 'state': state, 'now': time.time()})
+
+
+@write_transaction
+def delete(job_id):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM jobs WHERE id = :id"), {'id': job_id})
+
+
+@write_transaction
+def request_cancel(job_id):
+    """Flag an active job for cancellation. Returns its row (before the flag) or None."""
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT * FROM jobs WHERE id = :id"), {'id': job_id}).fetchone()
+        if not row or row.state not in ACTIVE_STATES:
+            return None
+        conn.execute(text("UPDATE jobs SET cancel_requested = :true WHERE id = :id"),
+                     {'id': job_id, 'true': True})
+    return _row_dict(row)
+
+
+@write_transaction
+def heartbeat(job_ids):
+    """Refresh heartbeats; returns the ids among them with a pending cancel request"""
+    if not job_ids:
+        return set()
+    ids = bindparam('ids', expanding=True)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE jobs SET heartbeat = :now WHERE id IN :ids").bindparams(ids),
+                     {'now': time.time(), 'ids': list(job_ids)})
+        rows = conn.execute(text("SELECT id FROM jobs WHERE id IN :ids AND cancel_requested = :true")
+                            .bindparams(ids), {'ids': list(job_ids), 'true': True}).fetchall()
+    return {row.id for row in rows}
+
+
+@write_transaction
+def purge(older_than):
+    """Drop finished rows older than `older_than` seconds"""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM jobs WHERE state NOT IN ('queued', 'running') AND finished_at < :before"),
+                     {'before': time.time() - older_than})
+
+
+def count_queued(backend, priority):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM jobs WHERE backend = :backend AND state = 'queued' "
+                                 "AND priority = :p"), {'backend': backend, 'p': priority}).scalar()
+
+
+def get_stats(window):
+    """Per backend / priority: queue depth, running, and wait times of jobs started in the last `window` s"""
+    now = time.time()
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT backend, priority, state, created_at, started_at FROM jobs
+            WHERE state IN ('queued', 'running') OR started_at >= :since
+        """), {'since': now - window}).fetchall()
+    stats = {}
+    for row in rows:
+        entry = stats.setdefault(row.backend, {}).setdefault(row.priority, {
+            'queued': 0, 'running': 0, 'oldest_wait': 0.0, 'waits': [],
+        })
+        if row.state == 'queued':
+            entry['queued'] += 1
+            entry['oldest_wait'] = max(entry['oldest_wait'], now - row.created_at)
+        elif row.state == 'running':
+            entry['running'] += 1
+        if row.started_at and row.started_at >= now - window:
+            entry['waits'].append(row.started_at - row.created_at)
+    for per_backend in stats.values():
+        for entry in per_backend.values():
+            waits = sorted(entry.pop('waits'))
+            entry['started'] = len(waits)
+            entry['avg_wait'] = round(sum(waits) / len(waits), 2) if waits else 0.0
+            entry['p95_wait'] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2) if waits else 0.0
+            entry['oldest_wait'] = round(entry['oldest_wait'], 2)
+    return stats
+
+
+def cancel_requested(job_id):
+    with engine.connect() as conn:
+        return bool(conn.execute(text("SELECT cancel_requested FROM jobs WHERE id = :id"),
+                                 {'id': job_id}).scalar())
+
+
+def get_by_id(job_id):
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT * FROM jobs WHERE id = :id"), {'id': job_id}).fetchone()
+    return _row_dict(row) if row else None
+
+
+def get_active():
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT * FROM jobs WHERE state IN ('queued', 'running') "
+                                 "ORDER BY created_at")).fetchall()
+    return [_row_dict(row) for row in rows]
@@ -0,0 +1,293 @@
+"""
+MekanAI - Versioned Schema Migrations
+
+Each migration is an ordered, idempotent step recorded in `schema_version`.
+Startup only reads the current version; pending steps run once and are stamped.
+Raw SQL sticks to portable syntax with bound parameters (SQLite + PostgreSQL).
+
+    Fresh install   → create_all + seed, stamp latest version
+    Legacy database → (tables exist, no schema_version) run every step, stamp;
+                      tables created by m001 are seeded like a fresh install
+    Up to date      → single SELECT, nothing else
+"""
+import json
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, inspect, select, text
+from .base import Base, engine, seed_tables
+
+# ============================================
+# MODEL
+# ============================================
+class SchemaVersion(Base):
+    """Applied migration log (one row per migration)"""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ============================================
+# MIGRATIONS
+# ============================================
+def _m001_initial_schema(conn):
+    """Create any missing tables (no-op for existing ones); returns the created ones for seeding"""
+    existing = set(inspect(conn).get_table_names())
+    Base.metadata.create_all(bind=conn)
+    return set(Base.metadata.tables) - existing
+
+
+def _m002_images_parent_id(conn):
+    columns = [c['name'] for c in inspect(conn).get_columns('images')]
+    if 'parent_id' not in columns:
+        conn.execute(text("ALTER TABLE images ADD COLUMN parent_id INTEGER REFERENCES images(id) ON DELETE SET NULL"))
+        print("[+] Migration: images.parent_id added")
+
+
+def _m003_provider_urls_and_api_key(conn):
+    columns = [c['name'] for c in inspect(conn).get_columns('ai_providers')]
+    if 'api_key_field' in columns and 'api_key' not in columns:
+        conn.execute(text("ALTER TABLE ai_providers RENAME COLUMN api_key_field TO api_key"))
+        print("[+] Migration: ai_providers.api_key_field → api_key")
+
+    for pkey, purl in [
+        ('local', 'http://192.168.1.195:7860'),
+        ('gemini', 'https://generativelanguage.googleapis.com/v1beta'),
+        ('openai', 'https://api.openai.com/v1'),
+        ('stability', 'https://api.stability.ai/v2beta'),
+        ('grok', 'https://api.x.ai/v1'),
+    ]:
+        result = conn.execute(text(
+            "UPDATE ai_providers SET base_url=:u WHERE key=:k AND (base_url IS NULL OR base_url='')"
+        ), {"u": purl, "k": pkey})
+        if result.rowcount:
+            print(f"[+] Migration: {pkey} provider base_url set")
+
+
+def _m004_ai_models_api_model_id(conn):
+    columns = [c['name'] for c in inspect(conn).get_columns('ai_models')]
+    if 'api_model_id' not in columns:
+        conn.execute(text("ALTER TABLE ai_models ADD COLUMN api_model_id VARCHAR(100)"))
+        print("[+] Migration: ai_models.api_model_id added")
+
+    # Insert Gemini models if not present
+    exists = conn.execute(text("SELECT id FROM ai_models WHERE key='gemini_flash_image'")).fetchone()
+    gemini_pid = conn.execute(text("SELECT id FROM ai_providers WHERE key='gemini'")).fetchone()
+    if not exists and gemini_pid:
+        pid = gemini_pid[0]
+        conn.execute(text(
+            "INSERT INTO ai_models (name,key,provider_id,type,api_model_id,description,capabilities,max_resolution,icon,enabled,sort_order) "
+            "VALUES ('Gemini 2.5 Flash Image','gemini_flash_image',:pid,'cloud_api','gemini-2.5-flash-image',"
+            "'Nano Banana — hızlı, ucuz, metin+görsel mixed üretim (~$0.04/görsel)','[\"txt2img\"]',2048,'gemini',:enabled,52)"
+        ), {"pid": pid, "enabled": True})
+        conn.execute(text(
+            "INSERT INTO ai_models (name,key,provider_id,type,api_model_id,description,capabilities,max_resolution,icon,enabled,sort_order) "
+            "VALUES ('Imagen 4 Fast','imagen4_fast',:pid,'cloud_api','imagen-4.0-fast-generate-001',"
+            "'Google Imagen 4 Fast — en ucuz, hızlı text-to-image ($0.02/görsel)','[\"txt2img\"]',2048,'gemini',:enabled,53)"
+        ), {"pid": pid, "enabled": True})
+        print("[+] Migration: Gemini models inserted")
+
+    # Set api_model_id for existing cloud models (DALL-E 3, Stability)
+    for mkey, mid in [
+        ('dalle3', 'dall-e-3'),
+        ('stability_sdxl', 'stable-image-core'),
+    ]:
+        result = conn.execute(text(
+            "UPDATE ai_models SET api_model_id=:m WHERE key=:k AND (api_model_id IS NULL OR api_model_id='')"
+        ), {"m": mid, "k": mkey})
+        if result.rowcount:
+            print(f"[+] Migration: {mkey} api_model_id set to {mid}")
+
+
+def _m005_comfyui_provider(conn):
+    if conn.execute(text("SELECT id FROM ai_providers WHERE key='comfyui'")).fetchone():
+        return
+    conn.execute(text(
+        "INSERT INTO ai_providers (name,key,type,base_url,description,icon,enabled,sort_order) "
+        "VALUES ('ComfyUI','comfyui','local','http://localhost:8188',"
+        "'ComfyUI — Node tabanlı, gelişmiş workflow desteği','comfyui',:enabled,2)"
+    ), {"enabled": False})
+    print("[+] Migration: ComfyUI provider inserted")
+
+    pid = conn.execute(text("SELECT id FROM ai_providers WHERE key='comfyui'")).fetchone()[0]
+    conn.execute(text(
+        "INSERT INTO ai_models (name,key,provider_id,type,api_model_id,description,capabilities,"
+        "default_steps,default_cfg_scale,default_sampler,max_resolution,icon,enabled,sort_order) "
+        "VALUES ('FLUX.1 Dev','flux_dev',:pid,'checkpoint','flux1-dev',"
+        "'FLUX.1 Dev — yüksek kalite, detaylı, yaratıcı çıktı (ComfyUI)',"
+        "'[\"txt2img\",\"img2img\"]',20,1.0,'Euler',2048,'flux',:enabled,13)"
+    ), {"pid": pid, "enabled": True})
+    conn.execute(text(
+        "INSERT INTO ai_models (name,key,provider_id,type,api_model_id,description,capabilities,"
+        "default_steps,default_cfg_scale,default_sampler,max_resolution,icon,enabled,sort_order) "
+        "VALUES ('SD3.5 Large Turbo','sd35_large_turbo',:pid,'checkpoint','sd3.5_large_turbo',"
+        "'SD 3.5 Large Turbo — hızlı, yüksek kalite (4-8 step, ComfyUI)',"
+        "'[\"txt2img\",\"img2img\"]',4,1.0,'Euler',1536,'sd35',:enabled,14)"
+    ), {"pid": pid, "enabled": True})
+    print("[+] Migration: ComfyUI models inserted")
+
+
+def _m006_images_content_hash(conn):
+    columns = [c['name'] for c in inspect(conn).get_columns('images')]
+    if 'content_hash' not in columns:
+        conn.execute(text("ALTER TABLE images ADD COLUMN content_hash VARCHAR(64)"))
+        print("[+] Migration: images.content_hash added")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_images_content_hash ON images (content_hash)"))
+
+
+# Default cloud limits (requests/min, burst) — mirrors providers_seed.json
+_DEFAULT_RATE_LIMITS = {
+    'openai': (5, 2),
+    'stability': (150, 10),
+    'gemini': (10, 3),
+    'grok': (5, 2),
+}
+
+
+def _m007_provider_rate_limits(conn):
+    from .rate_limit import RateBucket
+    columns = [c['name'] for c in inspect(conn).get_columns('ai_providers')]
+    for col in ('rate_limit', 'rate_burst'):
+        if col not in columns:
+            conn.execute(text(f"ALTER TABLE ai_providers ADD COLUMN {col} INTEGER"))
+            print(f"[+] Migration: ai_providers.{col} added")
+    for pkey, (rate, burst) in _DEFAULT_RATE_LIMITS.items():
+        conn.execute(text(
+            "UPDATE ai_providers SET rate_limit=:r, rate_burst=:b WHERE key=:k AND rate_limit IS NULL"
+        ), {"r": rate, "b": burst, "k": pkey})
+    RateBucket.__table__.create(bind=conn, checkfirst=True)
+
+
+def _m008_cpu_upscaler(conn):
+    if conn.execute(text("SELECT id FROM ai_providers WHERE key='cpu'")).fetchone():
+        return
+    conn.execute(text(
+        "INSERT INTO ai_providers (name,key,type,description,icon,enabled,sort_order) "
+        "VALUES ('CPU Upscaler','cpu','local',"
+        "'Yerleşik CPU upscale — Lanczos + detay keskinleştirme, GPU gerekmez','cpu',:enabled,3)"
+    ), {"enabled": True})
+    pid = conn.execute(text("SELECT id FROM ai_providers WHERE key='cpu'")).fetchone()[0]
+    conn.execute(text(
+        "INSERT INTO ai_models (name,key,provider_id,type,description,capabilities,scale_factor,icon,enabled,sort_order) "
+        "VALUES ('CPU Lanczos + Keskinleştirme','cpu_lanczos',:pid,'upscaler',"
+        "'Hızlı 2x önizleme — GPU kuyruğu beklemeden CPU''da büyütme','[\"upscale\"]',2,'upscale',:enabled,43)"
+    ), {"pid": pid, "enabled": True})
+    print("[+] Migration: CPU upscaler provider + model inserted")
+
+
+def _m009_jobs(conn):
+    from .job import Job
+    Job.__table__.create(bind=conn, checkfirst=True)
+
+
+def _m010_job_priority(conn):
+    columns = [c['name'] for c in inspect(conn).get_columns('jobs')]
+    if 'priority' not in columns:
+        conn.execute(text("ALTER TABLE jobs ADD COLUMN priority VARCHAR(20) NOT NULL DEFAULT 'normal'"))
+        print("[+] Migration: jobs.priority added")
+    if 'tenant' not in columns:
+        conn.execute(text("ALTER TABLE jobs ADD COLUMN tenant VARCHAR(100)"))
+        print("[+] Migration: jobs.tenant added")
+
+
+PREVIEW_MODELS = ('sdxl_turbo', 'realvisxl', 'satpony_lightning', 'flux_schnell', 'sd35_large_turbo')
+
+
+def _m011_preview_capability(conn):
+    """Mark distilled (Turbo / Lightning / Schnell) checkpoints as preview-capable"""
+    # Through the table object so JSONText converts on PostgreSQL too
+    from .ai_model import AIModel
+    table = AIModel.__table__
+    rows = conn.execute(select(table.c.id, table.c.key, table.c.capabilities)
+                        .where(table.c.key.in_(PREVIEW_MODELS))).fetchall()
+    for row in rows:
+        try:
+            caps = json.loads(row.capabilities or '[]')
+        except (json.JSONDecodeError, TypeError):
+            caps = []
+        if 'preview' in caps:
+            continue
+        conn.execute(table.update().where(table.c.id == row.id)
+                     .values(capabilities=json.dumps(caps + ['preview'])))
+        print(f"[+] Migration: {row.key} marked preview-capable")
+
+
+def _m012_flights(conn):
+    from .flight import Flight
+    Flight.__table__.create(bind=conn, checkfirst=True)
+
+
+def _m013_flights_content_hash(conn):
+    """Flights reference the blob store instead of holding the image payload"""
+    columns = [c['name'] for c in inspect(conn).get_columns('flights')]
+    if 'content_hash' not in columns:
+        conn.execute(text("ALTER TABLE flights ADD COLUMN content_hash VARCHAR(64)"))
+        print("[+] Migration: flights.content_hash added")
+    conn.execute(text("DELETE FROM flights"))       # short-lived rows; old ones carry base64 results
+
+
+# Ordered list — append only, never renumber
+MIGRATIONS = [
+    (1, 'initial schema', _m001_initial_schema),
+    (2, 'images.parent_id', _m002_images_parent_id),
+    (3, 'ai_providers base_url + api_key rename', _m003_provider_urls_and_api_key),
+    (4, 'ai_models.api_model_id + Gemini models', _m004_ai_models_api_model_id),
+    (5, 'ComfyUI provider + models', _m005_comfyui_provider),
+    (6, 'images.content_hash', _m006_images_content_hash),
+    (7, 'ai_providers rate limits + rate_buckets', _m007_provider_rate_limits),
+    (8, 'CPU upscaler provider + model', _m008_cpu_upscaler),
+    (9, 'jobs', _m009_jobs),
+    (10, 'jobs.priority + tenant', _m010_job_priority),
+    (11, 'ai_models preview capability', _m011_preview_capability),
+    (12, 'flights', _m012_flights),
+    (13, 'flights.content_hash', _m013_flights_content_hash),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ============================================
+# RUNNER
+# ============================================
+def get_current_version():
+    """Return applied schema version (None if schema_version table is missing)"""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(SchemaVersion.__tablename__):
+            return None
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def is_fresh_install():
+    """True if the database has no application tables yet"""
+    tables = set(inspect(engine).get_table_names())
+    return not (tables & {'projects', 'images', 'ai_providers', 'ai_models'})
+
+
+def stamp(version, conn):
+    """Record every migration up to `version` as applied"""
+    for num, name, _ in MIGRATIONS:
+        if num <= version:
+            conn.execute(SchemaVersion.__table__.insert(), {
+                'version': num, 'name': name, 'applied_at': datetime.utcnow(),
+            })
+
+
+def run_pending(current):
+    """Run migrations newer than `current`, each in its own transaction.
+
+    Tables a step creates get the fresh-install seed data right after it commits.
+    """
+    applied = 0
+    for num, name, step in MIGRATIONS:
+        if num <= current:
+            continue
+        with engine.begin() as conn:
+            created = step(conn)
+            conn.execute(SchemaVersion.__table__.insert(), {
+                'version': num, 'name': name, 'applied_at': datetime.utcnow(),
+            })
+        print(f"[+] Migration {num:03d} applied: {name}")
+        if created:
+            seed_tables(created)
+        applied += 1
+    return applied
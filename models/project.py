@@ -7,7 +7,7 @@ from datetime import datetime
 from pathlib import Path
 from sqlalchemy import Column, Integer, String, Text, DateTime
 from config import config
-from .base import Base, db_session
+from .base import Base, db_session, write_transaction
 
 # ============================================
 # MODEL
@@ -48,6 +48,7 @@ def get_by_id(project_id):
     return row.to_dict() if row else None
 
 
+@write_transaction
 def create(name, description=''):
     folder_name = _generate_folder_name(name)
     projects_path = _get_projects_path()
@@ -66,6 +67,7 @@ def create(name, description=''):
         raise e
 
 
+@write_transaction
 def update(project_id, name=None, description=None):
     project = db_session.query(Project).get(project_id)
     if not project:
@@ -83,6 +85,7 @@ def update(project_id, name=None, description=None):
         raise
 
 
+@write_transaction
 def delete(project_id, delete_files=True):
     from .image import delete_by_project
     delete_by_project(project_id)
@@ -0,0 +1,76 @@
+"""
+MekanAI - Shared Rate Limit Buckets
+Token bucket per cloud provider, stored in the database so every worker
+thread and process draws from the same budget.
+
+Limits come from the ai_providers row (rate_limit = requests/min,
+rate_burst = bucket size). A 429 with Retry-After blocks the whole bucket
+until that time, so other workers back off too instead of piling on.
+"""
+import time
+from sqlalchemy import Column, String, Float, text
+from .base import Base, engine, write_transaction
+
+# ============================================
+# MODEL
+# ============================================
+class RateBucket(Base):
+    """Token bucket state per provider key"""
+    __tablename__ = "rate_buckets"
+
+    key = Column(String(50), primary_key=True)
+    tokens = Column(Float, nullable=False, default=0)
+    updated_at = Column(Float, nullable=False, default=0)       # epoch seconds
+    blocked_until = Column(Float, nullable=False, default=0)    # epoch seconds (Retry-After)
+
+
+# ============================================
+# CRUD
+# ============================================
+# Single UPDATE = atomic refill + take on SQLite and PostgreSQL alike
+_TAKE_SQL = text("""
+    UPDATE rate_buckets
+    SET tokens = CASE
+            WHEN tokens + (:now - updated_at) * :rate > :burst THEN :burst
+            ELSE tokens + (:now - updated_at) * :rate
+        END - 1,
+        updated_at = :now
+    WHERE key = :key
+      AND blocked_until <= :now
+      AND tokens + (:now - updated_at) * :rate >= 1
+""")
+
+_ENSURE_SQL = text("""
+    INSERT INTO rate_buckets (key, tokens, updated_at, blocked_until)
+    VALUES (:key, :burst, :now, 0)
+    ON CONFLICT (key) DO NOTHING
+""")
+
+
+@write_transaction
+def try_acquire(key, per_minute, burst=None):
+    """Take one token. Returns 0 on success, else seconds to wait before retrying."""
+    rate = per_minute / 60.0
+    burst = float(burst or max(1, per_minute))
+    now = time.time()
+    with engine.begin() as conn:
+        conn.execute(_ENSURE_SQL, {'key': key, 'burst': burst, 'now': now})
+        taken = conn.execute(_TAKE_SQL, {'key': key, 'rate': rate, 'burst': burst, 'now': now}).rowcount
+        if taken:
+            return 0
+        row = conn.execute(text("SELECT tokens, updated_at, blocked_until FROM rate_buckets WHERE key = :key"),
+                           {'key': key}).fetchone()
+    tokens = min(burst, row.tokens + (now - row.updated_at) * rate)
+    wait = max(row.blocked_until - now, (1 - tokens) / rate if tokens < 1 else 0)
+    return max(wait, 0.01)
+
+
+@write_transaction
+def block(key, seconds):
+    """Pause the bucket for everyone (e.g. provider sent Retry-After)"""
+    until = time.time() + seconds
+    with engine.begin() as conn:
+        conn.execute(_ENSURE_SQL, {'key': key, 'burst': 1, 'now': time.time()})
+        conn.execute(text("UPDATE rate_buckets SET blocked_until = :until "
+                          "WHERE key = :key AND blocked_until < :until"),
+                     {'key': key, 'until': until})
@@ -15,6 +15,29 @@ function updateCredits() {
     }
 }
 
+// Generation jobs: cancelled on the server when the page is left
+const activeJobs = new Set();
+
+function startJob(params) {
+    const id = window.crypto?.randomUUID ? crypto.randomUUID()
+        : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    params.job_id = id;
+    activeJobs.add(id);
+    return id;
+}
+
+function finishJob(id) {
+    activeJobs.delete(id);
+}
+
+function cancelJob(id) {
+    activeJobs.delete(id);
+    // keepalive: the request survives page unload
+    fetch(`/api/jobs/${id}`, { method: 'DELETE', keepalive: true }).catch(() => {});
+}
+
+window.addEventListener('pagehide', () => activeJobs.forEach(cancelJob));
+
 // Mobile menu toggle
 function initMobileMenu() {
     const menuBtn = document.getElementById('mobileMenuBtn');
@@ -458,7 +458,7 @@ async function checkSdStatus() {
     const badge = document.getElementById('sdStatus');
     const models = document.getElementById('sdModels');
     try {
-        const res = await fetch('/api/sd-status');
+        const res = await fetch('/api/sd-status?refresh=1');
         const json = await res.json();
         if (json.connected) {
             badge.textContent = 'Bağlı';
@@ -0,0 +1,42 @@
+"""
+Client-chosen ComfyUI workflow templates (api/comfyui_workflows.py) must
+match the requested job kind; uses the templates shipped in data/workflows.
+"""
+import pytest
+
+from api import comfyui_workflows
+
+
+def test_override_of_matching_kind():
+    assert comfyui_workflows.for_kind('txt2img', 'turbo_txt2img').name == 'turbo_txt2img'
+
+
+def test_override_of_other_kind_rejected():
+    with pytest.raises(comfyui_workflows.InvalidWorkflow):
+        comfyui_workflows.for_kind('img2img', 'turbo_txt2img')
+
+
+def test_unknown_override_rejected():
+    with pytest.raises(comfyui_workflows.InvalidWorkflow):
+        comfyui_workflows.choose('no_such_workflow', 'txt2img')
+
+
+def test_controlnet_templates_serve_both_controlnet_kinds():
+    for kind in ('controlnet', 'controlnet_preprocess'):
+        assert comfyui_workflows.for_kind(kind, 'controlnet_preprocess').name == 'controlnet_preprocess'
+
+
+def test_none_param_keeps_template_default():
+    template = comfyui_workflows.WorkflowTemplate('t', {
+        '1': {'class_type': 'CLIPTextEncode', 'inputs': {'text': '{{negative_prompt}}'}},
+    }, kind='txt2img', defaults={'negative_prompt': ''})
+    assert template.instantiate(negative_prompt=None)['1']['inputs']['text'] == ''
+    assert template.instantiate(negative_prompt='blurry')['1']['inputs']['text'] == 'blurry'
+
+
+def test_none_for_required_param_is_missing():
+    template = comfyui_workflows.WorkflowTemplate('t', {
+        '1': {'class_type': 'CLIPTextEncode', 'inputs': {'text': '{{prompt}}'}},
+    }, kind='txt2img')
+    with pytest.raises(ValueError):
+        template.instantiate(prompt=None)
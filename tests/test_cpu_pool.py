@@ -0,0 +1,42 @@
+"""
+CPU pool workers (api/cpu_pool.py) must not build the Flask app.
+
+Each case runs a fresh interpreter whose main module is app.py / wsgi.py, the
+way `python app.py` and `python wsgi.py` start, and asks a pool worker what it
+imported.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARENT = """
+import __main__, json, sys
+__main__.__file__ = sys.argv[1]     # workers re-import the main module from this path
+from api.cpu_pool import get_pool
+from tests.test_cpu_pool import worker_state
+print(json.dumps(get_pool().submit(worker_state).result()))
+"""
+
+
+def worker_state():
+    """Runs inside a pool worker"""
+    main = sys.modules.get('__mp_main__')
+    return {
+        'app_built': hasattr(main, 'app'),
+        'loaded': sorted(name for name in ('app', 'views', 'models.base') if name in sys.modules),
+    }
+
+
+@pytest.mark.parametrize('entry', ['app.py', 'wsgi.py'])
+def test_workers_do_not_initialize_app(entry):
+    proc = subprocess.run([sys.executable, '-c', PARENT, os.path.join(ROOT, entry)],
+                          cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    assert 'initialized' not in proc.stdout
+    state = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert state == {'app_built': False, 'loaded': []}
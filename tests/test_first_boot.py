@@ -0,0 +1,77 @@
+"""
+First boot of several workers against one fresh SQLite file (gunicorn without
+--preload): exactly one of them creates, seeds and stamps the schema. A
+database from before versioned migrations is upgraded to the same seed data.
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKERS = 4
+
+WORKER = """
+import sys, time
+from config import config
+config.set('database.type', 'sqlite')
+config.set('database.path', sys.argv[1])
+from models.base import init_db
+time.sleep(max(0.0, float(sys.argv[2]) - time.time()))     # start together
+init_db()
+"""
+
+
+def test_concurrent_first_boot(tmp_path):
+    from models.migrations import LATEST_VERSION
+
+    db_path = tmp_path / 'mekanai.db'
+    start_at = str(time.time() + 2)
+    procs = [subprocess.Popen([sys.executable, '-c', WORKER, str(db_path), start_at], cwd=ROOT,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+             for _ in range(WORKERS)]
+    outputs = [proc.communicate(timeout=120) for proc in procs]
+
+    for proc, (stdout, stderr) in zip(procs, outputs):
+        assert proc.returncode == 0, stderr
+    assert sum('DB created' in stdout for stdout, _ in outputs) == 1
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*), MAX(version) FROM schema_version").fetchone() == \
+            (LATEST_VERSION, LATEST_VERSION)
+        for table in ('styles', 'ai_providers', 'ai_models'):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] > 0
+        assert conn.execute("SELECT COUNT(*) - COUNT(DISTINCT name) FROM styles").fetchone()[0] == 0
+
+
+# Projects + images as they were before schema_version (no lookup tables yet)
+LEGACY_SCHEMA = """
+CREATE TABLE projects (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(200) NOT NULL,
+    folder_name VARCHAR(200) NOT NULL UNIQUE, description TEXT, created_at DATETIME, updated_at DATETIME);
+CREATE TABLE images (id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE, filename VARCHAR(300) NOT NULL,
+    settings TEXT, created_at DATETIME, updated_at DATETIME);
+INSERT INTO projects (name, folder_name) VALUES ('Eski', 'eski');
+INSERT INTO images (project_id, filename, settings) VALUES (1, 'a.png', '{}');
+"""
+
+
+def test_legacy_database_is_seeded(tmp_path):
+    from models.migrations import LATEST_VERSION
+
+    db_path = tmp_path / 'mekanai.db'
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(LEGACY_SCHEMA)
+    proc = subprocess.run([sys.executable, '-c', WORKER, str(db_path), '0'], cwd=ROOT,
+                          capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    assert 'DB migrated' in proc.stdout
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] == LATEST_VERSION
+        for table in ('styles', 'scenes', 'perspectives', 'lightings', 'ratios', 'ai_providers', 'ai_models', 'modes'):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] > 0, table
+        # Same rows a fresh install gets: every model is linked to its provider
+        assert conn.execute("SELECT COUNT(*) FROM ai_models WHERE provider_id IS NULL").fetchone()[0] == 0
+        assert conn.execute("SELECT filename, parent_id, content_hash FROM images").fetchall() == [('a.png', None, None)]
@@ -0,0 +1,54 @@
+"""
+Circuit breaker half-open trials (api/health.py): a trial that ends without
+an outcome must not leave the backend rejecting traffic forever.
+"""
+from api import health
+
+
+def opened_breaker():
+    breaker = health.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    return breaker
+
+
+def test_single_trial_while_half_open():
+    breaker = opened_breaker()
+    assert breaker.allow(owner='a')
+    assert breaker.state == health.HALF_OPEN
+    assert not breaker.allow(owner='b')
+
+
+def test_released_trial_lets_next_call_through():
+    breaker = opened_breaker()
+    breaker.allow(owner='a')
+    breaker.release('a')
+    assert breaker.state == health.OPEN
+    assert breaker.allow(owner='b')
+
+
+def test_release_after_outcome_is_noop():
+    breaker = opened_breaker()
+    breaker.allow(owner='a')
+    breaker.record_success()
+    breaker.release('a')
+    assert breaker.state == health.CLOSED
+
+
+def test_release_by_other_caller_is_noop():
+    breaker = opened_breaker()
+    breaker.allow(owner='a')
+    breaker.release('b')
+    assert breaker.state == health.HALF_OPEN
+
+
+def test_request_release(monkeypatch):
+    monkeypatch.setattr(health, 'ensure_started', lambda: None)
+    breaker = opened_breaker()
+    monkeypatch.setitem(health._breakers, 'local', breaker)
+    assert health.allow('local')
+    assert not health.allow('local')
+    health.release()                # e.g. QueueTimeout before the backend call
+    assert health.allow('local')
+    health.record('local', {'image_base64': ''})
+    health.release()
+    assert breaker.state == health.CLOSED
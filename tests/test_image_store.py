@@ -0,0 +1,34 @@
+"""
+Blob store removal (models/image_store.py): a blob released between a
+save's put_* and its link comes back from the trash instead of failing.
+"""
+import pytest
+
+import models.image_store as image_store
+from config import config
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setitem(config.config.setdefault('paths', {}), 'blobs', str(tmp_path / 'blobs'))
+    return tmp_path
+
+
+def test_link_restores_released_blob(store):
+    content_hash = image_store.put_bytes(b'render')
+    with image_store.lock():
+        assert image_store.remove(content_hash)
+    assert not image_store.exists(content_hash)
+    name = image_store.link_unique(content_hash, store / 'project', 'gen', '.png')
+    assert (store / 'project' / name).read_bytes() == b'render'
+    assert image_store.exists(content_hash)
+
+
+def test_trash_expires(store):
+    content_hash = image_store.put_bytes(b'render')
+    with image_store.lock():
+        image_store.remove(content_hash)
+    image_store.empty_trash(grace=-1)
+    assert image_store.get_base64(content_hash) is None
+    with pytest.raises(FileNotFoundError):
+        image_store.link_unique(content_hash, store / 'project', 'gen', '.png')
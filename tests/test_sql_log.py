@@ -0,0 +1,55 @@
+"""
+Per-request SQL accounting (api/sql_log.py): the statement log profiling
+reads, and warnings that follow system.log_level (api/diagnostics.py).
+"""
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from api import diagnostics, sql_log
+from config import config
+
+
+@pytest.fixture
+def stats():
+    sql_log._request.stats = sql_log.RequestStats()
+    yield sql_log._request.stats
+    sql_log._request.stats = None
+
+
+@pytest.fixture
+def conn():
+    engine = create_engine('sqlite://')
+    event.listen(engine, 'before_cursor_execute', sql_log._before_cursor)
+    event.listen(engine, 'after_cursor_execute', sql_log._after_cursor)
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
+
+
+def test_statement_log_only_when_asked(stats, conn):
+    conn.execute(text('SELECT 1'))
+    assert stats.count == 1 and stats.queries is None
+    stats.log_queries(2)
+    for _ in range(3):
+        conn.execute(text('SELECT :n'), {'n': 7})
+    assert stats.count == 4
+    assert [q['sql'] for q in stats.queries] == ['SELECT ?', 'SELECT ?']
+    assert stats.queries[0]['params'] == '(7,)'
+
+
+def test_failed_statement_leaves_no_state(stats, conn):
+    with pytest.raises(Exception):
+        conn.execute(text('SELECT * FROM missing_table'))
+    conn.execute(text('SELECT 1'))
+    assert stats.count == 1
+    assert not any('sql_log' in str(key) for key in conn.info)
+
+
+@pytest.mark.parametrize('level, warnings', [('info', True), ('warning', True), ('off', False)])
+def test_warnings_follow_log_level(monkeypatch, capsys, level, warnings):
+    monkeypatch.setitem(config.config['system'], 'log_level', level)
+    diagnostics.warn('slow')
+    diagnostics.note('profiled')
+    out = capsys.readouterr().out
+    assert ('[!] slow' in out) is warnings
+    assert ('[i] profiled' in out) is (level == 'info')
@@ -3,9 +3,11 @@ MekanAI Projects Views
 Page rendering and API endpoints for project management
 """
 from flask import render_template, request, jsonify, send_from_directory, abort
+from pathlib import Path
 from werkzeug.utils import secure_filename
 import models.project as project_model
 import models.image as image_model
+import models.image_store as image_store
 
 ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif'}
 
@@ -119,24 +121,14 @@ def register_routes(bp):
                 skipped.append(f.filename)
                 continue
 
-            filename = secure_filename(f.filename)
-            dest = folder / filename
-            # Aynı isim varsa numaralandır
-            counter = 1
-            stem = dest.stem
-            while dest.exists():
-                dest = folder / f"{stem}_{counter}{dest.suffix}"
-                counter += 1
-
-            f.save(str(dest))
-
-            # DB kaydı oluştur
-            image_model.create(
-                project_id=project_id,
-                filename=dest.name,
-                settings={'source': 'upload'}
+            # İçerik hash'i ile tek kopya sakla, proje klasörüne bağla
+            content_hash = image_store.put_stream(f.stream)
+            stem = Path(secure_filename(f.filename)).stem or 'image'
+            image = image_model.add_to_project(
+                project_id, content_hash, stem, ext,
+                settings={'source': 'upload'}, folder=folder
             )
-            saved.append(dest.name)
+            saved.append(image['filename'])
 
         return jsonify({
             'status': 'success',
@@ -0,0 +1,84 @@
+"""
+MekanAI - Production Server Entry Point
+=======================================
+
+Replaces the Werkzeug dev server (`python app.py`) for real deployments.
+
+    Linux/Mac → gunicorn, `server.workers` processes × `server.threads` threads
+    Windows   → waitress, single process with `server.threads` threads
+
+The app is loaded once in the master (preload) so migrations/seeding run a
+single time; each forked worker then reopens its own DB connections
+(see models.base._reset_after_fork). Without --preload every worker runs
+init_db on boot; models.base.migration_lock() keeps that to one at a time.
+
+Usage:
+    python wsgi.py                   # settings from configs/config.yaml
+    gunicorn wsgi:app --preload -w 4 --threads 8 --timeout 360
+"""
+import importlib.util
+import os
+import sys
+
+from config import config
+
+
+def _server_options():
+    """Read production server settings from config.yaml"""
+    workers = config.get('server.workers', 2)
+    threads = config.get('server.threads', 4)
+    return {
+        'bind': f"{config.get('server.host', '0.0.0.0')}:{config.get('server.port', 5000)}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        # Generation requests block for up to the backend timeout (ComfyUI: 300 s)
+        'timeout': config.get('server.worker_timeout', 360),
+        'graceful_timeout': 30,
+        'preload_app': True,
+    }
+
+
+def serve_gunicorn(options):
+    """Run gunicorn programmatically with options from config.yaml"""
+    from gunicorn.app.base import BaseApplication
+
+    class MekanAIServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    print(f"[*] gunicorn: {options['workers']} workers × {options['threads']} threads on {options['bind']}")
+    MekanAIServer().run()
+
+
+def serve_waitress(options):
+    """Run waitress (Windows / no gunicorn): one process, many threads"""
+    from waitress import serve
+    from app import app
+
+    host, port = options['bind'].rsplit(':', 1)
+    print(f"[*] waitress: {options['threads']} threads on {options['bind']}")
+    serve(app, host=host, port=int(port), threads=options['threads'],
+          channel_timeout=options['timeout'])
+
+
+def main():
+    options = _server_options()
+    if os.name != 'nt' and importlib.util.find_spec('gunicorn'):
+        return serve_gunicorn(options)
+    if importlib.util.find_spec('waitress'):
+        return serve_waitress(options)
+    print("[-] Neither gunicorn nor waitress is installed: pip install -r requirements.txt")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+elif __name__ != '__mp_main__':      # not in CPU pool workers (api/cpu_pool.py)
+    # `gunicorn wsgi:app --preload` / other WSGI servers import the app from here
+    from app import app  # noqa: F401